@@ -0,0 +1,465 @@
+#!/usr/bin/env python
+'''Benchmark of loading and querying a node database for synthetic
+   clusters of increasing size, the time of each phase is measured
+   separately, i.e., parsing, computing partitions and features, both
+   directly and memoized by a NodeClassifier, the
+   inserts into each table, building the indices, and a number of typical
+   read queries; the file size, insert time and query times of the
+   interned property and feature names are compared to those of the
+   former layout with a name per row; results are written as JSON, and
+   can be compared to those of a previous version to detect
+   regressions'''
+
+import json, os, platform, shutil, sqlite3, sys, tempfile, time
+
+from vsc.pbs.utils import compute_features, compute_partition
+from vsc.utils import hostname2rackinfo
+from vsc.pbs.pbsnodes import PbsnodesParser
+from vsc.moab.showq import ShowqParser
+import create_node_db
+from collect_cluster_info import PhaseTimer
+from generate_cluster import ClusterGenerator
+from load_node_db import (NODE_FEATURE_INSERT_CMD, NODE_INSERT_CMD,
+                          NODE_PROPERTY_INSERT_CMD, NODE_STATUS_INSERT_CMD,
+                          RUNNING_JOB_INSERT_CMD, insert_jobs,
+                          insert_node_info_bulk, insert_partitions,
+                          insert_qos_levels, intern_name, nr_used_cores,
+                          read_names)
+from node_classifier import NodeClassifier
+from pbsnodes_jobs import core_ranges
+from pbsnodes_status import status_row
+from summarize_node_db import update_summaries
+
+REGRESSION_ERROR = 1
+
+NR_NODES = [1000, 10000, 100000]
+NR_REPEATS = 20
+TOLERANCE = 0.25
+MIN_DURATION = 0.001
+
+QUERIES = [
+    ('node_by_hostname',
+     '''SELECT n.*, s.*
+            FROM nodes AS n, node_status AS s
+            WHERE n.hostname = 'r1i0n1' AND s.node_id = n.node_id'''),
+    ('nodes_by_partition',
+     '''SELECT n.hostname
+            FROM nodes AS n, partitions AS p
+            WHERE p.partition_name = 'thinking' AND
+                  n.partition_id = p.partition_id'''),
+    ('nodes_by_property',
+     '''SELECT node_id FROM properties WHERE property = 'ivybridge' '''),
+    ('nodes_by_feature',
+     '''SELECT node_id FROM features WHERE feature = 'mem128' '''),
+    ('free_nodes',
+     '''SELECT hostname, np FROM nodes
+            WHERE state = 'free' AND nr_used_cores = 0'''),
+    ('nodes_of_job',
+     '''SELECT DISTINCT n.hostname
+            FROM running_jobs AS r, nodes AS n
+            WHERE r.job_id = (SELECT MAX(job_id) FROM running_jobs) AND
+                  n.node_id = r.node_id'''),
+    ('jobs_on_node',
+     '''SELECT r.job_id, r.first_core, r.nr_cores
+            FROM running_jobs AS r, nodes AS n
+            WHERE n.hostname = 'r1i0n1' AND r.node_id = n.node_id'''),
+    ('partition_summary',
+     '''SELECT * FROM partition_summary'''),
+    ('rack_summary',
+     '''SELECT * FROM rack_summary'''),
+    ('partition_aggregate',
+     '''SELECT partition_id, COUNT(*), SUM(np), SUM(mem)
+            FROM nodes
+            GROUP BY partition_id'''),
+]
+
+NAME_TABLES = ['property_names', 'node_properties', 'properties',
+               'feature_names', 'node_features', 'features']
+
+LEGACY_NAME_DESC = {
+    'properties': {
+        'create':
+            '''CREATE TABLE properties
+                   (property_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    node_id INTEGER NOT NULL,
+                    property TEXT NOT NULL,
+                    UNIQUE (node_id, property))''',
+        'index': [
+            '''CREATE INDEX property_idx
+                   ON properties (node_id, property)'''
+        ],
+    },
+    'features': {
+        'create':
+            '''CREATE TABLE features
+                   (feature_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    node_id INTEGER NOT NULL,
+                    feature TEXT NOT NULL,
+                    UNIQUE(node_id, feature))''',
+        'index': [
+            '''CREATE INDEX feature_idx
+                   ON features(node_id, feature)'''
+        ],
+    },
+}
+
+LEGACY_NAME_INSERT_CMDS = {
+    'property': '''INSERT INTO properties
+                       (node_id, property) VALUES
+                       (?, ?)''',
+    'feature': '''INSERT INTO features
+                      (node_id, feature) VALUES
+                      (?, ?)''',
+}
+
+NAME_INSERT_CMDS = {
+    'property': NODE_PROPERTY_INSERT_CMD,
+    'feature': NODE_FEATURE_INSERT_CMD,
+}
+
+NAME_QUERIES = [
+    ('feature_count',
+     '''SELECT COUNT(*) FROM features WHERE feature = 'mem128' '''),
+    ('property_feature_join',
+     '''SELECT p.node_id
+            FROM properties AS p, features AS f
+            WHERE p.property = 'ivybridge' AND f.feature = 'mem128' AND
+                  p.node_id = f.node_id'''),
+    ('node_names',
+     '''SELECT property FROM properties WHERE node_id = 1'''),
+]
+
+def generate_cluster(templates, nr_nodes, work_dir, job_density, seed):
+    '''generate pbsnodes and showq output for a cluster of nr_nodes nodes
+       in the work directory, returns the names of both files'''
+    generator = ClusterGenerator(templates, nr_nodes, job_density,
+                                 seed=seed)
+    pbsnodes_file_name = os.path.join(work_dir, 'pbsnodes.txt')
+    showq_file_name = os.path.join(work_dir, 'showq.txt')
+    with open(pbsnodes_file_name, 'w') as pbsnodes_file:
+        generator.write_pbsnodes(pbsnodes_file)
+    with open(showq_file_name, 'w') as showq_file:
+        generator.write_showq(showq_file)
+    return pbsnodes_file_name, showq_file_name
+
+def build_rows(conn, nodes, partition_ids, features, rack_info):
+    '''build the rows for the nodes, node_status, node_properties,
+       node_features and running_jobs tables as insert_node_info_bulk
+       does, returns a dictionary with the table names as keys'''
+    cursor = conn.cursor()
+    property_names = read_names(conn, 'property')
+    feature_names = read_names(conn, 'feature')
+    rows = dict((table_name, []) for table_name in
+                ['nodes', 'node_status', 'node_properties',
+                 'node_features', 'running_jobs'])
+    node_id = 0
+    for node, partition_id, node_features, (rack, iru, _) in zip(
+            nodes, partition_ids, features, rack_info):
+        if not partition_id or not node.status:
+            continue
+        node_id += 1
+        rows['nodes'].append((node_id, node.hostname, partition_id, rack,
+                              iru, node.np, node.memory, node.state,
+                              nr_used_cores(node), 0))
+        rows['node_status'].append((node_id, ) + status_row(node.status))
+        rows['node_properties'].extend(
+            (node_id, intern_name(cursor, property_names, 'property',
+                                  node_property))
+            for node_property in node.properties
+        )
+        rows['node_features'].extend(
+            (node_id, intern_name(cursor, feature_names, 'feature',
+                                  node_feature))
+            for node_feature in node_features
+        )
+        rows['running_jobs'].extend(
+            (job_id, node_id, first_core, nr_cores, 0)
+            for job_id, first_core, nr_cores in core_ranges(node.jobs)
+        )
+    cursor.close()
+    return rows
+
+def time_queries(conn, queries=None, nr_repeats=NR_REPEATS):
+    '''run each query nr_repeats times, returns a dictionary with the
+       query names as keys, and the minimum and mean time, and the number
+       of rows as values'''
+    if queries is None:
+        queries = QUERIES
+    results = {}
+    for name, query in queries:
+        durations = []
+        for _ in xrange(nr_repeats):
+            start = time.time()
+            nr_rows = len(conn.execute(query).fetchall())
+            durations.append(time.time() - start)
+        results[name] = {
+            'min': min(durations),
+            'mean': sum(durations)/len(durations),
+            'rows': nr_rows,
+        }
+    return results
+
+def _insert_names(conn, kind, pairs, is_legacy):
+    '''insert (node ID, name) pairs of a kind, 'property' or 'feature',
+       either a name per row, or interned'''
+    cursor = conn.cursor()
+    if is_legacy:
+        cursor.executemany(LEGACY_NAME_INSERT_CMDS[kind], pairs)
+    else:
+        names = read_names(conn, kind)
+        cursor.executemany(NAME_INSERT_CMDS[kind],
+                           [(node_id, intern_name(cursor, names, kind, name))
+                            for node_id, name in pairs])
+    cursor.close()
+
+def benchmark_name_layouts(property_pairs, feature_pairs, work_dir,
+                           nr_repeats=NR_REPEATS):
+    '''store (node ID, name) pairs of properties and features both in the
+       interned layout of DB_DESC, and in the former layout with a name
+       per row; returns a dictionary with, for each layout, the file
+       size, the insert time, including the indices, and the query
+       times'''
+    layouts = [
+        ('legacy', LEGACY_NAME_DESC),
+        ('interned', dict((table_name, create_node_db.DB_DESC[table_name])
+                          for table_name in NAME_TABLES)),
+    ]
+    results = {}
+    for layout, db_desc in layouts:
+        db_name = os.path.join(work_dir, 'names_{0}.db'.format(layout))
+        conn = sqlite3.connect(db_name)
+        try:
+            create_node_db.init_db(conn, db_desc, create_indexes=False)
+            start = time.time()
+            _insert_names(conn, 'property', property_pairs,
+                          layout == 'legacy')
+            _insert_names(conn, 'feature', feature_pairs,
+                          layout == 'legacy')
+            create_node_db.init_indexes(conn, db_desc)
+            conn.commit()
+            insert_time = time.time() - start
+            query_results = time_queries(conn, NAME_QUERIES, nr_repeats)
+        finally:
+            conn.close()
+        results[layout] = {
+            'db_size': os.path.getsize(db_name),
+            'insert_time': insert_time,
+            'queries': query_results,
+        }
+        os.remove(db_name)
+    return results
+
+def run_benchmark(templates, nr_nodes, partition_list, qos_levels,
+                  work_dir, job_density, seed=None, nr_repeats=NR_REPEATS):
+    '''run the benchmark for a synthetic cluster of nr_nodes nodes, files
+       are created in the work directory; returns a dictionary with the
+       results per phase and per query'''
+    timer = PhaseTimer()
+    nr_rows = {}
+    with timer.phase('generate'):
+        pbsnodes_file_name, showq_file_name = generate_cluster(
+            templates, nr_nodes, work_dir, job_density, seed
+        )
+    with timer.phase('parse_pbsnodes'):
+        with open(pbsnodes_file_name, 'r') as pbsnodes_file:
+            nodes = PbsnodesParser().parse_file(pbsnodes_file)
+    nr_rows['parse_pbsnodes'] = len(nodes)
+    with timer.phase('parse_showq'):
+        with open(showq_file_name, 'r') as showq_file:
+            jobs = ShowqParser().parse_file(showq_file)
+    nr_rows['parse_showq'] = sum(len(jobs[state]) for state in jobs)
+    with timer.phase('compute_partition'):
+        partition_names = [compute_partition(node, partition_list)
+                           for node in nodes]
+    with timer.phase('compute_features'):
+        features = [compute_features(node) for node in nodes]
+    with timer.phase('hostname2rackinfo'):
+        rack_info = [hostname2rackinfo(node.hostname) for node in nodes]
+    classifier = NodeClassifier(partition_list)
+    with timer.phase('classify'):
+        for node in nodes:
+            classifier.classify(node)
+    for phase in ['compute_partition', 'compute_features',
+                  'hostname2rackinfo', 'classify']:
+        nr_rows[phase] = len(nodes)
+    db_name = os.path.join(work_dir, 'nodes.db')
+    conn = sqlite3.connect(db_name)
+    try:
+        with timer.phase('init_db'):
+            create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                   create_jobs_tables=True,
+                                   create_indexes=False)
+        with timer.phase('insert_partitions'):
+            partitions = insert_partitions(conn, partition_list)
+        nr_rows['insert_partitions'] = len(partitions)
+        with timer.phase('insert_qos_levels'):
+            insert_qos_levels(conn, qos_levels)
+        nr_rows['insert_qos_levels'] = len(qos_levels)
+        partition_ids = [partitions.get(name) for name in partition_names]
+        with timer.phase('build_rows'):
+            rows = build_rows(conn, nodes, partition_ids, features,
+                              rack_info)
+        nr_rows['build_rows'] = len(rows['nodes'])
+        cursor = conn.cursor()
+        for table_name, insert_cmd in [
+                ('nodes', NODE_INSERT_CMD),
+                ('node_status', NODE_STATUS_INSERT_CMD),
+                ('node_properties', NODE_PROPERTY_INSERT_CMD),
+                ('node_features', NODE_FEATURE_INSERT_CMD),
+                ('running_jobs', RUNNING_JOB_INSERT_CMD)]:
+            phase = 'insert_' + table_name
+            with timer.phase(phase):
+                cursor.executemany(insert_cmd, rows[table_name])
+            nr_rows[phase] = len(rows[table_name])
+        cursor.close()
+        with timer.phase('update_summaries'):
+            update_summaries(conn)
+        with timer.phase('commit'):
+            conn.commit()
+        with timer.phase('insert_jobs'):
+            insert_jobs(conn, jobs)
+        nr_rows['insert_jobs'] = nr_rows['parse_showq']
+        with timer.phase('init_indexes'):
+            create_node_db.init_indexes(conn, create_node_db.DB_DESC,
+                                        create_jobs_tables=True)
+        query_results = time_queries(conn, nr_repeats=nr_repeats)
+        property_pairs = conn.execute(
+            '''SELECT node_id, property FROM properties'''
+        ).fetchall()
+        feature_pairs = conn.execute(
+            '''SELECT node_id, feature FROM features'''
+        ).fetchall()
+    finally:
+        conn.close()
+    name_layouts = benchmark_name_layouts(property_pairs, feature_pairs,
+                                          work_dir, nr_repeats)
+    db_size = os.path.getsize(db_name)
+    os.remove(db_name)
+    with sqlite3.connect(db_name) as conn:
+        create_node_db.init_db(conn, create_node_db.DB_DESC,
+                               create_jobs_tables=True,
+                               create_indexes=False)
+        partitions = insert_partitions(conn, partition_list)
+        with timer.phase('insert_node_info_bulk'):
+            nr_rows['insert_node_info_bulk'] = insert_node_info_bulk(
+                conn, nodes, partitions, do_jobs=True
+            )
+    os.remove(db_name)
+    phases = {}
+    for name, _, duration in timer.phases:
+        phases[name] = {'time': duration}
+        if name in nr_rows:
+            phases[name]['rows'] = nr_rows[name]
+            phases[name]['rows_per_s'] = (nr_rows[name]/duration
+                                          if duration > 0 else None)
+    return {
+        'nr_nodes': nr_nodes,
+        'db_size': db_size,
+        'phases': phases,
+        'queries': query_results,
+        'name_layouts': name_layouts,
+        'classifier': classifier.cache_stats,
+    }
+
+def compare_results(baseline, results, tolerance=TOLERANCE,
+                    min_duration=MIN_DURATION):
+    '''compare results to those of a baseline for the cluster sizes and
+       phases or queries they have in common, returns a list of (number
+       of nodes, phase or query name, baseline time, time) tuples for
+       those that are more than a fraction tolerance slower, times below
+       min_duration are ignored'''
+    regressions = []
+    baseline_runs = dict((run['nr_nodes'], run) for run in baseline['runs'])
+    for run in results['runs']:
+        baseline_run = baseline_runs.get(run['nr_nodes'])
+        if not baseline_run:
+            continue
+        timings = [(name, baseline_run['phases'][name]['time'],
+                    run['phases'][name]['time'])
+                   for name in run['phases']
+                   if name in baseline_run['phases']]
+        timings.extend((name, baseline_run['queries'][name]['min'],
+                        run['queries'][name]['min'])
+                       for name in run['queries']
+                       if name in baseline_run['queries'])
+        for name, baseline_time, run_time in sorted(timings):
+            if (run_time > min_duration and
+                    run_time > baseline_time*(1.0 + tolerance)):
+                regressions.append((run['nr_nodes'], name, baseline_time,
+                                    run_time))
+    return regressions
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from generate_cluster import JOB_DENSITY, PBSNODES_FILE, read_templates
+    from load_node_db import get_partitions, get_qos_levels, read_config
+
+    arg_parser = ArgumentParser(description=('benchmark loading and '
+                                             'querying the node database '
+                                             'for synthetic clusters'))
+    arg_parser.add_argument('--conf', help='JSON configuration file')
+    arg_parser.add_argument('--partitions',
+                            help='partitions defined for the cluster')
+    arg_parser.add_argument('--qos_levels',
+                            help='QOS defined for the cluster')
+    arg_parser.add_argument('--nodes',
+                            default=','.join(str(n) for n in NR_NODES),
+                            help='comma-separated numbers of nodes')
+    arg_parser.add_argument('--template', default=PBSNODES_FILE,
+                            help='pbsnodes file with template nodes')
+    arg_parser.add_argument('--job_density', type=float,
+                            default=JOB_DENSITY,
+                            help='fraction of nodes running jobs')
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help='random seed')
+    arg_parser.add_argument('--repeats', type=int, default=NR_REPEATS,
+                            help='number of times each query is run')
+    arg_parser.add_argument('--work_dir',
+                            help='directory for the generated files')
+    arg_parser.add_argument('--output', help='file to write results to')
+    arg_parser.add_argument('--baseline',
+                            help='results of a previous run to compare to')
+    arg_parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                            help=('fraction a phase or query may be slower '
+                                  'than the baseline'))
+    options = arg_parser.parse_args()
+    config = read_config(options.conf)
+    partition_list = get_partitions(options.partitions, config)
+    qos_levels = get_qos_levels(options.qos_levels, config)
+    with open(options.template, 'r') as template_file:
+        templates = read_templates(template_file)
+    work_dir = options.work_dir or tempfile.mkdtemp()
+    results = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'job_density': options.job_density,
+        'seed': options.seed,
+        'runs': [],
+    }
+    try:
+        for nr_nodes in options.nodes.split(','):
+            results['runs'].append(run_benchmark(
+                templates, int(nr_nodes), partition_list, qos_levels,
+                work_dir, options.job_density, options.seed,
+                options.repeats
+            ))
+    finally:
+        if not options.work_dir:
+            shutil.rmtree(work_dir)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
+    if options.baseline:
+        with open(options.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(baseline, results, options.tolerance)
+        for nr_nodes, name, baseline_time, run_time in regressions:
+            msg = 'W: {0} for {1:d} nodes: {2:.4f} s, was {3:.4f} s\n'
+            sys.stderr.write(msg.format(name, nr_nodes, run_time,
+                                        baseline_time))
+        if regressions:
+            sys.exit(REGRESSION_ERROR)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+'''Benchmark of parsing pbsnodes output of synthetic clusters of
+   increasing size with PbsnodesParser, and with PbsnodesRecordParser for
+   all fields, and for the fields the loaders need; for each parser, the
+   records per second are measured for parsing alone, and for parsing and
+   accessing the attributes the loaders use, as well as the memory per
+   node of the parsed nodes; each measurement runs in a fresh process, so
+   that they do not influence one another; results are written as JSON'''
+
+import gc, json, os, platform, resource, shutil, sys, tempfile, time
+from multiprocessing import Pool
+
+from vsc.pbs.pbsnodes import PbsnodesParser
+from generate_cluster import ClusterGenerator
+from pbsnodes_parser import LOADER_FIELDS, PbsnodesRecordParser
+
+UNKNOWN_PARSER_ERROR = 1
+
+NR_NODES = [1000, 10000, 100000]
+PARSERS = ['PbsnodesParser', 'native', 'native_loader']
+
+def current_rss():
+    '''return the current resident set size of the process in bytes'''
+    with open('/proc/self/statm', 'r') as statm:
+        nr_pages = int(statm.read().split()[1])
+    return nr_pages*resource.getpagesize()
+
+def create_parser(parser_name):
+    '''create the parser with the given name, one of PARSERS'''
+    if parser_name == 'PbsnodesParser':
+        return PbsnodesParser()
+    elif parser_name == 'native':
+        return PbsnodesRecordParser()
+    elif parser_name == 'native_loader':
+        return PbsnodesRecordParser(LOADER_FIELDS)
+    else:
+        raise ValueError('unknown parser {0}'.format(parser_name))
+
+def access_nodes(nodes):
+    '''access the attributes of the nodes that the loaders use, since the
+       native parser decodes some of them lazily'''
+    nr_values = 0
+    for node in nodes:
+        values = [node.hostname, node.state, node.np, node.properties,
+                  node.memory, node.status.get('rectime'), node.jobs]
+        nr_values += len(values)
+    return nr_values
+
+def measure_parser(args):
+    '''parse the pbsnodes file with the given parser in a worker process,
+       returns the time to parse, the time to access the attributes, the
+       number of nodes, and the memory they use in bytes after parsing,
+       and after accessing the attributes'''
+    parser_name, file_name = args
+    parser = create_parser(parser_name)
+    with open(file_name, 'r') as pbsnodes_file:
+        pbsnodes_output = pbsnodes_file.read()
+    gc.collect()
+    rss_before = current_rss()
+    start = time.time()
+    nodes = parser.parse(pbsnodes_output)
+    parse_time = time.time() - start
+    gc.collect()
+    rss_parsed = current_rss()
+    start = time.time()
+    access_nodes(nodes)
+    access_time = time.time() - start
+    gc.collect()
+    rss_accessed = current_rss()
+    return (parse_time, access_time, len(nodes), rss_parsed - rss_before,
+            rss_accessed - rss_before)
+
+def run_benchmark(templates, nr_nodes, work_dir, parsers=None, seed=0):
+    '''generate pbsnodes output for a cluster with the given number of
+       nodes, and measure each parser, returns a dictionary with the
+       results'''
+    if parsers is None:
+        parsers = PARSERS
+    file_name = os.path.join(work_dir, 'pbsnodes_{0:d}.txt'.format(nr_nodes))
+    generator = ClusterGenerator(templates, nr_nodes, seed=seed)
+    with open(file_name, 'w') as pbsnodes_file:
+        generator.write_pbsnodes(pbsnodes_file)
+    run = {
+        'nr_nodes': nr_nodes,
+        'file_size': os.path.getsize(file_name),
+        'parsers': {},
+    }
+    for parser_name in parsers:
+        pool = Pool(1)
+        try:
+            (parse_time, access_time, nr_parsed, memory,
+             accessed_memory) = pool.apply(
+                measure_parser, ((parser_name, file_name), )
+            )
+        finally:
+            pool.terminate()
+            pool.join()
+        total_time = parse_time + access_time
+        run['parsers'][parser_name] = {
+            'nr_nodes': nr_parsed,
+            'parse_time': parse_time,
+            'access_time': access_time,
+            'records_per_s': nr_parsed/parse_time if parse_time else None,
+            'records_per_s_with_access': (nr_parsed/total_time
+                                          if total_time else None),
+            'memory_per_node': float(memory)/nr_parsed if nr_parsed else None,
+            'memory_per_node_with_access': (float(accessed_memory)/nr_parsed
+                                            if nr_parsed else None),
+        }
+    os.remove(file_name)
+    return run
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from generate_cluster import PBSNODES_FILE, read_templates
+
+    arg_parser = ArgumentParser(description=('benchmark parsing pbsnodes '
+                                             'output for synthetic '
+                                             'clusters'))
+    arg_parser.add_argument('--nodes',
+                            default=','.join(str(n) for n in NR_NODES),
+                            help='comma-separated numbers of nodes')
+    arg_parser.add_argument('--parsers', default=','.join(PARSERS),
+                            help=('comma-separated parsers to measure, '
+                                  'from {0}'.format(','.join(PARSERS))))
+    arg_parser.add_argument('--template', default=PBSNODES_FILE,
+                            help='pbsnodes file with template nodes')
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help='random seed')
+    arg_parser.add_argument('--output', help='file to write results to')
+    options = arg_parser.parse_args()
+    with open(options.template, 'r') as template_file:
+        templates = read_templates(template_file)
+    parsers = options.parsers.split(',')
+    for parser_name in parsers:
+        if parser_name not in PARSERS:
+            sys.stderr.write('### error: unknown parser {0}\n'.format(
+                parser_name
+            ))
+            sys.exit(UNKNOWN_PARSER_ERROR)
+    work_dir = tempfile.mkdtemp()
+    results = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'seed': options.seed,
+        'runs': [],
+    }
+    try:
+        for nr_nodes in options.nodes.split(','):
+            results['runs'].append(run_benchmark(templates, int(nr_nodes),
+                                                 work_dir, parsers,
+                                                 options.seed))
+    finally:
+        shutil.rmtree(work_dir)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+'''Vectorized engine to check whether resource requests can be satisfied
+   by the nodes in a compute cluster; nodes with identical partition,
+   cores, memory, GPUs, properties and features are collapsed into node
+   classes, properties and features are encoded as bitmasks, so that
+   queries are NumPy mask operations over the node classes rather than
+   SQL joins over the nodes'''
+
+import numpy as np
+
+import create_node_db
+from summarize_node_db import DOWN_STATES
+
+WORD_SIZE = 64
+BATCH_CHUNK_SIZE = 1 << 22
+NO_PARTITION = -1
+UNKNOWN = -2
+
+def is_down(state):
+    '''check whether a node state is down, offline or unknown, as the
+       summaries do'''
+    state = (state or '').lower()
+    return any(down_state in state for down_state in DOWN_STATES)
+
+class CapacityEngine(object):
+    '''Array-backed view of the nodes in a node database for fast
+       feasibility checks and capacity counts'''
+
+    def __init__(self, conn, cluster=None):
+        '''load the nodes, their properties and features, and running
+           jobs from the database connection, only those of the cluster
+           with the given name if any, otherwise those of all clusters,
+           and partitions with the same name are combined; nodes that
+           are down, offline or in an unknown state are never free'''
+        if cluster is None:
+            cluster_filter, cluster_args = '', ()
+        else:
+            cluster_filter = '''WHERE cluster_id =
+                                    (SELECT cluster_id FROM clusters
+                                         WHERE cluster_name = ?)'''
+            cluster_args = (cluster, )
+        partitions = dict(conn.execute(
+            '''SELECT partition_id, partition_name FROM partitions'''
+        ))
+        tags = {}
+        for node_id, tag in conn.execute(
+                '''SELECT node_id, property FROM properties
+                   UNION
+                   SELECT node_id, feature FROM features'''):
+            tags.setdefault(node_id, []).append(tag)
+        busy_nodes = set()
+        if create_node_db.has_table(conn, 'running_jobs'):
+            busy_nodes.update(row[0] for row in conn.execute(
+                '''SELECT DISTINCT node_id FROM running_jobs
+                       {0}'''.format(cluster_filter), cluster_args
+            ))
+        self._partition_codes = {}
+        self._tag_bits = {}
+        classes = {}
+        nr_nodes = []
+        nr_free = []
+        for node_id, partition_id, cores, mem, ngpus, state in conn.execute(
+                '''SELECT node_id, partition_id, np, mem, ngpus, state
+                       FROM nodes
+                       {0}'''.format(cluster_filter), cluster_args):
+            partition = partitions.get(partition_id, partition_id)
+            partition_code = self._partition_codes.setdefault(
+                partition, len(self._partition_codes)
+            )
+            tag_bits = frozenset(self._tag_bits.setdefault(
+                tag, len(self._tag_bits)
+            ) for tag in tags.get(node_id, ()))
+            key = (partition_code, cores, mem, ngpus or 0, tag_bits)
+            class_id = classes.get(key)
+            if class_id is None:
+                class_id = classes[key] = len(classes)
+                nr_nodes.append(0)
+                nr_free.append(0)
+            nr_nodes[class_id] += 1
+            if node_id not in busy_nodes and not is_down(state):
+                nr_free[class_id] += 1
+        self._nr_words = max(1, (len(self._tag_bits) + WORD_SIZE - 1)//
+                                WORD_SIZE)
+        nr_classes = len(classes)
+        self._partition = np.empty(nr_classes, dtype=np.int32)
+        self._cores = np.empty(nr_classes, dtype=np.int64)
+        self._mem = np.empty(nr_classes, dtype=np.int64)
+        self._ngpus = np.empty(nr_classes, dtype=np.int64)
+        self._tags = np.zeros((nr_classes, self._nr_words), dtype=np.uint64)
+        for key, class_id in classes.iteritems():
+            partition_code, cores, mem, ngpus, tag_bits = key
+            self._partition[class_id] = partition_code
+            self._cores[class_id] = cores
+            self._mem[class_id] = mem
+            self._ngpus[class_id] = ngpus
+            self._tags[class_id] = self._bitmask(tag_bits)
+        self._nr_nodes = np.array(nr_nodes, dtype=np.int64)
+        self._nr_free = np.array(nr_free, dtype=np.int64)
+
+    def _bitmask(self, tag_bits):
+        '''turn a collection of bit positions into an array of words'''
+        words = [0]*self._nr_words
+        for bit in tag_bits:
+            words[bit//WORD_SIZE] |= 1 << (bit % WORD_SIZE)
+        return np.array(words, dtype=np.uint64)
+
+    def _required_mask(self, required):
+        '''bitmask for a collection of required properties or features,
+           None if any of them is not known'''
+        tag_bits = []
+        for tag in required:
+            if tag not in self._tag_bits:
+                return None
+            tag_bits.append(self._tag_bits[tag])
+        return self._bitmask(tag_bits)
+
+    def _partition_code(self, partition):
+        '''code of a partition, NO_PARTITION when any partition will do,
+           UNKNOWN if there is no such partition'''
+        if partition is None:
+            return NO_PARTITION
+        return self._partition_codes.get(partition, UNKNOWN)
+
+    @property
+    def nr_classes(self):
+        '''number of distinct node classes'''
+        return len(self._nr_nodes)
+
+    @property
+    def nr_nodes(self):
+        '''total number of nodes'''
+        return int(self._nr_nodes.sum())
+
+    def partitions(self):
+        '''return the names of the partitions that have nodes'''
+        return sorted(self._partition_codes)
+
+    def mask(self, partition=None, ppn=1, mem=0, ngpus=0, required=()):
+        '''boolean array over the node classes that have at least ppn
+           cores, mem memory and ngpus GPUs, all required properties or
+           features, and, optionally, are in the partition'''
+        partition_code = self._partition_code(partition)
+        required_mask = self._required_mask(required)
+        if partition_code == UNKNOWN or required_mask is None:
+            return np.zeros(self.nr_classes, dtype=bool)
+        selected = (self._cores >= ppn) & (self._mem >= mem)
+        if ngpus:
+            selected &= self._ngpus >= ngpus
+        if partition_code != NO_PARTITION:
+            selected &= self._partition == partition_code
+        if required_mask.any():
+            selected &= np.all((self._tags & required_mask) ==
+                               required_mask, axis=1)
+        return selected
+
+    def count_nodes(self, partition=None, ppn=1, mem=0, ngpus=0,
+                    required=()):
+        '''number of nodes that match the requirements'''
+        selected = self.mask(partition, ppn, mem, ngpus, required)
+        return int(self._nr_nodes[selected].sum())
+
+    def count_cores(self, partition=None, ppn=1, mem=0, ngpus=0,
+                    required=()):
+        '''number of cores on the nodes that match the requirements'''
+        selected = self.mask(partition, ppn, mem, ngpus, required)
+        return int((self._nr_nodes[selected]*self._cores[selected]).sum())
+
+    def count_free_nodes(self, partition=None, ppn=1, mem=0, ngpus=0,
+                         required=()):
+        '''number of nodes that match the requirements, are up, and
+           have no running jobs'''
+        selected = self.mask(partition, ppn, mem, ngpus, required)
+        return int(self._nr_free[selected].sum())
+
+    def is_feasible(self, nr_nodes=1, partition=None, ppn=1, mem=0, ngpus=0,
+                    required=()):
+        '''check whether a request for nr_nodes nodes can ever be
+           satisfied'''
+        return self.count_nodes(partition, ppn, mem, ngpus,
+                                required) >= nr_nodes
+
+    def evaluate(self, requests):
+        '''evaluate a sequence of requests at once, each request is a
+           dictionary that may have the keys nodes, partition, ppn, mem,
+           ngpus and required; returns a dictionary of arrays with an
+           element per request for nr_nodes, nr_cores and nr_free_nodes
+           that match, and whether the request is feasible'''
+        nr_requests = len(requests)
+        wanted = np.empty(nr_requests, dtype=np.int64)
+        partition_codes = np.empty(nr_requests, dtype=np.int32)
+        ppns = np.empty(nr_requests, dtype=np.int64)
+        mems = np.empty(nr_requests, dtype=np.int64)
+        ngpus = np.empty(nr_requests, dtype=np.int64)
+        required_masks = np.zeros((nr_requests, self._nr_words),
+                                  dtype=np.uint64)
+        is_known = np.ones(nr_requests, dtype=bool)
+        for request_nr, request in enumerate(requests):
+            wanted[request_nr] = request.get('nodes', 1)
+            partition_codes[request_nr] = self._partition_code(
+                request.get('partition')
+            )
+            ppns[request_nr] = request.get('ppn', 1)
+            mems[request_nr] = request.get('mem', 0)
+            ngpus[request_nr] = request.get('ngpus', 0)
+            required_mask = self._required_mask(request.get('required', ()))
+            if required_mask is None:
+                is_known[request_nr] = False
+            else:
+                required_masks[request_nr] = required_mask
+        is_known &= partition_codes != UNKNOWN
+        results = {
+            'nr_nodes': np.zeros(nr_requests, dtype=np.int64),
+            'nr_cores': np.zeros(nr_requests, dtype=np.int64),
+            'nr_free_nodes': np.zeros(nr_requests, dtype=np.int64),
+        }
+        cores_per_class = self._nr_nodes*self._cores
+        chunk_size = max(1, BATCH_CHUNK_SIZE//
+                            max(1, self.nr_classes*self._nr_words))
+        for start in xrange(0, nr_requests, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            selected = ((self._cores >= ppns[chunk, np.newaxis]) &
+                        (self._mem >= mems[chunk, np.newaxis]) &
+                        (self._ngpus >= ngpus[chunk, np.newaxis]))
+            codes = partition_codes[chunk, np.newaxis]
+            selected &= (codes == NO_PARTITION) | (self._partition == codes)
+            masks = required_masks[chunk, np.newaxis, :]
+            selected &= np.all((self._tags & masks) == masks, axis=2)
+            selected &= is_known[chunk, np.newaxis]
+            results['nr_nodes'][chunk] = selected.dot(self._nr_nodes)
+            results['nr_cores'][chunk] = selected.dot(cores_per_class)
+            results['nr_free_nodes'][chunk] = selected.dot(self._nr_free)
+        results['feasible'] = results['nr_nodes'] >= wanted
+        return results
@@ -1,36 +1,147 @@
 #!/usr/bin/env python
 
-import subprocess
-from vsc.moab.job import ShowqParser
-from vsc.moab.checkjob import CheckjobParser
+import subprocess, sys, time
+import command_cache
 
-def get_blocked_jobs(options):
+NR_WORKERS = 8
+
+def get_blocked_jobs(options, cache=command_cache.NO_CACHE):
     '''Get a list of options currently in the queue''';
-    cmd_ouput = subprocess.check_output([options.showq])
+    from vsc.moab.showq import ShowqParser
+    cmd_ouput = cache.check_output([options.showq])
     parser = ShowqParser()
     jobs = parser.parse(cmd_ouput)
     return [job for job in jobs['blocked'] if job.state == 'SystemHold']
 
-def get_hold_info(jobs, options):
-    '''Get the information on the jobs that are on hold'''
+def split_checkjob_output(cmd_output):
+    '''Split the output of checkjob for multiple jobs into a dictionary
+       with the job IDs as keys, and the output for that job as value, the
+       output for each job starts with a line "job <job_id>"'''
+    job_outputs = {}
+    job_id = None
+    for line in cmd_output.splitlines(True):
+        if line.startswith('job '):
+            job_id = line.split()[1]
+            job_outputs[job_id] = []
+        if job_id is not None:
+            job_outputs[job_id].append(line)
+    return dict((job_id, ''.join(lines))
+                for job_id, lines in job_outputs.items())
+
+def run_checkjob(checkjob_cmd, job_ids, cache=command_cache.NO_CACHE):
+    '''Run checkjob for one or more jobs through the command cache,
+       returns the output, or None if checkjob failed'''
+    try:
+        return cache.check_output([checkjob_cmd] + job_ids)
+    except (OSError, subprocess.CalledProcessError):
+        msg = 'W: could not execute checkjob for {0}\n'
+        sys.stderr.write(msg.format(','.join(job_ids)))
+        return None
+
+def get_hold_info(jobs, options, cache=command_cache.NO_CACHE):
+    '''Get the information on the jobs that are on hold, checkjob is run
+       concurrently by options.workers threads, for options.jobs_per_call
+       jobs at a time'''
+    from multiprocessing.pool import ThreadPool
+    from vsc.moab.checkjob import CheckjobParser
+    jobs_per_call = max(1, options.jobs_per_call)
+    job_batches = [jobs[i:i + jobs_per_call]
+                   for i in xrange(0, len(jobs), jobs_per_call)]
+
+    def check_jobs(job_batch):
+        '''run checkjob for a batch of jobs'''
+        job_ids = [job.id for job in job_batch]
+        return job_batch, run_checkjob(options.checkjob, job_ids, cache)
+
     parser = CheckjobParser()
-    for job in jobs:
-        cmd_output = subprocess.check_output([options.checkjob, job.id])
-        parser.parse(job, cmd_output)
+    pool = ThreadPool(max(1, options.workers))
+    try:
+        for job_batch, cmd_output in pool.imap_unordered(check_jobs,
+                                                         job_batches):
+            if cmd_output is None:
+                continue
+            elif len(job_batch) == 1:
+                parser.parse(job_batch[0], cmd_output)
+            else:
+                job_outputs = split_checkjob_output(cmd_output)
+                for job in job_batch:
+                    if job.id in job_outputs:
+                        parser.parse(job, job_outputs[job.id])
+    finally:
+        pool.close()
+        pool.join()
 
-if __name__ == '__main__':
+def format_holds(holds):
+    '''Format the holds of a job as a comma-separated string'''
+    if not holds:
+        return None
+    elif isinstance(holds, basestring):
+        return holds
+    else:
+        return ','.join(holds)
+
+def store_hold_info(conn, jobs):
+    '''Replace the contents of the held_jobs table by the given jobs, the
+       table is created, or recreated if it has an integer job_id, since
+       job IDs need not be numeric, e.g., for array jobs'''
+    import create_node_db
+    cursor = conn.cursor()
+    job_id_types = [row[2] for row in
+                    cursor.execute('''PRAGMA table_info(held_jobs)''')
+                    if row[1] == 'job_id']
+    if job_id_types != ['TEXT']:
+        create_node_db.init_table(conn, 'held_jobs',
+                                  create_node_db.DB_DESC['held_jobs'],
+                                  force=True)
+    held_job_insert_cmd = '''INSERT INTO held_jobs
+                                 (job_id, user, account, state, holds,
+                                  checktime) VALUES
+                                 (?, ?, ?, ?, ?, ?)'''
+    checktime = time.strftime('%Y-%m-%d %H:%M:%S')
+    cursor.execute('''DELETE FROM held_jobs''')
+    cursor.executemany(held_job_insert_cmd,
+                       [(str(job.id), job.username, job.account, job.state,
+                         format_holds(job.holds), checktime)
+                        for job in jobs])
+    cursor.close()
+    conn.commit()
+
+def main(argv=None, prog=None):
+    '''show the holds of jobs in SystemHold, argv are the command line
+       arguments, by default sys.argv[1:], prog is the program name in
+       messages'''
     from argparse import ArgumentParser
 
-    arg_parser = ArgumentParser(description='check systemhold jobs')
+    arg_parser = ArgumentParser(prog=prog, description='check systemhold jobs')
     arg_parser.add_argument('--showq', default='/opt/moab/bin/showq',
                             help='showq to use')
     arg_parser.add_argument('--checkjob', default='/opt/moab/bin/checkjob',
                             help='checkjob to use')
-    options = arg_parser.parse_args()
-    jobs = get_blocked_jobs(options)
-    get_hold_info(jobs, options)
+    arg_parser.add_argument('--workers', type=int, default=NR_WORKERS,
+                            help='number of concurrent checkjob commands')
+    arg_parser.add_argument('--jobs_per_call', type=int, default=1,
+                            help=('number of job IDs passed to a single '
+                                  'checkjob command'))
+    arg_parser.add_argument('--db', help='database to store hold info in')
+    arg_parser.add_argument('--cache_dir', default=command_cache.CACHE_DIR,
+                            help='directory to cache command output in')
+    arg_parser.add_argument('--cache_ttl', type=float,
+                            default=command_cache.TTL,
+                            help=('time in seconds cached showq and '
+                                  'checkjob output is used, 0 to disable'))
+    options = arg_parser.parse_args(argv)
+    cache = command_cache.CommandCache(options.cache_dir, options.cache_ttl)
+    jobs = get_blocked_jobs(options, cache)
+    get_hold_info(jobs, options, cache)
+    if options.db:
+        import sqlite3
+        with sqlite3.connect(options.db) as conn:
+            store_hold_info(conn, jobs)
     for job in jobs:
         print job.id
         print '\t{0}'.format(job.username)
         print '\t{0}'.format(job.account)
         print '\t{0}'.format(job.holds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''Single entry point for the cluster database scripts, with subcommands
+   create, load, update, dump and holds; only the modules the subcommand
+   needs are imported, so that, e.g., a load without --jobs does not
+   import the showq parser; the subcommand's options are those of its
+   script, each script's module is imported once, and its main function
+   is called with them; --startup_time reports the time from the start
+   of the process until the subcommand starts running'''
+
+import time
+
+START_TIME = time.time()
+
+import importlib, os, sys
+
+COMMANDS = {
+    'create': ('create_node_db', []),
+    'load': ('load_node_db', []),
+    'update': ('load_node_db', ['--update']),
+    'dump': ('dump_node_states', []),
+    'holds': ('check_holds', []),
+}
+
+def process_start_time():
+    '''return the time the process started according to /proc, with a
+       resolution of a clock tick, None if that is not available'''
+    try:
+        with open('/proc/self/stat', 'r') as stat_file:
+            fields = stat_file.read().rpartition(')')[2].split()
+        with open('/proc/uptime', 'r') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+    except (IOError, IndexError, ValueError):
+        return None
+    boot_time = time.time() - uptime
+    return boot_time + float(fields[19])/os.sysconf('SC_CLK_TCK')
+
+def load_command(command):
+    '''import the module of the subcommand, returns the module, and the
+       time spent importing it'''
+    start = time.time()
+    module = importlib.import_module(COMMANDS[command][0])
+    return module, time.time() - start
+
+def startup_times(import_time, start_time=START_TIME):
+    '''return the time since the process started, or since the entry
+       point started if that is unknown, and the time spent importing the
+       subcommand's module'''
+    process_start = process_start_time()
+    if process_start is None or process_start > start_time:
+        process_start = start_time
+    return {
+        'startup': time.time() - process_start,
+        'imports': import_time,
+    }
+
+def run_command(command, args, prog=None, module=None):
+    '''run the main function of the subcommand's script with the given
+       arguments, the script's module is imported unless it is given'''
+    module_name, extra_args = COMMANDS[command]
+    if module is None:
+        module = importlib.import_module(module_name)
+    if prog is None:
+        prog = '{0}.py'.format(module_name)
+    module.main(extra_args + list(args), prog)
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser, REMAINDER
+
+    arg_parser = ArgumentParser(description=('create, load, update or dump '
+                                             'a cluster database, or check '
+                                             'job holds'))
+    arg_parser.add_argument('--startup_time', action='store_true',
+                            help=('report the time until the subcommand '
+                                  'starts on standard error'))
+    arg_parser.add_argument('command', choices=sorted(COMMANDS),
+                            help='subcommand to run')
+    arg_parser.add_argument('args', nargs=REMAINDER,
+                            help='options of the subcommand')
+    options = arg_parser.parse_args()
+    module, import_time = load_command(options.command)
+    if options.startup_time:
+        msg = ('startup {command}: {startup:.3f} s, of which {imports:.3f} s '
+               'importing {module}\n')
+        sys.stderr.write(msg.format(command=options.command,
+                                    module=module.__name__,
+                                    **startup_times(import_time)))
+    prog = '{0} {1}'.format(os.path.basename(sys.argv[0]), options.command)
+    run_command(options.command, options.args, prog, module)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+'''Classes to collect information on a compute cluster concurrently,
+   i.e., run pbsnodes, showq and checknode at the same time, and to
+   report the wall-clock time spent in each phase of a run'''
+
+import sys, time
+from contextlib import contextmanager
+
+NR_WORKERS = 4
+
+class PhaseTimer(object):
+    '''Keeps track of the wall-clock time spent in named phases, phases
+       may run concurrently in different threads'''
+
+    def __init__(self):
+        '''create a timer, the start of the run is the time of creation'''
+        self._start = time.time()
+        self._phases = []
+
+    @contextmanager
+    def phase(self, name):
+        '''context manager to time a phase with the given name'''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._phases.append((name, start - self._start,
+                                 time.time() - start))
+
+    @property
+    def phases(self):
+        '''list of phases as (name, start, duration) tuples, ordered by
+           start time, times are in seconds, relative to the start of the
+           run'''
+        return sorted(self._phases, key=lambda phase: phase[1])
+
+    @property
+    def total(self):
+        '''wall-clock time since the start of the run'''
+        return time.time() - self._start
+
+    def report(self, out=sys.stderr):
+        '''write a report on the phases'''
+        fmt_str = '{0:<20s} {1:9.3f} {2:9.3f}\n'
+        out.write('{0:<20s} {1:>9s} {2:>9s}\n'.format('phase', 'start',
+                                                    'duration'))
+        for name, start, duration in self.phases:
+            out.write(fmt_str.format(name, start, duration))
+        out.write(fmt_str.format('total', 0.0, self.total))
+
+class ConcurrentCollector(object):
+    '''Runs collection tasks, e.g., running and parsing pbsnodes, either
+       concurrently in a pool of threads, or sequentially at the time the
+       task is submitted'''
+
+    def __init__(self, timer, is_concurrent=True):
+        '''create a collector that times its tasks using the given timer,
+           tasks run concurrently if is_concurrent is True'''
+        self._timer = timer
+        self._results = {}
+        if is_concurrent:
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(NR_WORKERS)
+        else:
+            self._pool = None
+
+    def _run(self, name, func, args):
+        '''run a task, SystemExit is returned rather than raised, since it
+           would terminate a worker thread of the pool'''
+        with self._timer.phase(name):
+            try:
+                return False, func(*args)
+            except SystemExit as exit_error:
+                return True, exit_error.code
+
+    def submit(self, name, func, *args):
+        '''submit a task with the given name that calls func with args,
+           its result can be retrieved using the result method'''
+        if self._pool:
+            self._results[name] = self._pool.apply_async(self._run,
+                                                         (name, func, args))
+        else:
+            self._results[name] = self._run(name, func, args)
+
+    def result(self, name):
+        '''return the result of the task with the given name, wait for it
+           to finish if required, exits if the task did'''
+        result = self._results[name]
+        if self._pool:
+            result = result.get()
+        is_exit, value = result
+        if is_exit:
+            sys.exit(value)
+        return value
+
+    def close(self):
+        '''release the threads of the collector'''
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+'''Functions to collect the output of the moab checknode command for the
+   nodes in a compute cluster, either by running checknode for each node
+   in a pool of worker threads, or by reading a file that contains the
+   concatenated output of checknode for all nodes'''
+
+import re, subprocess, sys, threading
+
+NR_WORKERS = 16
+CHECKNODE_TIMEOUT = 30
+
+MEM_UNITS = {'K': 1.0/1024, 'M': 1, 'G': 1024, 'T': 1024**2}
+RESOURCE_PREFIXES = {
+    'Configured': 'conf',
+    'Utilized': 'util',
+    'Dedicated': 'ded',
+}
+RESOURCES_RE = re.compile(r'^(Configured|Utilized|Dedicated)\s+Resources:'
+                          r'(.*)$')
+RESOURCE_RE = re.compile(r'(PROCS|MEM):\s*(\d+)([KMGT]?)')
+
+def convert_mem(value, unit):
+    '''convert a memory size as reported by checknode to MB'''
+    return int(int(value)*MEM_UNITS.get(unit, 1))
+
+def parse_checknode(checknode_output):
+    '''parse the output of checknode for a single node, returns a
+       dictionary with the hostname, state, CPU load, and the configured,
+       utilized and dedicated procs and memory (in MB)'''
+    info = {}
+    for line in checknode_output.splitlines():
+        line = line.strip()
+        if line.startswith('node '):
+            info['hostname'] = line.split()[1]
+        elif line.startswith('State:'):
+            info['state'] = line.split()[1]
+        elif 'CPULoad:' in line:
+            value = line.split('CPULoad:')[1].split()[0]
+            info['cpuload'] = float(value)
+        else:
+            match = RESOURCES_RE.match(line)
+            if match:
+                prefix = RESOURCE_PREFIXES[match.group(1)]
+                for name, value, unit in RESOURCE_RE.findall(match.group(2)):
+                    if name == 'PROCS':
+                        info[prefix + '_procs'] = int(value)
+                    else:
+                        info[prefix + '_mem'] = convert_mem(value, unit)
+    return info
+
+def iter_checknode_records(lines):
+    '''Generator that splits concatenated checknode output into the output
+       for individual nodes, each starts with a line "node <hostname>"'''
+    record = []
+    for line in lines:
+        if line.startswith('node ') and record:
+            yield ''.join(record)
+            record = []
+        record.append(line)
+    if record:
+        yield ''.join(record)
+
+def read_node_checks(checknode_file):
+    '''read concatenated checknode output from a file, returns a
+       dictionary with hostnames as keys, and node checks as values'''
+    node_checks = {}
+    for record in iter_checknode_records(checknode_file):
+        info = parse_checknode(record)
+        if 'hostname' in info:
+            node_checks[info['hostname']] = info
+    return node_checks
+
+def _kill_process(process):
+    '''kill a process, ignore processes that finished'''
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+def run_checknode(checknode_cmd, hostname, timeout=CHECKNODE_TIMEOUT):
+    '''run checknode for a single node, returns the output, or None when
+       the command fails or does not finish within timeout seconds; it
+       is called from worker threads, so no preexec_fn is used, since
+       that is not thread-safe, and file descriptors are closed in the
+       child, so that it does not hold the pipes of other checknodes'''
+    try:
+        process = subprocess.Popen([checknode_cmd, hostname],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE,
+                                   close_fds=True)
+    except OSError as error:
+        msg = 'W: checknode failed for {0} ({1})\n'
+        sys.stderr.write(msg.format(hostname, str(error)))
+        return None
+    timer = threading.Timer(timeout, _kill_process, (process, ))
+    timer.start()
+    try:
+        output, _ = process.communicate()
+    finally:
+        timer.cancel()
+    if process.returncode != 0:
+        msg = 'W: checknode failed for {0} (exit status {1:d})\n'
+        sys.stderr.write(msg.format(hostname, process.returncode))
+        return None
+    return output
+
+def collect_node_checks(checknode_cmd, hostnames, nr_workers=NR_WORKERS,
+                        timeout=CHECKNODE_TIMEOUT):
+    '''run checknode for each of the nodes, at most nr_workers at the
+       same time, returns a dictionary with hostnames as keys, and node
+       checks as values, nodes for which checknode fails are omitted'''
+
+    def check_node(hostname):
+        '''run checknode for a node and parse its output'''
+        output = run_checknode(checknode_cmd, hostname, timeout)
+        if output is None:
+            return hostname, None
+        return hostname, parse_checknode(output)
+
+    from multiprocessing.pool import ThreadPool
+    node_checks = {}
+    pool = ThreadPool(nr_workers)
+    try:
+        for hostname, info in pool.imap_unordered(check_node, hostnames):
+            if info is not None:
+                node_checks[hostname] = info
+    finally:
+        pool.close()
+        pool.join()
+    return node_checks
+
+def collect_all_node_checks(checknode_cmd, timeout=CHECKNODE_TIMEOUT):
+    '''run checknode for all nodes at once, returns a dictionary with
+       hostnames as keys, and node checks as values'''
+    output = run_checknode(checknode_cmd, 'ALL', timeout)
+    if output is None:
+        return {}
+    return read_node_checks(output.splitlines(True))
+
+def insert_node_checks(conn, node_checks):
+    '''insert node checks for the nodes in the database, existing checks
+       are replaced, returns the number of nodes for which checks were
+       inserted'''
+    cursor = conn.cursor()
+    node_check_insert_cmd = '''INSERT OR REPLACE INTO node_checks
+                                   (node_id, state, cpuload,
+                                    conf_procs, conf_mem,
+                                    util_procs, util_mem,
+                                    ded_procs, ded_mem) VALUES
+                                   (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    node_check_rows = []
+    for node_id, hostname in cursor.execute('''SELECT node_id, hostname
+                                                   FROM nodes'''):
+        if hostname in node_checks:
+            info = node_checks[hostname]
+            node_check_rows.append((
+                node_id, info.get('state'), info.get('cpuload'),
+                info.get('conf_procs'), info.get('conf_mem'),
+                info.get('util_procs'), info.get('util_mem'),
+                info.get('ded_procs'), info.get('ded_mem')
+            ))
+    cursor.executemany(node_check_insert_cmd, node_check_rows)
+    cursor.close()
+    conn.commit()
+    return len(node_check_rows)
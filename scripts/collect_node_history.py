@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+'''Collector that periodically samples the state of the nodes in a
+   compute cluster with a PBS torque resource manager, and appends the
+   samples to a history database, alternatively, captured pbsnodes dumps
+   can be replayed'''
+
+import os, signal, sqlite3, subprocess, sys, time
+
+from vsc.pbs.pbsnodes import PbsnodesParser
+from vsc.moab.showq import ShowqParser
+import create_node_db
+from pbsnodes_status import parse_status
+
+INTERVAL = 60
+NO_DUMP_DIR_ERROR = 1
+
+def open_history_db(db_name):
+    '''Open the history database in WAL mode, so that it can be queried
+       while samples are appended, tables are created when they do not
+       exist yet, e.g., those added since the database was created;
+       returns the connection'''
+    conn = sqlite3.connect(db_name)
+    conn.execute('''PRAGMA journal_mode = WAL''')
+    for table_name, table_desc in create_node_db.HISTORY_DB_DESC.items():
+        if not create_node_db.has_table(conn, table_name):
+            create_node_db.init_table(conn, table_name, table_desc)
+    conn.commit()
+    return conn
+
+def node_config(node):
+    '''return the static data of a node, i.e., hostname, cores, memory
+       and properties, that identifies its row in history_nodes'''
+    return (node.hostname, node.np, node.memory,
+            ','.join(node.properties or []))
+
+def read_history_node_ids(conn):
+    '''return a dictionary with the node configurations in history_nodes
+       as keys, and their node IDs as values'''
+    node_ids = {}
+    for node_id, hostname, np, mem, properties in conn.execute(
+            '''SELECT node_id, hostname, np, mem, properties
+                   FROM history_nodes'''):
+        node_ids[(hostname, np, mem, properties)] = node_id
+    return node_ids
+
+def history_node_id(cursor, config, node_ids):
+    '''return the node ID of a node configuration, it is inserted into
+       history_nodes when it is not in node_ids yet'''
+    node_id = node_ids.get(config)
+    if node_id is None:
+        cursor.execute('''INSERT INTO history_nodes
+                              (hostname, np, mem, properties) VALUES
+                              (?, ?, ?, ?)''', config)
+        node_id = node_ids[config] = cursor.lastrowid
+    return node_id
+
+def node_sample(node):
+    '''return the state, load average, available memory, number of jobs
+       and time of the report for a node'''
+    status = parse_status(node.status or {})
+    if node.job_ids:
+        nr_jobs = len(set(node.job_ids))
+    else:
+        nr_jobs = 0
+    return (node.state, status.get('loadave'), status.get('availmem'),
+            nr_jobs, status.get('rectime'))
+
+def insert_sample(conn, nodes, sampletime, jobs=None, node_ids=None):
+    '''append a sample for the given nodes and, optionally, jobs to the
+       history database, node_ids are the IDs of the node configurations
+       as returned by read_history_node_ids, and are read if None;
+       returns the sample ID'''
+    cursor = conn.cursor()
+    sample_insert_cmd = '''INSERT INTO samples
+                               (sampletime, nr_nodes, nr_active_jobs,
+                                nr_eligible_jobs, nr_blocked_jobs) VALUES
+                               (?, ?, ?, ?, ?)'''
+    node_sample_insert_cmd = '''INSERT INTO node_samples
+                                    (sample_id, node_id, state, loadave,
+                                     availmem, nr_jobs, rectime) VALUES
+                                    (?, ?, ?, ?, ?, ?, ?)'''
+    if jobs is None:
+        jobs = {}
+    if node_ids is None:
+        node_ids = read_history_node_ids(conn)
+    nr_jobs = [len(jobs[job_state]) if job_state in jobs else None
+               for job_state in ('active', 'eligible', 'blocked')]
+    cursor.execute(sample_insert_cmd,
+                   [int(sampletime), len(nodes)] + nr_jobs)
+    sample_id = cursor.lastrowid
+    cursor.executemany(node_sample_insert_cmd,
+                       [(sample_id, history_node_id(cursor,
+                                                    node_config(node),
+                                                    node_ids)) +
+                        node_sample(node) for node in nodes])
+    cursor.close()
+    conn.commit()
+    return sample_id
+
+def sampletime_of(nodes, default_time):
+    '''the time of a sample is the most recent report time of its nodes,
+       or the given default if none is available'''
+    rectimes = [parse_status(node.status or {}).get('rectime')
+                for node in nodes]
+    rectimes = [rectime for rectime in rectimes if rectime]
+    if rectimes:
+        return max(rectimes)
+    else:
+        return default_time
+
+def replay_dumps(conn, dump_dir, pbsnodes_parser=None, is_verbose=False):
+    '''append a sample for each pbsnodes dump in the directory, in order
+       of the file names, returns the number of samples'''
+    if pbsnodes_parser is None:
+        pbsnodes_parser = PbsnodesParser()
+    node_ids = read_history_node_ids(conn)
+    nr_samples = 0
+    for file_name in sorted(os.listdir(dump_dir)):
+        dump_name = os.path.join(dump_dir, file_name)
+        if not os.path.isfile(dump_name):
+            continue
+        with open(dump_name, 'r') as dump_file:
+            nodes = pbsnodes_parser.parse_file(dump_file)
+        sampletime = sampletime_of(nodes, os.path.getmtime(dump_name))
+        insert_sample(conn, nodes, sampletime, node_ids=node_ids)
+        nr_samples += 1
+        if is_verbose:
+            msg = '{0}: {1:d} nodes sampled\n'
+            sys.stderr.write(msg.format(dump_name, len(nodes)))
+    return nr_samples
+
+def run_command(cmd):
+    '''run a command, returns its output, or None when it fails, since the
+       collector should survive hiccups of the resource manager'''
+    try:
+        return subprocess.check_output([cmd])
+    except (OSError, subprocess.CalledProcessError) as error:
+        msg = 'W: could not execute {0} ({1})\n'
+        sys.stderr.write(msg.format(cmd, str(error)))
+        return None
+
+def next_sample_time(sample_time, interval, now):
+    '''return the first time after now that is a whole number of
+       intervals after sample_time, so that slots that were missed because
+       sampling took longer than interval are skipped, rather than taken
+       in a burst'''
+    if interval <= 0:
+        return now
+    nr_intervals = int((now - sample_time)//interval) + 1
+    return sample_time + max(1, nr_intervals)*interval
+
+def collect(conn, pbsnodes_cmd, showq_cmd=None, interval=INTERVAL,
+            nr_samples=0, is_verbose=False):
+    '''sample pbsnodes and, optionally, showq every interval seconds, and
+       append the samples to the history database, stops after nr_samples
+       samples, or never if it is 0; a sample that takes longer than
+       interval delays the next one to the next whole interval; returns
+       the number of samples'''
+    pbsnodes_parser = PbsnodesParser()
+    showq_parser = ShowqParser()
+    node_ids = read_history_node_ids(conn)
+    sample_nr = 0
+    next_time = time.time()
+    while True:
+        node_output = run_command(pbsnodes_cmd)
+        if node_output is not None:
+            nodes = pbsnodes_parser.parse(node_output)
+            jobs = None
+            if showq_cmd:
+                job_output = run_command(showq_cmd)
+                if job_output is not None:
+                    jobs = showq_parser.parse(job_output)
+            insert_sample(conn, nodes, time.time(), jobs, node_ids)
+            sample_nr += 1
+            if is_verbose:
+                msg = '{0}: {1:d} nodes sampled\n'
+                sys.stderr.write(msg.format(time.ctime(), len(nodes)))
+            if nr_samples and sample_nr >= nr_samples:
+                break
+        next_time = next_sample_time(next_time, interval, time.time())
+        time.sleep(max(0.0, next_time - time.time()))
+    return sample_nr
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description=('collect node states in a '
+                                             'history database'))
+    arg_parser.add_argument('--db', default='history.db',
+                            help='file to store the history database in')
+    arg_parser.add_argument('--pbsnodes', default='/usr/local/bin/pbsnodes',
+                            help='pbsnodes command to use')
+    arg_parser.add_argument('--showq', help='showq command to use')
+    arg_parser.add_argument('--interval', type=float, default=INTERVAL,
+                            help='time between samples in seconds')
+    arg_parser.add_argument('--samples', type=int, default=0,
+                            help='number of samples to take, 0 for no limit')
+    arg_parser.add_argument('--replay',
+                            help='directory with pbsnodes dumps to replay')
+    arg_parser.add_argument('--verbose', action='store_true',
+                            help='show information for debugging')
+    options = arg_parser.parse_args()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    conn = open_history_db(options.db)
+    try:
+        if options.replay:
+            if not os.path.isdir(options.replay):
+                msg = "### error: '{0}' is not a directory\n"
+                sys.stderr.write(msg.format(options.replay))
+                sys.exit(NO_DUMP_DIR_ERROR)
+            replay_dumps(conn, options.replay, is_verbose=options.verbose)
+        else:
+            collect(conn, options.pbsnodes, options.showq, options.interval,
+                    options.samples, options.verbose)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+'''Cache for the output of commands that query the resource manager or
+   scheduler, e.g., pbsnodes, showq and checkjob, so that scripts that run
+   at the same time query them at most once per time-to-live window; the
+   output is stored compressed in a file per command and arguments, files
+   are replaced atomically, and a lock ensures that only one caller runs
+   a given command at a time; the cache directory is private to the user,
+   by default under ~/.cache, and it is not used when other users could
+   write to it, so that they can not plant output'''
+
+import errno, fcntl, gzip, hashlib, os, stat, subprocess, sys, tempfile
+import time
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME',
+                                        os.path.expanduser('~/.cache')),
+                         'vsc-cluster-db')
+CACHE_DIR_MODE = 0700
+TTL = 60
+CACHE_SUFFIX = '.gz'
+LOCK_SUFFIX = '.lock'
+
+class CommandCache(object):
+    '''Cache for command output with a time-to-live in seconds, a TTL of
+       0 or less disables caching'''
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl=TTL):
+        '''create a cache that stores its files in cache_dir'''
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def file_name(self, cmd):
+        '''return the name of the cache file for the command, given as a
+           list of the command and its arguments'''
+        key = hashlib.sha1('\0'.join(cmd)).hexdigest()
+        return os.path.join(self._cache_dir, key + CACHE_SUFFIX)
+
+    def _is_fresh(self, file_name):
+        '''check whether the cache file exists, and is younger than the
+           TTL'''
+        try:
+            age = time.time() - os.path.getmtime(file_name)
+        except OSError:
+            return False
+        return 0 <= age < self._ttl
+
+    def _read(self, file_name):
+        '''return the contents of a cache file'''
+        cache_file = gzip.open(file_name, 'rb')
+        try:
+            return cache_file.read()
+        finally:
+            cache_file.close()
+
+    def _write(self, file_name, output):
+        '''atomically replace the cache file by one with the given
+           output'''
+        tmp_fd, tmp_name = tempfile.mkstemp(dir=self._cache_dir,
+                                            prefix='.', suffix=CACHE_SUFFIX)
+        try:
+            with os.fdopen(tmp_fd, 'wb') as tmp_file:
+                gzip_file = gzip.GzipFile(fileobj=tmp_file, mode='wb',
+                                          compresslevel=1)
+                gzip_file.write(output)
+                gzip_file.close()
+            os.rename(tmp_name, file_name)
+        except:
+            os.remove(tmp_name)
+            raise
+
+    def _warn(self, reason):
+        '''warn that the cache can not be used, and why'''
+        msg = 'W: can not use cache directory {0} ({1})\n'
+        sys.stderr.write(msg.format(self._cache_dir, reason))
+
+    def _make_cache_dir(self):
+        '''create the cache directory, returns False if that fails, or if
+           the directory is not owned by the user, or other users can
+           write to it'''
+        try:
+            os.makedirs(self._cache_dir, CACHE_DIR_MODE)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                self._warn(str(error))
+                return False
+        try:
+            dir_stat = os.lstat(self._cache_dir)
+        except OSError as error:
+            self._warn(str(error))
+            return False
+        if not stat.S_ISDIR(dir_stat.st_mode):
+            self._warn('not a directory')
+            return False
+        if dir_stat.st_uid != os.getuid():
+            self._warn('owned by another user')
+            return False
+        if dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            self._warn('writable by other users')
+            return False
+        return True
+
+    def _read_fresh(self, file_name):
+        '''return the contents of the cache file if it is fresh, None if
+           it is not, or can not be read'''
+        if not self._is_fresh(file_name):
+            return None
+        try:
+            return self._read(file_name)
+        except (IOError, OSError) as error:
+            self._warn(str(error))
+            return None
+
+    def _open_lock(self, file_name):
+        '''open the lock file for the cache file, None if that fails'''
+        try:
+            return open(file_name + LOCK_SUFFIX, 'a')
+        except (IOError, OSError) as error:
+            self._warn(str(error))
+            return None
+
+    def check_output(self, cmd):
+        '''return the output of the command, given as a list of the
+           command and its arguments, from the cache if it is fresh,
+           otherwise the command is run, and its output cached; failures
+           raise subprocess.CalledProcessError or OSError as for
+           subprocess.check_output, and are not cached; when the cache
+           can not be used, the command is run directly'''
+        if self._ttl <= 0 or not self._make_cache_dir():
+            return subprocess.check_output(cmd)
+        file_name = self.file_name(cmd)
+        output = self._read_fresh(file_name)
+        if output is not None:
+            self.hits += 1
+            return output
+        lock_file = self._open_lock(file_name)
+        if lock_file is None:
+            return subprocess.check_output(cmd)
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                output = self._read_fresh(file_name)
+                if output is not None:
+                    self.hits += 1
+                    return output
+                self.misses += 1
+                output = subprocess.check_output(cmd)
+                try:
+                    self._write(file_name, output)
+                except (IOError, OSError) as error:
+                    self._warn(str(error))
+                return output
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _iter_file(self, file_name):
+        '''generator over the lines of a cache file'''
+        cache_file = gzip.open(file_name, 'rb')
+        try:
+            for line in cache_file:
+                yield line
+        finally:
+            cache_file.close()
+
+    def _iter_command(self, cmd, file_name=None):
+        '''generator over the lines of the command's output while it is
+           running, the output is cached in file_name if the command
+           succeeds'''
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        gzip_file = None
+        if file_name:
+            try:
+                tmp_fd, tmp_name = tempfile.mkstemp(dir=self._cache_dir,
+                                                    prefix='.',
+                                                    suffix=CACHE_SUFFIX)
+            except (IOError, OSError) as error:
+                self._warn(str(error))
+                file_name = None
+        if file_name:
+            tmp_file = os.fdopen(tmp_fd, 'wb')
+            gzip_file = gzip.GzipFile(fileobj=tmp_file, mode='wb',
+                                      compresslevel=1)
+        try:
+            for line in iter(process.stdout.readline, ''):
+                if gzip_file:
+                    gzip_file.write(line)
+                yield line
+            exit_status = process.wait()
+            if exit_status != 0:
+                raise subprocess.CalledProcessError(exit_status, cmd[0])
+            if gzip_file:
+                gzip_file.close()
+                tmp_file.close()
+                os.rename(tmp_name, file_name)
+                gzip_file = None
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if gzip_file:
+                gzip_file.close()
+                tmp_file.close()
+                os.remove(tmp_name)
+
+    def iter_output(self, cmd):
+        '''generator over the lines of the output of the command, given as
+           a list of the command and its arguments, from the cache if it
+           is fresh, otherwise the lines are yielded while the command is
+           running, and cached when it succeeds; the lock is held until
+           the output is consumed; when the cache can not be used, the
+           command is run directly'''
+        if self._ttl <= 0 or not self._make_cache_dir():
+            for line in self._iter_command(cmd):
+                yield line
+            return
+        file_name = self.file_name(cmd)
+        if self._is_fresh(file_name):
+            self.hits += 1
+            for line in self._iter_file(file_name):
+                yield line
+            return
+        lock_file = self._open_lock(file_name)
+        if lock_file is None:
+            for line in self._iter_command(cmd):
+                yield line
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._is_fresh(file_name):
+                    self.hits += 1
+                    lines = self._iter_file(file_name)
+                else:
+                    self.misses += 1
+                    lines = self._iter_command(cmd, file_name)
+                for line in lines:
+                    yield line
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+NO_CACHE = CommandCache(ttl=0)
@@ -2,15 +2,32 @@
 '''Functions to create a database to store information on nodes in
    a compute cluster with a PBS torque resource manager'''
 
-import sqlite3, sys
+import sqlite3, sys, zlib
+from contextlib import contextmanager
+
+SUMMARY_COLUMNS = [
+    'nr_nodes', 'nr_cores', 'mem', 'availmem', 'nr_free_cores',
+    'nr_free_nodes', 'nr_busy_nodes', 'nr_down_nodes',
+]
+SUMMARY_COLUMN_DEFS = ',\n                    '.join(
+    '{0} INTEGER NOT NULL'.format(column) for column in SUMMARY_COLUMNS
+)
 
 DB_DESC = {
+    'clusters': {
+        'create':
+            '''CREATE TABLE clusters
+                   (cluster_id INTEGER PRIMARY KEY,
+                    cluster_name TEXT NOT NULL UNIQUE)''',
+        'index': [],
+    },
     'partitions': {
         'create':
             '''CREATE TABLE partitions
                    (partition_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     partition_name TEXT NOT NULL,
-                    UNIQUE(partition_name))''',
+                    cluster_id INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE(cluster_id, partition_name))''',
         'index': [
             '''CREATE INDEX partition_idx
                    ON partitions(partition_name)'''
@@ -27,6 +44,10 @@ DB_DESC = {
                     np INTEGER NOT NULL,
                     ngpus INTEGER,
                     mem INTEGER NOT NULL,
+                    state TEXT,
+                    nr_used_cores INTEGER,
+                    content_hash TEXT,
+                    cluster_id INTEGER NOT NULL DEFAULT 0,
                     FOREIGN KEY(partition_id)
                         REFERENCES partitions(partition_id),
                     UNIQUE(hostname, partition_id))''',
@@ -35,30 +56,109 @@ DB_DESC = {
                    ON nodes(hostname, partition_id)'''
         ],
     },
+    'property_names': {
+        'create':
+            '''CREATE TABLE property_names
+                   (property_id INTEGER PRIMARY KEY,
+                    property TEXT NOT NULL UNIQUE)''',
+        'index': [],
+    },
+    'node_properties': {
+        'create':
+            '''CREATE TABLE node_properties
+                   (node_id INTEGER NOT NULL,
+                    property_id INTEGER NOT NULL,
+                    PRIMARY KEY(node_id, property_id),
+                    FOREIGN KEY(node_id) REFERENCES nodes(node_id),
+                    FOREIGN KEY(property_id)
+                        REFERENCES property_names(property_id))
+                   WITHOUT ROWID''',
+        'index': [
+            '''CREATE INDEX node_property_idx
+                   ON node_properties(property_id, node_id)'''
+        ],
+    },
     'properties': {
+        'type': 'view',
         'create':
-            '''CREATE TABLE properties
-                   (property_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    node_id INTEGER NOT NULL,
-                    property TEXT NOT NULL,
-                    FOREIGN KEY (node_id) REFERENCES nodes (node_id),
-                    UNIQUE (node_id, property))''',
+            '''CREATE VIEW properties AS
+                   SELECT node_id, property_id, property
+                       FROM node_properties
+                            JOIN property_names USING (property_id)''',
+        'index': [],
+    },
+    'feature_names': {
+        'create':
+            '''CREATE TABLE feature_names
+                   (feature_id INTEGER PRIMARY KEY,
+                    feature TEXT NOT NULL UNIQUE)''',
+        'index': [],
+    },
+    'node_features': {
+        'create':
+            '''CREATE TABLE node_features
+                   (node_id INTEGER NOT NULL,
+                    feature_id INTEGER NOT NULL,
+                    PRIMARY KEY(node_id, feature_id),
+                    FOREIGN KEY(node_id) REFERENCES nodes(node_id),
+                    FOREIGN KEY(feature_id)
+                        REFERENCES feature_names(feature_id))
+                   WITHOUT ROWID''',
         'index': [
-            '''CREATE INDEX property_idx
-                   ON properties (node_id, property)'''
+            '''CREATE INDEX node_feature_idx
+                   ON node_features(feature_id, node_id)'''
         ],
     },
     'features': {
+        'type': 'view',
         'create':
-            '''CREATE TABLE features
-                   (feature_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    node_id INTEGER NOT NULL,
-                    feature TEXT NOT NULL,
-                    FOREIGN KEY(node_id) REFERENCES nodes(node_id),
-                    UNIQUE(node_id, feature))''',
+            '''CREATE VIEW features AS
+                   SELECT node_id, feature_id, feature
+                       FROM node_features
+                            JOIN feature_names USING (feature_id)''',
+        'index': [],
+    },
+    'node_status': {
+        'create':
+            '''CREATE TABLE node_status
+                   (node_id INTEGER PRIMARY KEY,
+                    rectime INTEGER,
+                    state TEXT,
+                    loadave REAL,
+                    physmem INTEGER,
+                    availmem INTEGER,
+                    totmem INTEGER,
+                    ncpus INTEGER,
+                    nusers INTEGER,
+                    nsessions INTEGER,
+                    idletime INTEGER,
+                    netload INTEGER,
+                    FOREIGN KEY(node_id) REFERENCES nodes(node_id))''',
         'index': [
-            '''CREATE INDEX feature_idx
-                   ON features(node_id, feature)'''
+            '''CREATE INDEX node_status_state_idx
+                   ON node_status(state)''',
+            '''CREATE INDEX node_status_load_idx
+                   ON node_status(loadave)''',
+            '''CREATE INDEX node_status_mem_idx
+                   ON node_status(availmem)''',
+        ],
+    },
+    'node_checks': {
+        'create':
+            '''CREATE TABLE node_checks
+                   (node_id INTEGER PRIMARY KEY,
+                    state TEXT,
+                    cpuload REAL,
+                    conf_procs INTEGER,
+                    conf_mem INTEGER,
+                    util_procs INTEGER,
+                    util_mem INTEGER,
+                    ded_procs INTEGER,
+                    ded_mem INTEGER,
+                    FOREIGN KEY(node_id) REFERENCES nodes(node_id))''',
+        'index': [
+            '''CREATE INDEX node_check_state_idx
+                   ON node_checks(state)'''
         ],
     },
     'qos_levels': {
@@ -75,14 +175,16 @@ DB_DESC = {
     'jobs': {
         'create':
             '''CREATE TABLE jobs
-                   (job_id INTEGER PRIMARY KEY,
+                   (job_id INTEGER NOT NULL,
                     user TEXT NOT NULL,
                     state TEXT NOT NULL,
                     procs INTEGER NOT NULL,
                     remaining INTEGER,
                     starttime TEXT,
                     wclimit INTEGER,
-                    queuetime TEXT)''',
+                    queuetime TEXT,
+                    cluster_id INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY(cluster_id, job_id))''',
         'index': [
             '''CREATE INDEX job_idx
                    ON jobs(job_id, user)''',
@@ -90,54 +192,317 @@ DB_DESC = {
                    ON jobs(state)''',
         ],
     },
+    'held_jobs': {
+        'create':
+            '''CREATE TABLE held_jobs
+                   (job_id TEXT PRIMARY KEY,
+                    user TEXT NOT NULL,
+                    account TEXT,
+                    state TEXT NOT NULL,
+                    holds TEXT,
+                    checktime TEXT NOT NULL)''',
+        'index': [
+            '''CREATE INDEX held_job_user_idx
+                   ON held_jobs(user)''',
+        ],
+    },
     'running_jobs': {
         'create':
             '''CREATE TABLE running_jobs
-                   (job_id INTEGER,
-                    node_id INTEGER,
-                    FOREIGN KEY(job_id) REFERENCES jobs(job_id),
-                    FOREIGN KEY(node_id) REFERENCES nodes(node_id))''',
+                   (job_id INTEGER NOT NULL,
+                    node_id INTEGER NOT NULL,
+                    first_core INTEGER NOT NULL,
+                    nr_cores INTEGER NOT NULL,
+                    cluster_id INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY(node_id, first_core),
+                    FOREIGN KEY(cluster_id, job_id)
+                        REFERENCES jobs(cluster_id, job_id),
+                    FOREIGN KEY(node_id) REFERENCES nodes(node_id))
+                   WITHOUT ROWID''',
         'index': [
             '''CREATE INDEX running_job_idx
-                   ON running_jobs(job_id, node_id)''',
+                   ON running_jobs(cluster_id, job_id, node_id)''',
+        ],
+    },
+    'partition_summary': {
+        'create':
+            '''CREATE TABLE partition_summary
+                   (partition_id INTEGER PRIMARY KEY,
+                    {0},
+                    FOREIGN KEY(partition_id)
+                        REFERENCES partitions(partition_id))
+                   WITHOUT ROWID'''.format(SUMMARY_COLUMN_DEFS),
+        'index': [],
+    },
+    'rack_summary': {
+        'create':
+            '''CREATE TABLE rack_summary
+                   (cluster_id INTEGER,
+                    rack INTEGER,
+                    {0},
+                    PRIMARY KEY(cluster_id, rack))
+                   WITHOUT ROWID'''.format(SUMMARY_COLUMN_DEFS),
+        'index': [],
+    },
+    'iru_summary': {
+        'create':
+            '''CREATE TABLE iru_summary
+                   (cluster_id INTEGER,
+                    rack INTEGER,
+                    iru INTEGER,
+                    {0},
+                    PRIMARY KEY(cluster_id, rack, iru))
+                   WITHOUT ROWID'''.format(SUMMARY_COLUMN_DEFS),
+        'index': [],
+    },
+    'feature_summary': {
+        'create':
+            '''CREATE TABLE feature_summary
+                   (cluster_id INTEGER,
+                    feature_id INTEGER,
+                    {0},
+                    PRIMARY KEY(cluster_id, feature_id),
+                    FOREIGN KEY(feature_id)
+                        REFERENCES feature_names(feature_id))
+                   WITHOUT ROWID'''.format(SUMMARY_COLUMN_DEFS),
+        'index': [],
+    },
+}
+
+HISTORY_DB_DESC = {
+    'samples': {
+        'create':
+            '''CREATE TABLE samples
+                   (sample_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sampletime INTEGER NOT NULL,
+                    nr_nodes INTEGER NOT NULL,
+                    nr_active_jobs INTEGER,
+                    nr_eligible_jobs INTEGER,
+                    nr_blocked_jobs INTEGER)''',
+        'index': [
+            '''CREATE INDEX sample_time_idx
+                   ON samples(sampletime)'''
+        ],
+    },
+    'node_samples': {
+        'create':
+            '''CREATE TABLE node_samples
+                   (sample_id INTEGER NOT NULL,
+                    node_id INTEGER NOT NULL,
+                    state TEXT,
+                    loadave REAL,
+                    availmem INTEGER,
+                    nr_jobs INTEGER,
+                    rectime INTEGER,
+                    FOREIGN KEY(sample_id) REFERENCES samples(sample_id),
+                    FOREIGN KEY(node_id)
+                        REFERENCES history_nodes(node_id))''',
+        'index': [
+            '''CREATE INDEX node_sample_idx
+                   ON node_samples(node_id, sample_id)''',
+            '''CREATE INDEX node_sample_sample_idx
+                   ON node_samples(sample_id)''',
+        ],
+    },
+    'history_nodes': {
+        'create':
+            '''CREATE TABLE history_nodes
+                   (node_id INTEGER PRIMARY KEY,
+                    hostname TEXT NOT NULL,
+                    np INTEGER,
+                    mem INTEGER,
+                    properties TEXT,
+                    UNIQUE(hostname, np, mem, properties))''',
+        'index': [],
+    },
+    'job_samples': {
+        'create':
+            '''CREATE TABLE job_samples
+                   (sample_id INTEGER NOT NULL,
+                    job_id TEXT NOT NULL,
+                    user TEXT,
+                    state TEXT,
+                    procs INTEGER,
+                    FOREIGN KEY(sample_id) REFERENCES samples(sample_id))''',
+        'index': [
+            '''CREATE INDEX job_sample_idx
+                   ON job_samples(job_id, sample_id)''',
+            '''CREATE INDEX job_sample_sample_idx
+                   ON job_samples(sample_id)''',
         ],
     },
+    'snapshots': {
+        'create':
+            '''CREATE TABLE snapshots
+                   (snapshot TEXT PRIMARY KEY,
+                    sample_id INTEGER NOT NULL,
+                    FOREIGN KEY(sample_id) REFERENCES samples(sample_id))''',
+        'index': [],
+    },
+    'ingested_files': {
+        'create':
+            '''CREATE TABLE ingested_files
+                   (file_name TEXT PRIMARY KEY,
+                    snapshot TEXT NOT NULL,
+                    nr_rows INTEGER NOT NULL)''',
+        'index': [],
+    },
 }
 
-def init_table(conn, table_name, table_desc, force=False):
-    '''Create table and index according to description, drop table
-       if force is True, use connection'''
+_PREPARED_SCHEMAS = {}
+
+def prepare_schema(db_desc):
+    '''Order the tables and views of a database description, so that the
+       views are created after the tables, returns a list of (table_name,
+       table_desc) pairs; the list is prepared once per description'''
+    if id(db_desc) not in _PREPARED_SCHEMAS:
+        _PREPARED_SCHEMAS[id(db_desc)] = (db_desc, sorted(
+            db_desc.items(),
+            key=lambda item: item[1].get('type') == 'view'
+        ))
+    return _PREPARED_SCHEMAS[id(db_desc)][1]
+
+def schema_version(db_desc):
+    '''return the version of the schema of a database description, i.e.,
+       a positive 31-bit checksum of its statements, so that it changes
+       whenever the description does'''
+    checksum = 0
+    for table_name in sorted(db_desc):
+        table_desc = db_desc[table_name]
+        for stmt in [table_name, table_desc['create']] + table_desc['index']:
+            checksum = zlib.crc32(stmt, checksum)
+    return (checksum & 0x7fffffff) or 1
+
+def read_schema_version(conn):
+    '''return the schema version stored in the connection's database, 0
+       if none was stored, e.g., for a database created before versions
+       were introduced'''
+    return conn.execute('''PRAGMA user_version''').fetchone()[0]
+
+def has_schema(conn, db_desc):
+    '''Check whether the connection's database was created for the
+       current version of the database description'''
+    return read_schema_version(conn) == schema_version(db_desc)
+
+@contextmanager
+def schema_transaction(conn):
+    '''Execute the schema statements in the block in a single transaction,
+       since the sqlite3 module otherwise commits each of them separately;
+       a pending transaction is committed first'''
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    except:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
+    finally:
+        conn.isolation_level = isolation_level
+
+def has_table(conn, table_name):
+    '''Check whether the connection's database has the given table'''
+    cursor = conn.cursor()
+    cursor.execute('''SELECT count(*) FROM sqlite_master
+                          WHERE type = 'table' AND name = ?''',
+                   (table_name, ))
+    nr_tables = cursor.fetchone()[0]
+    cursor.close()
+    return nr_tables > 0
+
+def drop_table(cursor, table_name):
+    '''Drop a table or view, if it exists'''
+    cursor.execute('''SELECT type FROM sqlite_master
+                          WHERE type IN ('table', 'view') AND name = ?''',
+                   (table_name, ))
+    row = cursor.fetchone()
+    if row:
+        cursor.execute('''DROP {0} {1}'''.format(row[0].upper(),
+                                                 table_name))
+
+def init_table(conn, table_name, table_desc, force=False,
+               create_index=True):
+    '''Create table or view and index according to description, drop
+       table if force is True, use connection, indices are only created
+       when create_index is True; returns False if there was a problem'''
     cursor = conn.cursor()
     try:
         if force:
-            cursor.execute('''DROP TABLE {0}'''.format(table_name))
+            drop_table(cursor, table_name)
         cursor.execute(table_desc['create'])
-        for index_stmt in table_desc['index']:
-            cursor.execute(index_stmt)
+        if create_index:
+            for index_stmt in table_desc['index']:
+                cursor.execute(index_stmt)
     except sqlite3.OperationalError as error:
         msg = 'W: problem initializing table {0} ({1}), skipping\n'
         sys.stderr.write(msg.format(table_name, error.message))
-    cursor.close()
+        return False
+    finally:
+        cursor.close()
+    return True
 
-def init_db(conn, db_desc, force=False, create_jobs_tables=False):
+def init_db(conn, db_desc, force=False, create_jobs_tables=False,
+            create_indexes=True):
     '''Create tables and indices in the connection's database, drop tables
-       first when using force'''
-    for table_name, table_desc in db_desc.items():
-        if not table_name.endswith('jobs') or create_jobs_tables:
-            init_table(conn, table_name, table_desc, force)
+       first when using force, indices can be created later on using
+       init_indexes, e.g., after a bulk load; views are created after the
+       tables, all in a single transaction; when all tables were created,
+       the schema version is stored as the database's user_version'''
+    with schema_transaction(conn):
+        is_created = True
+        for table_name, table_desc in prepare_schema(db_desc):
+            if not table_name.endswith('jobs') or create_jobs_tables:
+                is_created &= init_table(conn, table_name, table_desc,
+                                         force, create_indexes)
+        if is_created:
+            conn.execute('''PRAGMA user_version = {0:d}'''.format(
+                schema_version(db_desc)
+            ))
 
-if __name__ == '__main__':
+def init_indexes(conn, db_desc, create_jobs_tables=False):
+    '''Create the indices for the tables in the connection's database,
+       typically after the tables were bulk loaded'''
+    with schema_transaction(conn):
+        cursor = conn.cursor()
+        for table_name, table_desc in prepare_schema(db_desc):
+            if not table_name.endswith('jobs') or create_jobs_tables:
+                for index_stmt in table_desc['index']:
+                    try:
+                        cursor.execute(index_stmt)
+                    except sqlite3.OperationalError as error:
+                        msg = 'W: problem creating index for {0} ({1})\n'
+                        sys.stderr.write(msg.format(table_name,
+                                                    error.message))
+        cursor.close()
+
+def main(argv=None, prog=None):
+    '''create the tables of a node database, argv are the command line
+       arguments, by default sys.argv[1:], prog is the program name in
+       messages'''
     from argparse import ArgumentParser
 
-    arg_parser = ArgumentParser(description=('create a database to store '
+    arg_parser = ArgumentParser(prog=prog,
+                                description=('create a database to store '
                                              'node information'))
     arg_parser.add_argument('--db', default='nodes.db',
                             help='file to store the database in')
     arg_parser.add_argument('--jobs', action='store_true',
                             help='create job-related tables')
+    arg_parser.add_argument('--history', action='store_true',
+                            help='create node state history tables instead')
     arg_parser.add_argument('--force', action='store_true',
                             help='when database exists, first drop tables')
-    options = arg_parser.parse_args()
+    options = arg_parser.parse_args(argv)
+    if options.history:
+        db_desc = HISTORY_DB_DESC
+    else:
+        db_desc = DB_DESC
     with sqlite3.connect(options.db) as conn:
-        init_db(conn, DB_DESC, force=options.force,
+        init_db(conn, db_desc, force=options.force,
                 create_jobs_tables=options.jobs)
+
+if __name__ == '__main__':
+    main()
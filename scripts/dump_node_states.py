@@ -1,58 +1,387 @@
 #!/usr/bin/env python
+'''Functions to dump the state of nodes, either from pbsnodes output
+   while it is being read, or from a node database, one row at a time, so
+   that memory use does not depend on the size of the cluster; rows can
+   be filtered by partition, rack and state, and are written as CSV, JSON
+   lines, or in a compact binary format, in chunks of CHUNK_SIZE bytes'''
 
-if __name__ == '__main__':
+import csv, json, struct, sys
+
+from load_node_db import exit_on_pbsnodes_error, stream_nodes
+from node_classifier import NodeClassifier
+from pbsnodes_jobs import core_ranges
+
+UNKNOWN_COLUMN_ERROR = 1
+INVALID_RACK_ERROR = 2
+
+COLUMN_TYPES = [
+    ('hostname', 's'),
+    ('partition', 's'),
+    ('rack', 'i'),
+    ('iru', 'i'),
+    ('np', 'i'),
+    ('mem', 'i'),
+    ('state', 's'),
+    ('cpuload', 'f'),
+    ('memload', 'f'),
+    ('jobs', 's'),
+]
+COLUMNS = [name for name, _ in COLUMN_TYPES]
+DEFAULT_COLUMNS = ['hostname', 'partition', 'rack', 'iru', 'np', 'mem',
+                   'cpuload', 'memload', 'jobs']
+FORMATS = ['csv', 'jsonl', 'binary']
+
+CHUNK_SIZE = 1 << 16
+FETCH_SIZE = 1024
+
+BINARY_MAGIC = 'VSCN'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<4sBB')
+BINARY_NULLS = struct.Struct('<H')
+BINARY_LENGTH = struct.Struct('<H')
+BINARY_VALUES = {'i': struct.Struct('<q'), 'f': struct.Struct('<d')}
+
+NODE_ROWS_QUERY = '''SELECT n.hostname, p.partition_name, n.rack, n.iru,
+                            n.np, n.mem, n.state,
+                            s.loadave/n.np,
+                            1.0 - CAST(s.availmem AS REAL)/s.totmem,
+                            {0}
+                         FROM nodes AS n
+                              JOIN partitions AS p USING (partition_id)
+                              LEFT JOIN node_status AS s USING (node_id)
+                         {1}
+                         ORDER BY n.node_id'''
+NODE_JOBS_EXPR = '''(SELECT group_concat(job_id)
+                                 FROM (SELECT job_id FROM running_jobs AS j
+                                           WHERE j.node_id = n.node_id
+                                           GROUP BY job_id
+                                           ORDER BY MIN(first_core)))'''
+
+def job_list(node):
+    '''return the IDs of the jobs running on a node as a comma-separated
+       string, ordered by the first core they use'''
+    if not node.jobs:
+        return ''
+    job_ids = []
+    for job_id, _, _ in core_ranges(node.jobs):
+        if job_id not in job_ids:
+            job_ids.append(job_id)
+    return ','.join(job_ids)
+
+def has_state(row_state, states):
+    '''check whether a node's state, e.g., down,offline, includes one of
+       the given states, None matches any state'''
+    if states is None:
+        return True
+    if not row_state:
+        return False
+    return any(state in states for state in row_state.split(','))
+
+def pbsnodes_rows(nodes, partitions, select_partitions=None, racks=None,
+                  states=None, classifier=None):
+    '''Generator over the rows of the nodes in pbsnodes output, ordered as
+       COLUMNS; only nodes in the selected partitions and racks, and with
+       one of the given states are included, None selects all'''
+    if classifier is None:
+        classifier = NodeClassifier(partitions)
+    for node in nodes:
+        partition, rack, iru, _ = classifier.classify(node)
+        if not partition:
+            continue
+        if (select_partitions is not None and
+                partition not in select_partitions or
+                racks is not None and rack not in racks):
+            continue
+        if not node.status:
+            msg = 'E: node {0} has no status\n'.format(node.hostname)
+            sys.stderr.write(msg)
+            continue
+        if not has_state(node.state, states):
+            continue
+        yield (node.hostname, partition, rack, iru, node.np, node.memory,
+               node.state, node.cpuload, node.memload, job_list(node))
+
+def db_rows(conn, select_partitions=None, racks=None, states=None,
+            fetch_size=FETCH_SIZE):
+    '''Generator over the rows of the nodes in a node database, ordered as
+       COLUMNS, rows are fetched fetch_size at a time; only nodes in the
+       selected partitions and racks, and with one of the given states are
+       included, None selects all'''
+    has_jobs = conn.execute(
+        '''SELECT COUNT(*) FROM sqlite_master
+               WHERE type = 'table' AND name = 'running_jobs' '''
+    ).fetchone()[0]
+    conditions, params = [], []
+    if select_partitions is not None:
+        conditions.append('p.partition_name IN ({0})'.format(
+            ', '.join('?'*len(select_partitions))
+        ))
+        params.extend(select_partitions)
+    if racks is not None:
+        conditions.append('n.rack IN ({0})'.format(', '.join('?'*len(racks))))
+        params.extend(racks)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    query = NODE_ROWS_QUERY.format(NODE_JOBS_EXPR if has_jobs else "''",
+                                   where)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                if has_state(row[6], states):
+                    yield row[:-1] + (row[-1] or '', )
+    finally:
+        cursor.close()
+
+class ChunkedWriter(object):
+    '''File-like object that collects strings, and writes them to the
+       underlying file in chunks of about chunk_size bytes'''
+
+    def __init__(self, out, chunk_size=CHUNK_SIZE):
+        '''create a writer to the file out'''
+        self._out = out
+        self._chunk_size = chunk_size
+        self._buffer = []
+        self._size = 0
+        self.nr_chunks = 0
+
+    def write(self, data):
+        '''add data, and write a chunk when enough data is collected'''
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self._chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''write the collected data'''
+        if self._buffer:
+            self._out.write(''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+            self.nr_chunks += 1
+        self._out.flush()
+
+def write_csv(writer, rows, columns, delimiter=';'):
+    '''write rows as CSV with a header line'''
+    csv_writer = csv.writer(writer, delimiter=delimiter,
+                            lineterminator='\n')
+    csv_writer.writerow(columns)
+    nr_rows = 0
+    for row in rows:
+        csv_writer.writerow(['' if value is None else value
+                             for value in row])
+        nr_rows += 1
+    return nr_rows
+
+def write_jsonl(writer, rows, columns):
+    '''write rows as JSON objects, one per line'''
+    nr_rows = 0
+    for row in rows:
+        writer.write(json.dumps(dict(zip(columns, row)),
+                                separators=(',', ':')))
+        writer.write('\n')
+        nr_rows += 1
+    return nr_rows
+
+def write_binary(writer, rows, columns):
+    '''write rows in the binary format: a header with the magic string,
+       the version and the number of columns, followed by the name and
+       type of each column; each row starts with a bit mask of the columns
+       that are NULL, followed by the other values, integers and floats
+       as 8 bytes, strings prefixed by their length, little endian'''
+    types = dict(COLUMN_TYPES)
+    column_types = [types[column] for column in columns]
+    writer.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                                    len(columns)))
+    for column, column_type in zip(columns, column_types):
+        writer.write(BINARY_LENGTH.pack(len(column)) + column + column_type)
+    pack_length = BINARY_LENGTH.pack
+    packers = [BINARY_VALUES[column_type].pack if column_type != 's'
+               else None for column_type in column_types]
+    nr_rows = 0
+    for row in rows:
+        nulls = 0
+        values = []
+        for i, value in enumerate(row):
+            if value is None:
+                nulls |= 1 << i
+            elif packers[i] is None:
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                else:
+                    value = str(value)
+                values.append(pack_length(len(value)) + value)
+            else:
+                values.append(packers[i](value))
+        writer.write(BINARY_NULLS.pack(nulls) + ''.join(values))
+        nr_rows += 1
+    return nr_rows
+
+def _read_exactly(in_file, size):
+    '''read size bytes from the file, a short read is an error'''
+    data = in_file.read(size)
+    if len(data) != size:
+        raise ValueError('truncated binary node dump')
+    return data
+
+def read_binary(in_file):
+    '''Generator over the rows of a binary node dump, the first item is
+       the list of column names, followed by the rows as tuples'''
+    magic, version, nr_columns = BINARY_HEADER.unpack(
+        _read_exactly(in_file, BINARY_HEADER.size)
+    )
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError('not a binary node dump')
+    columns, column_types = [], []
+    for _ in xrange(nr_columns):
+        length, = BINARY_LENGTH.unpack(
+            _read_exactly(in_file, BINARY_LENGTH.size)
+        )
+        columns.append(_read_exactly(in_file, length))
+        column_types.append(_read_exactly(in_file, 1))
+    yield columns
+    while True:
+        data = in_file.read(BINARY_NULLS.size)
+        if not data:
+            return
+        nulls, = BINARY_NULLS.unpack(data)
+        row = []
+        for i, column_type in enumerate(column_types):
+            if nulls & (1 << i):
+                row.append(None)
+            elif column_type == 's':
+                length, = BINARY_LENGTH.unpack(
+                    _read_exactly(in_file, BINARY_LENGTH.size)
+                )
+                row.append(_read_exactly(in_file, length))
+            else:
+                value_struct = BINARY_VALUES[column_type]
+                row.append(value_struct.unpack(
+                    _read_exactly(in_file, value_struct.size)
+                )[0])
+        yield tuple(row)
+
+def select_columns(rows, columns):
+    '''Generator over the rows restricted to the given columns'''
+    indices = [COLUMNS.index(column) for column in columns]
+    if indices == range(len(COLUMNS)):
+        return rows
+    return (tuple(row[i] for i in indices) for row in rows)
+
+def dump_rows(out, rows, columns=DEFAULT_COLUMNS, dump_format='csv',
+              chunk_size=CHUNK_SIZE, delimiter=';'):
+    '''write the given columns of the rows, ordered as COLUMNS, to the
+       file out in the given format, returns the number of rows'''
+    writer = ChunkedWriter(out, chunk_size)
+    rows = select_columns(rows, columns)
+    if dump_format == 'csv':
+        nr_rows = write_csv(writer, rows, columns, delimiter)
+    elif dump_format == 'jsonl':
+        nr_rows = write_jsonl(writer, rows, columns)
+    elif dump_format == 'binary':
+        nr_rows = write_binary(writer, rows, columns)
+    else:
+        raise ValueError('unknown format {0}'.format(dump_format))
+    writer.flush()
+    return nr_rows
+
+def split_option(value, convert=str):
+    '''split a comma-separated option value, None if it is not set'''
+    if value is None:
+        return None
+    return set(convert(item) for item in value.split(',') if item)
+
+def main(argv=None, prog=None):
+    '''dump the state of nodes, argv are the command line arguments, by default
+       sys.argv[1:], prog is the program name in messages'''
     from argparse import ArgumentParser
-    import subprocess, sys
+    from contextlib import closing
+    import time
 
-    from vsc.pbs.pbsnodes import PbsnodesParser
-    from vsc.pbs.utils import compute_partition
-    from vsc.utils import hostname2rackinfo
+    import command_cache
 
-    arg_parser = ArgumentParser(description=('prints node information'
-                                             ' as provided by pbsnodes'))
+    arg_parser = ArgumentParser(prog=prog,
+                                description=('dumps node information'
+                                             ' as provided by pbsnodes,'
+                                             ' or a node database'))
     arg_parser.add_argument('--pbsnodes_file', help='pbsnodes file')
+    arg_parser.add_argument('--db', help=('node database to dump, rather '
+                                          'than pbsnodes output'))
     arg_parser.add_argument('--partitions', default='thinking,gpu,phi',
                              help='partitions defined for the cluster')
+    arg_parser.add_argument('--partition',
+                            help='comma-separated partitions to dump')
+    arg_parser.add_argument('--rack', help='comma-separated racks to dump')
+    arg_parser.add_argument('--state',
+                            help='comma-separated node states to dump')
+    arg_parser.add_argument('--columns', default=','.join(DEFAULT_COLUMNS),
+                            help=('comma-separated columns to dump, from '
+                                  '{0}'.format(','.join(COLUMNS))))
+    arg_parser.add_argument('--format', dest='dump_format', default='csv',
+                            choices=FORMATS, help='output format')
+    arg_parser.add_argument('--delimiter', default=';',
+                            help='field delimiter for CSV output')
+    arg_parser.add_argument('--output', default='-',
+                            help='file to write to, - for standard output')
+    arg_parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE,
+                            help='size of the chunks written in bytes')
     arg_parser.add_argument('--pbsnodes', default='/usr/local/bin/pbsnodes',
                             help='pbsnodes command to use')
-    arg_parser.add_argument('--verbose', action='storetrue',
+    arg_parser.add_argument('--cache_dir', default=command_cache.CACHE_DIR,
+                            help='directory to cache command output in')
+    arg_parser.add_argument('--cache_ttl', type=float,
+                            default=command_cache.TTL,
+                            help=('time in seconds cached pbsnodes output '
+                                  'is used, 0 to disable'))
+    arg_parser.add_argument('--verbose', action='store_true',
                             help='show run time information')
-    options = arg_parser.parse_args()
-    partitions = options.partitions.split(',')
-    pbsnodes_parser = PbsnodesParser()
-    if options.pbsnodes_file:
-        with open(options.pbsnodes_file, 'r') as node_file:
-            nodes = pbsnodes_parser.parse_file(node_file)
+    options = arg_parser.parse_args(argv)
+    columns = options.columns.split(',')
+    for column in columns:
+        if column not in COLUMNS:
+            msg = '### error: unknown column {0}\n'.format(column)
+            sys.stderr.write(msg)
+            sys.exit(UNKNOWN_COLUMN_ERROR)
+    select_partitions = split_option(options.partition)
+    try:
+        racks = split_option(options.rack, int)
+    except ValueError:
+        sys.stderr.write('### error: racks should be integers\n')
+        sys.exit(INVALID_RACK_ERROR)
+    states = split_option(options.state)
+    start = time.time()
+    if not options.db:
+        cache = command_cache.CommandCache(options.cache_dir,
+                                           options.cache_ttl)
+        with exit_on_pbsnodes_error():
+            nodes = stream_nodes(options.pbsnodes, options.pbsnodes_file,
+                                 cache)
+    if options.output == '-':
+        out = sys.stdout
     else:
-        try:
-            node_output = subprocess.check_output([options.pbsnodes])
-            nodes = pbsnodes_parser.parse(node_output)
-            if options.verbose:
-                print '{0:d} nodes found'.format(len(nodes))
-        except subprocess.CalledProcessError:
-            sys.stderr.write('### error: could not execute pbsnodes\n')
-            sys.exit(1)
-    fields = ['hostname', 'partition', 'rack', 'iru', 'np', 'mem',
-                 'cpuload', 'memload', 'jobs']
-    fmt_str = ';'.join(['{{{0}}}'.format(x) for x in fields])
-    print ';'.join(fields)
-    for node in nodes:
-        partition_id = compute_partition(node, partitions)
-        rack, iru, _ = hostname2rackinfo(node.hostname)
-        if partition_id == 'thinking':
-            if node.status:
-                if node.jobs and len(node.jobs):
-                    job_ids = ','.join(node.job_ids)
-                else:
-                    job_ids = ''
-                print fmt_str.format(
-                    hostname=node.hostname,
-                    partition=partition_id,
-                    rack=rack, iru=iru,
-                    np=node.np, mem=node.memory,
-                    cpuload=node.cpuload, memload=node.memload,
-                    jobs=job_ids
-                )
-            else:
-                msg = 'E: node {0} has no status\n'.format(node.hostname)
-                sys.stderr.write(msg)
+        out = open(options.output, 'wb')
+    try:
+        if options.db:
+            import sqlite3
+            with closing(sqlite3.connect(options.db)) as conn:
+                rows = db_rows(conn, select_partitions, racks, states)
+                nr_rows = dump_rows(out, rows, columns, options.dump_format,
+                                    options.chunk_size, options.delimiter)
+        else:
+            rows = pbsnodes_rows(nodes, options.partitions.split(','),
+                                 select_partitions, racks, states)
+            with exit_on_pbsnodes_error():
+                nr_rows = dump_rows(out, rows, columns, options.dump_format,
+                                    options.chunk_size, options.delimiter)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if options.verbose:
+        msg = '{0:d} nodes dumped in {1:.3f} s\n'
+        sys.stderr.write(msg.format(nr_rows, time.time() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+'''Generator of synthetic pbsnodes and showq output for clusters of
+   arbitrary size, the node records are derived from those of a real
+   pbsnodes dump, e.g., the test data, with new hostnames, racks and
+   IRUs, and with jobs allocated to a configurable fraction of the nodes,
+   so that the scaling of loading and querying the database can be
+   measured'''
+
+import random, re, time
+
+PBSNODES_FILE = '../tests/test/data/pbsnodes.txt'
+NODES_PER_IRU = 16
+IRUS_PER_RACK = 4
+JOB_DENSITY = 0.7
+EXCLUSIVE_FRACTION = 0.6
+MAX_JOB_NODES = 8
+MAX_SHARED_JOBS = 4
+DOWN_FRACTION = 0.02
+QUEUED_FRACTION = 0.5
+BLOCKED_FRACTION = 0.2
+NR_USERS = 500
+FIRST_JOB_ID = 20000000
+SERVER = 'icts-p-svcs-1'
+BASE_TIME = 1410207630
+BLOCKED_STATES = ['SystemHold', 'BatchHold', 'UserHold']
+
+RACK_PROPERTY = re.compile(r'^r\d+$')
+IRU_PROPERTY = re.compile(r'^r\d+i\d+$')
+
+def read_templates(pbsnodes_file):
+    '''read the node records of a pbsnodes dump, returns a list of
+       records, each a list of (key, value) tuples, the hostname is
+       dropped'''
+    templates = []
+    record = None
+    for line in pbsnodes_file:
+        if not line.strip():
+            record = None
+        elif not line[0].isspace():
+            record = []
+            templates.append(record)
+        elif record is not None:
+            key, _, value = line.strip().partition(' = ')
+            record.append((key, value))
+    return templates
+
+def node_hostname(node_nr):
+    '''return the hostname, rack and IRU of the node with the given
+       sequence number, numbering starts at 0'''
+    rack = node_nr//(NODES_PER_IRU*IRUS_PER_RACK) + 1
+    iru = (node_nr//NODES_PER_IRU) % IRUS_PER_RACK
+    hostname = 'r{0:d}i{1:d}n{2:d}'.format(rack, iru,
+                                           node_nr % NODES_PER_IRU + 1)
+    return hostname, rack, iru
+
+def node_properties(properties, rack, iru, extra_properties, rng):
+    '''rename the rack and IRU properties of a template, and add each
+       extra property with its probability'''
+    new_properties = []
+    for node_property in properties.split(','):
+        if RACK_PROPERTY.match(node_property):
+            node_property = 'r{0:d}'.format(rack)
+        elif IRU_PROPERTY.match(node_property):
+            node_property = 'r{0:d}i{1:d}'.format(rack, iru)
+        new_properties.append(node_property)
+    for node_property, fraction in extra_properties:
+        if rng.random() < fraction:
+            new_properties.append(node_property)
+    return ','.join(new_properties)
+
+def format_duration(seconds):
+    '''format a duration in seconds as showq does, i.e., D:HH:MM:SS'''
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return '{0:d}:{1:02d}:{2:02d}:{3:02d}'.format(days, hours, minutes,
+                                                    seconds)
+    else:
+        return '{0:d}:{1:02d}:{2:02d}'.format(hours, minutes, seconds)
+
+def format_time(seconds):
+    '''format a time stamp as showq does'''
+    return time.strftime('%a %b %d %H:%M:%S', time.gmtime(seconds))
+
+class ClusterGenerator(object):
+    '''Generates the nodes of a synthetic cluster, and the jobs running
+       on them, as pbsnodes and showq output'''
+
+    def __init__(self, templates, nr_nodes, job_density=JOB_DENSITY,
+                 extra_properties=None, status_fields=None,
+                 down_fraction=DOWN_FRACTION, seed=None):
+        '''create a generator for nr_nodes nodes based on the template
+           records that have a status; job_density is the fraction of
+           nodes that run jobs, extra_properties a list of (property,
+           probability) tuples, status_fields the status fields to keep,
+           all if None, and seed makes the output reproducible'''
+        self._templates = [template for template in templates
+                           if 'status' in dict(template)]
+        self._nr_nodes = nr_nodes
+        self._job_density = job_density
+        self._extra_properties = extra_properties or []
+        self._status_fields = status_fields
+        self._down_fraction = down_fraction
+        self._rng = random.Random(seed)
+        self._next_job_id = FIRST_JOB_ID
+        self._jobs = {}
+        self._exclusive_job = None
+        self._nr_cores = 0
+        self._template = None
+
+    @property
+    def jobs(self):
+        '''dictionary with running job IDs as keys, and (user, number of
+           cores, start time, walltime) as values, complete after the
+           nodes were generated'''
+        return self._jobs
+
+    def _new_job(self, nr_cores):
+        '''create a running job using nr_cores cores, returns its ID'''
+        job_id = str(self._next_job_id)
+        self._next_job_id += 1
+        user = 'vsc{0:05d}'.format(30000 + self._rng.randrange(NR_USERS))
+        walltime = self._rng.choice([3600, 6*3600, 24*3600, 72*3600])
+        start_time = BASE_TIME - self._rng.randrange(walltime)
+        self._jobs[job_id] = [user, nr_cores, start_time, walltime]
+        return job_id
+
+    def _node_jobs(self, np):
+        '''allocate the cores of a node with np cores, returns a list of
+           (core, job ID) tuples'''
+        if self._rng.random() >= self._job_density:
+            self._exclusive_job = None
+            return []
+        if self._exclusive_job or self._rng.random() < EXCLUSIVE_FRACTION:
+            if self._exclusive_job:
+                job_id, nr_nodes = self._exclusive_job
+                self._jobs[job_id][1] += np
+            else:
+                job_id = self._new_job(np)
+                nr_nodes = self._rng.randint(1, MAX_JOB_NODES)
+            if nr_nodes > 1:
+                self._exclusive_job = (job_id, nr_nodes - 1)
+            else:
+                self._exclusive_job = None
+            return [(core, job_id) for core in xrange(np)]
+        allocation = []
+        core = 0
+        for _ in xrange(self._rng.randint(1, MAX_SHARED_JOBS)):
+            nr_cores = self._rng.randint(1, max(1, np//2))
+            nr_cores = min(nr_cores, np - core)
+            if nr_cores <= 0:
+                break
+            job_id = self._new_job(nr_cores)
+            allocation.extend((core + i, job_id) for i in xrange(nr_cores))
+            core += nr_cores
+        return allocation
+
+    def _status(self, status, hostname, np, allocation):
+        '''rewrite the status field of a template for the node'''
+        job_ids = sorted(set(job_id for _, job_id in allocation))
+        fields = []
+        for field in status.split(','):
+            key, sep, value = field.partition('=')
+            if not sep:
+                if fields:
+                    fields[-1] += ',' + field
+                continue
+            if self._status_fields is not None and \
+                    key not in self._status_fields:
+                continue
+            if key == 'rectime':
+                value = str(BASE_TIME + self._rng.randrange(60))
+            elif key == 'jobs':
+                value = ' '.join('{0}.{1}'.format(job_id, SERVER)
+                                 for job_id in job_ids)
+            elif key == 'loadave':
+                value = '{0:.2f}'.format(len(allocation) +
+                                         self._rng.random())
+            elif key == 'availmem':
+                totmem = int(re.search(r'totmem=(\d+)', status).group(1))
+                value = '{0:d}kb'.format(int(totmem*(
+                    1.0 - self._rng.random()*len(allocation)/float(np)
+                )))
+            elif key == 'uname':
+                value = re.sub(r' r\d+\S* ', ' {0} '.format(hostname),
+                               value, count=1)
+            fields.append('{0}={1}'.format(key, value))
+        return ','.join(fields)
+
+    def _node_record(self, node_nr):
+        '''return the pbsnodes record of a node as a string, all nodes of
+           an IRU have the same template, as in a real cluster'''
+        if node_nr % NODES_PER_IRU == 0:
+            self._template = self._rng.choice(self._templates)
+        template = self._template
+        hostname, rack, iru = node_hostname(node_nr)
+        np = int(dict(template).get('np', 1))
+        is_down = self._rng.random() < self._down_fraction
+        if is_down:
+            allocation = []
+            self._exclusive_job = None
+        else:
+            allocation = self._node_jobs(np)
+            self._nr_cores += np
+        lines = [hostname]
+        for key, value in template:
+            if key == 'state':
+                if is_down:
+                    value = 'down,offline'
+                elif len(allocation) == np:
+                    value = 'job-exclusive'
+                else:
+                    value = 'free'
+            elif key == 'properties':
+                value = node_properties(value, rack, iru,
+                                        self._extra_properties, self._rng)
+            elif key == 'jobs':
+                continue
+            elif key == 'status':
+                if allocation:
+                    lines.append('     jobs = {0}'.format(','.join(
+                        '{0:d}/{1}.{2}'.format(core, job_id, SERVER)
+                        for core, job_id in allocation
+                    )))
+                value = self._status(value, hostname, np, allocation)
+            lines.append('     {0} = {1}'.format(key, value))
+        return '\n'.join(lines) + '\n\n'
+
+    def write_pbsnodes(self, out):
+        '''write pbsnodes output for the nodes to the file out'''
+        for node_nr in xrange(self._nr_nodes):
+            out.write(self._node_record(node_nr))
+
+    def write_showq(self, out, queued_fraction=QUEUED_FRACTION,
+                    blocked_fraction=BLOCKED_FRACTION):
+        '''write showq output to the file out, the active jobs are those
+           that run on the nodes, so write_pbsnodes has to be called
+           first, the number of eligible and blocked jobs is a fraction
+           of the number of active jobs'''
+        fmt = '{0:<18s} {1:>10s} {2:>10s} {3:>5d} {4:>11s}  {5}\n'
+        nr_cores = 0
+        out.write('\nactive jobs------------------------\n')
+        out.write('JOBID              USERNAME      STATE PROCS   REMAINING'
+                  '            STARTTIME\n\n')
+        for job_id in sorted(self._jobs):
+            user, procs, start_time, walltime = self._jobs[job_id]
+            remaining = start_time + walltime - BASE_TIME
+            out.write(fmt.format(job_id, user, 'Running', procs,
+                                 format_duration(remaining),
+                                 format_time(start_time)))
+            nr_cores += procs
+        out.write('\n{0:d} active jobs        {1:d} of {2:d} processors in '
+                  'use by local jobs\n\n'.format(len(self._jobs), nr_cores,
+                                                 self._nr_cores))
+        nr_queued = int(len(self._jobs)*queued_fraction)
+        nr_blocked = int(nr_queued*blocked_fraction)
+        queued = []
+        for _ in xrange(nr_queued):
+            job_id = self._new_job(self._rng.choice([1, 4, 20, 40, 80]))
+            queued.append((job_id, self._jobs.pop(job_id)))
+        for title, jobs in [('eligible', queued[nr_blocked:]),
+                            ('blocked', queued[:nr_blocked])]:
+            out.write('{0} jobs----------------------\n'.format(title))
+            out.write('JOBID              USERNAME      STATE PROCS     '
+                      'WCLIMIT            QUEUETIME\n\n')
+            for job_id, (user, procs, start_time, walltime) in jobs:
+                if title == 'eligible':
+                    state = 'Idle'
+                else:
+                    state = self._rng.choice(BLOCKED_STATES)
+                out.write(fmt.format(job_id, user, state, procs,
+                                     format_duration(walltime),
+                                     format_time(start_time)))
+            out.write('\n{0:d} {1} jobs\n\n'.format(len(jobs), title))
+        out.write('Total jobs:  {0:d}\n'.format(len(self._jobs) +
+                                                nr_queued))
+
+def parse_extra_properties(properties_str):
+    '''parse a specification of extra properties, e.g., gpu:0.1,ssd:0.5,
+       into a list of (property, probability) tuples, the probability
+       defaults to 1'''
+    extra_properties = []
+    if properties_str:
+        for item in properties_str.split(','):
+            node_property, _, fraction = item.partition(':')
+            extra_properties.append((node_property,
+                                     float(fraction) if fraction else 1.0))
+    return extra_properties
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    arg_parser = ArgumentParser(description=('generates pbsnodes and showq '
+                                             'output for a synthetic '
+                                             'cluster'))
+    arg_parser.add_argument('--nodes', type=int, default=1000,
+                            help='number of nodes')
+    arg_parser.add_argument('--template', default=PBSNODES_FILE,
+                            help='pbsnodes file with template nodes')
+    arg_parser.add_argument('--pbsnodes_file', default='pbsnodes.txt',
+                            help='file to write pbsnodes output to')
+    arg_parser.add_argument('--showq_file', default='showq.txt',
+                            help='file to write showq output to')
+    arg_parser.add_argument('--job_density', type=float,
+                            default=JOB_DENSITY,
+                            help='fraction of nodes running jobs')
+    arg_parser.add_argument('--properties',
+                            help=('extra properties with probabilities, '
+                                  'e.g., ssd:0.5,ib:1'))
+    arg_parser.add_argument('--status_fields',
+                            help='comma-separated status fields to keep')
+    arg_parser.add_argument('--seed', type=int, help='random seed')
+    options = arg_parser.parse_args()
+    with open(options.template, 'r') as template_file:
+        templates = read_templates(template_file)
+    if options.status_fields:
+        status_fields = options.status_fields.split(',')
+    else:
+        status_fields = None
+    generator = ClusterGenerator(
+        templates, options.nodes, options.job_density,
+        parse_extra_properties(options.properties), status_fields,
+        seed=options.seed
+    )
+    with open(options.pbsnodes_file, 'w') as pbsnodes_file:
+        generator.write_pbsnodes(pbsnodes_file)
+    with open(options.showq_file, 'w') as showq_file:
+        generator.write_showq(showq_file)
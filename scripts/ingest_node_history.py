@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+'''Bulk ingest of archived pbsnodes and showq dumps into a history
+   database; dumps are read from a directory tree or a tarball, and parsed
+   in a pool of worker processes, while the main process is the single
+   writer; a dump's file name starts with pbsnodes or showq, and the rest
+   of its path identifies the snapshot, e.g., 2016/pbsnodes_0101T1200.txt
+   and 2016/showq_0101T1200.txt; dumps may be gzipped; static node data,
+   i.e., cores, memory and properties, is stored once per configuration
+   in history_nodes, which the node samples refer to, and the files that
+   were ingested are recorded in the same transaction as their rows, so
+   an interrupted ingest resumes where it stopped'''
+
+import gzip, os, sys, tarfile, time
+from contextlib import closing
+from multiprocessing import Pool
+from cStringIO import StringIO
+
+from vsc.pbs.pbsnodes import PbsnodesParser
+from vsc.moab.showq import ShowqParser
+from collect_node_history import (history_node_id, node_config,
+                                  node_sample, read_history_node_ids)
+
+NO_ARCHIVE_ERROR = 1
+
+DUMP_KINDS = ['pbsnodes', 'showq']
+JOB_STATES = ['active', 'eligible', 'blocked']
+BATCH_SIZE = 256
+CHUNK_SIZE = 4
+
+_parsers = {}
+
+def dump_kind(file_name):
+    '''return the kind of a dump, i.e., pbsnodes or showq, and the key of
+       its snapshot, derived from the file name, the kind is None for
+       other files'''
+    dir_name, base_name = os.path.split(file_name)
+    if base_name.endswith('.gz'):
+        base_name = base_name[:-len('.gz')]
+    for kind in DUMP_KINDS:
+        if base_name.startswith(kind):
+            snapshot = base_name[len(kind):].lstrip('._-')
+            return kind, os.path.join(dir_name, snapshot)
+    return None, None
+
+def iter_dir_dumps(dump_dir):
+    '''Generator over the dumps in a directory tree, in order of their
+       paths, yields (file name, kind, snapshot, mtime, path, data)
+       tuples, data is None, since workers read the file'''
+    for dir_name, dir_names, file_names in os.walk(dump_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(dir_name, file_name)
+            rel_name = os.path.relpath(path, dump_dir)
+            kind, snapshot = dump_kind(rel_name)
+            if kind:
+                yield (rel_name, kind, snapshot, os.path.getmtime(path),
+                       path, None)
+
+def iter_tar_dumps(tar_name):
+    '''Generator over the dumps in a tarball, in the order they are
+       stored, the tarball is read sequentially, so compressed tarballs
+       are decompressed only once; yields (file name, kind, snapshot,
+       mtime, path, data) tuples, path is None'''
+    with tarfile.open(tar_name, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            file_name = os.path.normpath(member.name)
+            kind, snapshot = dump_kind(file_name)
+            if kind:
+                data = tar.extractfile(member).read()
+                yield file_name, kind, snapshot, member.mtime, None, data
+
+def iter_dumps(archive):
+    '''Generator over the dumps in a directory tree or a tarball'''
+    if os.path.isdir(archive):
+        return iter_dir_dumps(archive)
+    else:
+        return iter_tar_dumps(archive)
+
+def open_dump(file_name, path, data):
+    '''return a file object to read a dump, either from path, or from
+       data, gzipped dumps are decompressed'''
+    if data is None:
+        if file_name.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        return open(path, 'r')
+    elif file_name.endswith('.gz'):
+        return gzip.GzipFile(fileobj=StringIO(data))
+    else:
+        return StringIO(data)
+
+def _parser(kind):
+    '''return the parser for a kind of dump, created once per process'''
+    if kind not in _parsers:
+        if kind == 'pbsnodes':
+            _parsers[kind] = PbsnodesParser()
+        else:
+            _parsers[kind] = ShowqParser()
+    return _parsers[kind]
+
+def parse_pbsnodes_dump(dump_file, mtime):
+    '''parse a pbsnodes dump, returns a dictionary with the time of the
+       sample, i.e., the most recent report time of the nodes, or mtime,
+       and the static data and state of each node'''
+    nodes = _parser('pbsnodes').parse_file(dump_file)
+    node_rows = [node_config(node) + node_sample(node) for node in nodes]
+    rectimes = [row[-1] for row in node_rows if row[-1]]
+    return {
+        'sampletime': int(max(rectimes) if rectimes else mtime),
+        'node_rows': node_rows,
+    }
+
+def parse_showq_dump(dump_file, mtime):
+    '''parse a showq dump, returns a dictionary with the time of the
+       sample, i.e., mtime, the number of jobs per state, and the jobs'''
+    jobs = _parser('showq').parse(dump_file.read())
+    return {
+        'sampletime': int(mtime),
+        'nr_jobs': [len(jobs[job_state]) if job_state in jobs else None
+                    for job_state in JOB_STATES],
+        'job_rows': [(str(job.id), job.username, job.state, job.procs)
+                     for job_state in JOB_STATES
+                     for job in jobs.get(job_state, [])],
+    }
+
+def parse_dump(dump):
+    '''parse a dump in a worker process, returns the file name, kind and
+       snapshot, a dictionary with the time of the sample and the rows,
+       and an error message, which is None if the dump could be parsed'''
+    file_name, kind, snapshot, mtime, path, data = dump
+    try:
+        with closing(open_dump(file_name, path, data)) as dump_file:
+            if kind == 'pbsnodes':
+                result = parse_pbsnodes_dump(dump_file, mtime)
+            else:
+                result = parse_showq_dump(dump_file, mtime)
+        return file_name, kind, snapshot, result, None
+    except Exception as error:
+        return file_name, kind, snapshot, None, str(error)
+
+class HistoryWriter(object):
+    '''Single writer that appends parsed dumps to a history database, the
+       pbsnodes and showq dump of a snapshot may arrive in any order, and
+       in separate runs'''
+
+    def __init__(self, conn):
+        '''create a writer for the history database, the snapshots, node
+           configurations and files that were already ingested are read'''
+        self._conn = conn
+        self._read_state()
+        self.nr_samples = 0
+        self.nr_rows = 0
+
+    def _read_state(self):
+        '''read the snapshots, node configurations and files that are in
+           the database'''
+        self._snapshots = dict(self._conn.execute(
+            '''SELECT snapshot, sample_id FROM snapshots'''
+        ).fetchall())
+        self._node_ids = read_history_node_ids(self._conn)
+        self.ingested = set(row[0] for row in self._conn.execute(
+            '''SELECT file_name FROM ingested_files'''
+        ))
+
+    def _sample_id(self, cursor, snapshot, sampletime):
+        '''return the sample ID of a snapshot, a sample is created if the
+           snapshot is new'''
+        sample_id = self._snapshots.get(snapshot)
+        if sample_id is None:
+            cursor.execute('''INSERT INTO samples
+                                  (sampletime, nr_nodes) VALUES (?, ?)''',
+                           (sampletime, 0))
+            sample_id = cursor.lastrowid
+            cursor.execute('''INSERT INTO snapshots
+                                  (snapshot, sample_id) VALUES (?, ?)''',
+                           (snapshot, sample_id))
+            self._snapshots[snapshot] = sample_id
+            self.nr_samples += 1
+        return sample_id
+
+    def add(self, file_name, kind, snapshot, result):
+        '''add the rows of a parsed dump, the transaction is committed
+           by commit'''
+        cursor = self._conn.cursor()
+        sample_id = self._sample_id(cursor, snapshot, result['sampletime'])
+        if kind == 'pbsnodes':
+            rows = result['node_rows']
+            cursor.execute('''UPDATE samples SET sampletime = ?, nr_nodes = ?
+                                  WHERE sample_id = ?''',
+                           (result['sampletime'], len(rows), sample_id))
+            node_rows = [(sample_id,
+                          history_node_id(cursor, row[:4], self._node_ids))
+                         + row[4:] for row in rows]
+            cursor.executemany('''INSERT INTO node_samples
+                                      (sample_id, node_id, state, loadave,
+                                       availmem, nr_jobs, rectime) VALUES
+                                      (?, ?, ?, ?, ?, ?, ?)''', node_rows)
+        else:
+            rows = result['job_rows']
+            cursor.execute('''UPDATE samples
+                                  SET nr_active_jobs = ?,
+                                      nr_eligible_jobs = ?,
+                                      nr_blocked_jobs = ?
+                                  WHERE sample_id = ?''',
+                           result['nr_jobs'] + [sample_id])
+            cursor.executemany('''INSERT INTO job_samples
+                                      (sample_id, job_id, user, state,
+                                       procs) VALUES
+                                      (?, ?, ?, ?, ?)''',
+                               [(sample_id, ) + row for row in rows])
+        cursor.execute('''INSERT INTO ingested_files
+                              (file_name, snapshot, nr_rows) VALUES
+                              (?, ?, ?)''',
+                       (file_name, snapshot, len(rows)))
+        cursor.close()
+        self.ingested.add(file_name)
+        self.nr_rows += len(rows)
+
+    def commit(self):
+        '''commit the dumps added so far'''
+        self._conn.commit()
+
+    def rollback(self):
+        '''discard the dumps added since the last commit'''
+        self._conn.rollback()
+        self._read_state()
+
+def _batches(dumps, batch_size):
+    '''Generator that groups dumps into lists of at most batch_size'''
+    batch = []
+    for dump in dumps:
+        batch.append(dump)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest(conn, dumps, nr_workers=None, batch_size=BATCH_SIZE,
+           chunk_size=CHUNK_SIZE, is_verbose=False):
+    '''parse the dumps in a pool of worker processes, and append them to
+       the history database, dumps that were ingested before are skipped;
+       dumps are handled in batches, so that at most batch_size dumps are
+       in memory, and each batch is committed; returns the number of dumps
+       ingested'''
+    writer = HistoryWriter(conn)
+    pool = Pool(nr_workers)
+    nr_dumps = 0
+    start = time.time()
+    try:
+        new_dumps = (dump for dump in dumps
+                     if dump[0] not in writer.ingested)
+        for batch in _batches(new_dumps, batch_size):
+            for file_name, kind, snapshot, result, error in pool.imap(
+                    parse_dump, batch, chunk_size):
+                if error is not None:
+                    msg = 'W: could not parse {0} ({1}), skipping\n'
+                    sys.stderr.write(msg.format(file_name, error))
+                    continue
+                writer.add(file_name, kind, snapshot, result)
+                nr_dumps += 1
+            writer.commit()
+            if is_verbose:
+                msg = '{0:d} dumps, {1:d} samples, {2:d} rows, {3:.1f} s\n'
+                sys.stderr.write(msg.format(nr_dumps, writer.nr_samples,
+                                            writer.nr_rows,
+                                            time.time() - start))
+        pool.close()
+    except:
+        writer.rollback()
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+    return nr_dumps
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from collect_node_history import open_history_db
+
+    arg_parser = ArgumentParser(description=('ingest archived pbsnodes and '
+                                             'showq dumps into a history '
+                                             'database'))
+    arg_parser.add_argument('--archive', required=True,
+                            help='directory or tarball with dumps')
+    arg_parser.add_argument('--db', default='history.db',
+                            help='file to store the history database in')
+    arg_parser.add_argument('--workers', type=int,
+                            help=('number of worker processes, default is '
+                                  'one per CPU'))
+    arg_parser.add_argument('--batch_size', type=int, default=BATCH_SIZE,
+                            help='number of dumps committed at once')
+    arg_parser.add_argument('--chunk_size', type=int, default=CHUNK_SIZE,
+                            help='number of dumps sent to a worker at once')
+    arg_parser.add_argument('--verbose', action='store_true',
+                            help='show progress information')
+    options = arg_parser.parse_args()
+    if not os.path.exists(options.archive):
+        msg = "### error: '{0}' does not exist\n"
+        sys.stderr.write(msg.format(options.archive))
+        sys.exit(NO_ARCHIVE_ERROR)
+    conn = open_history_db(options.db)
+    conn.execute('''PRAGMA synchronous = NORMAL''')
+    try:
+        nr_dumps = ingest(conn, iter_dumps(options.archive), options.workers,
+                          options.batch_size, options.chunk_size,
+                          options.verbose)
+        if options.verbose:
+            sys.stderr.write('{0:d} dumps ingested\n'.format(nr_dumps))
+    except KeyboardInterrupt:
+        sys.stderr.write('W: interrupted, rerun to resume\n')
+    finally:
+        conn.close()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+'''Functions to populate a single database with information on the nodes
+   of several compute clusters with PBS torque resource managers, each
+   cluster is collected and parsed in its own worker process, so that the
+   time to refresh the database is bounded by the slowest cluster rather
+   than the sum over all clusters'''
+
+import sys
+from multiprocessing import Pool
+
+from command_cache import CommandCache, NO_CACHE
+from load_node_db import (get_jobs, get_nodes, get_partitions,
+                          get_pbsnodes_cmd, get_qos_levels, get_showq_cmd,
+                          insert_jobs, insert_node_info_bulk,
+                          insert_partitions, read_config)
+
+NO_CLUSTERS_ERROR = 1
+CLUSTER_ERROR = 2
+
+def get_clusters(config):
+    '''Get the clusters from the configuration, i.e., a dictionary with
+       cluster names as keys, and for each the same configuration as
+       read_config returns for a single cluster'''
+    if config and config.get('clusters'):
+        return config['clusters']
+    else:
+        sys.stderr.write('### error: no clusters specified\n')
+        sys.exit(NO_CLUSTERS_ERROR)
+
+def collect_cluster(cluster_name, config, do_jobs=False, cache=NO_CACHE):
+    '''Collect and parse the node and, optionally, job information of a
+       cluster, either by running its pbsnodes and showq commands, or from
+       its pbsnodes_file and showq_file, returns a dictionary with the
+       partitions, QOS levels, nodes and jobs'''
+    cluster = {
+        'partitions': get_partitions(None, config),
+        'qos_levels': get_qos_levels(None, config),
+        'jobs': None,
+    }
+    pbsnodes_file_name = config.get('pbsnodes_file')
+    if pbsnodes_file_name:
+        pbsnodes_cmd = None
+    else:
+        pbsnodes_cmd = get_pbsnodes_cmd(None, config)
+    cluster['nodes'] = get_nodes(pbsnodes_cmd, pbsnodes_file_name,
+                                 cache=cache)
+    if do_jobs:
+        showq_file_name = config.get('showq_file')
+        if showq_file_name:
+            showq_cmd = None
+        else:
+            showq_cmd = get_showq_cmd(None, config)
+        cluster['jobs'] = get_jobs(showq_cmd, showq_file_name, cache=cache)
+    return cluster
+
+def _collect_cluster_worker(args):
+    '''run collect_cluster in a worker process, a SystemExit would kill
+       the worker, and block the pool, so it is returned instead'''
+    cluster_name, config, do_jobs, cache_dir, cache_ttl = args
+    try:
+        cluster = collect_cluster(cluster_name, config, do_jobs,
+                                  CommandCache(cache_dir, cache_ttl))
+        return cluster_name, cluster, None
+    except SystemExit as error:
+        return cluster_name, None, error.code
+
+def insert_cluster(conn, cluster_name, cluster, do_jobs=False):
+    '''insert a cluster, its partitions, QOS levels, nodes and jobs,
+       returns the cluster ID and the number of nodes'''
+    cursor = conn.cursor()
+    cursor.execute('''INSERT INTO clusters (cluster_name) VALUES (?)''',
+                   (cluster_name, ))
+    cluster_id = cursor.lastrowid
+    cursor.executemany('''INSERT OR IGNORE INTO qos_levels
+                              (qos) VALUES (?)''',
+                       [(qos, ) for qos in cluster['qos_levels']])
+    cursor.close()
+    partitions = insert_partitions(conn, cluster['partitions'], cluster_id)
+    nr_nodes = insert_node_info_bulk(conn, cluster['nodes'], partitions,
+                                     do_jobs, cluster_id=cluster_id)
+    if do_jobs:
+        insert_jobs(conn, cluster['jobs'], cluster_id)
+    return cluster_id, nr_nodes
+
+def load_clusters(conn, clusters, do_jobs=False, nr_workers=None,
+                  cache_dir=None, cache_ttl=0, is_verbose=False):
+    '''collect the clusters concurrently, one worker process per cluster
+       unless nr_workers is given, and insert each cluster as soon as it
+       is collected; returns a dictionary with cluster names as keys, and
+       the number of nodes as values'''
+    tasks = [(cluster_name, clusters[cluster_name], do_jobs, cache_dir,
+              cache_ttl)
+             for cluster_name in sorted(clusters)]
+    pool = Pool(nr_workers or len(tasks))
+    nr_nodes = {}
+    try:
+        for cluster_name, cluster, exit_code in pool.imap_unordered(
+                _collect_cluster_worker, tasks):
+            if cluster is None:
+                msg = '### error: could not collect cluster {0}\n'
+                sys.stderr.write(msg.format(cluster_name))
+                sys.exit(exit_code or CLUSTER_ERROR)
+            _, nr_nodes[cluster_name] = insert_cluster(conn, cluster_name,
+                                                       cluster, do_jobs)
+            if is_verbose:
+                msg = 'cluster {0}: {1:d} nodes inserted'
+                print msg.format(cluster_name, nr_nodes[cluster_name])
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return nr_nodes
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    import atexit, os.path, sqlite3
+    import command_cache, create_node_db, publish_node_db
+    from collect_cluster_info import PhaseTimer
+    from load_node_db import DB_EXISTS_ERROR, DB_INTEGRITY_ERROR
+
+    arg_parser = ArgumentParser(description=('loads a single database with '
+                                             'node information of several '
+                                             'clusters'))
+    arg_parser.add_argument('--conf', required=True,
+                            help=('JSON configuration file with a '
+                                  'configuration per cluster'))
+    arg_parser.add_argument('--db', default='nodes.db',
+                            help='file to store the database in')
+    arg_parser.add_argument('--jobs', action='store_true',
+                            help='create job-related tables')
+    arg_parser.add_argument('--force', action='store_true',
+                            help='force to create a new DB')
+    arg_parser.add_argument('--atomic', action='store_true',
+                            help=('build the DB in a snapshot file, and '
+                                  'atomically replace an existing DB by it'))
+    arg_parser.add_argument('--generations', type=int,
+                            default=publish_node_db.NR_GENERATIONS,
+                            help=('number of previous DBs to keep when '
+                                  'using --atomic'))
+    arg_parser.add_argument('--workers', type=int,
+                            help=('number of worker processes, default is '
+                                  'one per cluster'))
+    arg_parser.add_argument('--cache_dir', default=command_cache.CACHE_DIR,
+                            help='directory to cache command output in')
+    arg_parser.add_argument('--cache_ttl', type=float,
+                            default=command_cache.TTL,
+                            help=('time in seconds cached pbsnodes and '
+                                  'showq output is used, 0 to disable'))
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='report the wall-clock time of each phase')
+    arg_parser.add_argument('--verbose', action='store_true',
+                            help='show information for debugging')
+    options = arg_parser.parse_args()
+    timer = PhaseTimer()
+    clusters = get_clusters(read_config(options.conf, options.verbose))
+    if options.atomic:
+        db_name = publish_node_db.create_snapshot_file(options.db)
+        atexit.register(publish_node_db.remove_snapshot_file, db_name)
+    else:
+        db_name = options.db
+        if os.path.isfile(db_name) and not options.force:
+            msg = "### error: DB '{0}' already exists"
+            sys.stderr.write(msg.format(db_name))
+            sys.exit(DB_EXISTS_ERROR)
+    with sqlite3.connect(db_name) as conn:
+        with timer.phase('init_db'):
+            create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                   force=True,
+                                   create_jobs_tables=options.jobs,
+                                   create_indexes=False)
+        with timer.phase('load_clusters'):
+            load_clusters(conn, clusters, options.jobs, options.workers,
+                          options.cache_dir, options.cache_ttl,
+                          options.verbose)
+        with timer.phase('init_indexes'):
+            create_node_db.init_indexes(conn, create_node_db.DB_DESC,
+                                        create_jobs_tables=options.jobs)
+    if options.atomic:
+        with timer.phase('publish'):
+            problems = publish_node_db.check_integrity(db_name)
+            if problems:
+                msg = '### error: integrity check failed for {0}: {1}\n'
+                sys.stderr.write(msg.format(db_name, '; '.join(problems)))
+                sys.exit(DB_INTEGRITY_ERROR)
+            publish_node_db.publish_snapshot(db_name, options.db,
+                                             options.generations)
+    if options.timings:
+        timer.report()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+'''Metrics on the phases of a load of the node database, i.e., the
+   wall-clock time, the number of rows, the rows per second, and the peak
+   resident set size of the process up to the end of each phase, which
+   is cumulative, since the operating system only reports the peak over
+   the process' lifetime; metrics can be written as JSON, or in the
+   Prometheus textfile format so that they can be picked up by the node
+   exporter'''
+
+import json, os, resource, sys, tempfile, time
+from contextlib import contextmanager
+
+from collect_cluster_info import PhaseTimer
+
+FORMATS = ['json', 'prometheus']
+PROMETHEUS_PREFIX = 'vsc_cluster_db_load'
+
+def peak_rss():
+    '''return the peak resident set size of the process in bytes, Linux
+       reports ru_maxrss in kilobytes'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+class Phase(object):
+    '''Metrics of a single phase, the number of rows can be set by the
+       code that runs in the phase'''
+
+    def __init__(self, name, start, duration=None, rows=None):
+        '''create a phase that started at start seconds relative to the
+           start of the run'''
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.rows = rows
+        self.cumulative_peak_rss = None
+
+    @property
+    def rows_per_s(self):
+        '''number of rows per second, None if unknown'''
+        if self.rows is None or not self.duration:
+            return None
+        return self.rows/self.duration
+
+    def to_dict(self):
+        '''return the metrics of the phase as a dictionary'''
+        return {
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'rows': self.rows,
+            'rows_per_s': self.rows_per_s,
+            'cumulative_peak_rss': self.cumulative_peak_rss,
+        }
+
+class LoadMetrics(PhaseTimer):
+    '''Keeps track of the metrics of named phases, phases may run
+       concurrently in different threads, or be nested; a disabled
+       instance records nothing'''
+
+    def __init__(self, is_enabled=True):
+        '''create metrics, the start of the run is the time of creation'''
+        super(LoadMetrics, self).__init__()
+        self._is_enabled = is_enabled
+
+    @contextmanager
+    def phase(self, name):
+        '''context manager to measure a phase with the given name, yields
+           the Phase so that the number of rows can be set'''
+        start = time.time()
+        phase = Phase(name, start - self._start)
+        try:
+            yield phase
+        finally:
+            if self._is_enabled:
+                phase.duration = time.time() - start
+                phase.cumulative_peak_rss = peak_rss()
+                self._phases.append(phase)
+
+    def add(self, name, duration, rows=None):
+        '''add a phase that was timed by the caller, e.g., because it is
+           spread over many short intervals in a loop'''
+        if self._is_enabled:
+            phase = Phase(name, time.time() - self._start - duration,
+                          duration, rows)
+            phase.cumulative_peak_rss = peak_rss()
+            self._phases.append(phase)
+
+    def timed_iter(self, name, iterable):
+        '''generator that yields the items of iterable, the time spent
+           producing them is added as a phase with the given name, and
+           the number of items as its rows, once iterable is exhausted;
+           used when a phase is interleaved with the one that consumes
+           the items, e.g., reading output while inserting nodes'''
+        if not self._is_enabled:
+            for item in iterable:
+                yield item
+            return
+        duration, nr_items = 0.0, 0
+        items = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            finally:
+                duration += time.time() - start
+            nr_items += 1
+            yield item
+        self.add(name, duration, nr_items)
+
+    @property
+    def phases(self):
+        '''list of phases as (name, start, duration) tuples, ordered by
+           start time, times are in seconds, relative to the start of the
+           run'''
+        return [(phase.name, phase.start, phase.duration)
+                for phase in sorted(self._phases,
+                                    key=lambda phase: phase.start)]
+
+    def to_dict(self):
+        '''return the metrics as a dictionary'''
+        return {
+            'phases': [phase.to_dict()
+                       for phase in sorted(self._phases,
+                                           key=lambda phase: phase.start)],
+            'total': self.total,
+            'peak_rss': peak_rss(),
+        }
+
+    def to_json(self):
+        '''return the metrics in JSON format'''
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True) + '\n'
+
+    def to_prometheus(self, prefix=PROMETHEUS_PREFIX):
+        '''return the metrics in the Prometheus text format, phases with
+           the same name are added up'''
+        durations, rows, rss = {}, {}, {}
+        for phase in self._phases:
+            durations[phase.name] = (durations.get(phase.name, 0.0) +
+                                     phase.duration)
+            if phase.rows is not None:
+                rows[phase.name] = rows.get(phase.name, 0) + phase.rows
+            rss[phase.name] = max(rss.get(phase.name, 0),
+                                  phase.cumulative_peak_rss)
+        rows_per_s = dict((name, rows[name]/durations[name])
+                          for name in rows if durations[name] > 0)
+        lines = []
+        for metric, help_str, values in [
+                ('phase_seconds', 'wall-clock time of the load phase',
+                 durations),
+                ('phase_rows', 'number of rows processed in the phase',
+                 rows),
+                ('phase_rows_per_second', 'rows processed per second',
+                 rows_per_s),
+                ('phase_cumulative_peak_rss_bytes',
+                 'peak resident set size of the load up to the end of '
+                 'the phase', rss)]:
+            name = '{0}_{1}'.format(prefix, metric)
+            lines.append('# HELP {0} {1}'.format(name, help_str))
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.extend('{0}{{phase="{1}"}} {2!r}'.format(name, phase,
+                                                          values[phase])
+                         for phase in sorted(values))
+        for metric, help_str, value in [
+                ('seconds', 'wall-clock time of the load', self.total),
+                ('peak_rss_bytes', 'peak resident set size of the load',
+                 peak_rss())]:
+            name = '{0}_{1}'.format(prefix, metric)
+            lines.append('# HELP {0} {1}'.format(name, help_str))
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0} {1!r}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file_name, metrics_format='json'):
+        '''write the metrics in the given format to a file, the file is
+           replaced atomically, so that a collector never reads a partial
+           file; '-' writes to standard output'''
+        if metrics_format == 'prometheus':
+            output = self.to_prometheus()
+        else:
+            output = self.to_json()
+        if file_name == '-':
+            sys.stdout.write(output)
+            return
+        dir_name = os.path.dirname(os.path.abspath(file_name))
+        tmp_fd, tmp_name = tempfile.mkstemp(dir=dir_name, prefix='.')
+        try:
+            with os.fdopen(tmp_fd, 'w') as tmp_file:
+                tmp_file.write(output)
+            os.chmod(tmp_name, 0644)
+            os.rename(tmp_name, file_name)
+        except:
+            os.remove(tmp_name)
+            raise
+
+NO_METRICS = LoadMetrics(is_enabled=False)
@@ -2,13 +2,15 @@
 '''Functions to populate a database to store information on nodes in
    a compute cluster with a PBS torque resource manager'''
 
-import json, sys
+import itertools, json, subprocess, sys, time
+from contextlib import contextmanager
 
-from vsc.pbs.utils import compute_features, compute_partition
-from vsc.utils import hostname2rackinfo
-from vsc.pbs.pbsnodes import PbsnodesParser
-from vsc.moab.checknode import ChecknodeParser
-from vsc.moab.showq import ShowqParser
+from vsc.pbs.utils import compute_partition
+from command_cache import NO_CACHE
+from load_metrics import NO_METRICS
+from node_classifier import NodeClassifier, lookup_partition_id
+from pbsnodes_jobs import core_ranges
+from pbsnodes_status import STATUS_COLUMNS, status_row
 
 NO_CONFIG_FILE_ERROR = 1
 NO_PBSNODES_FILE_ERROR = 2
@@ -21,16 +23,49 @@ NO_PBSNODES_CMD_ERROR = 8
 NO_SHOWQ_CMD_ERROR = 9
 NO_CHECKNODE_CMD_ERROR = 10
 DB_EXISTS_ERROR = 11
+NO_CHECKNODE_FILE_ERROR = 12
+DB_INTEGRITY_ERROR = 13
 
-def insert_partitions(conn, partition_list):
-    '''insert partitions, and return a dictionary of partition names
-       and IDs'''
+NODE_STATUS_INSERT_CMD = '''INSERT INTO node_status
+                                (node_id, {0}) VALUES
+                                (?, {1})'''.format(
+    ', '.join(STATUS_COLUMNS), ', '.join('?'*len(STATUS_COLUMNS))
+)
+
+NODE_INSERT_CMD = '''INSERT INTO nodes
+                         (node_id, hostname, partition_id, rack, iru, np,
+                          mem, state, nr_used_cores, cluster_id)
+                     VALUES
+                         (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+NODE_PROPERTY_INSERT_CMD = '''INSERT INTO node_properties
+                                  (node_id, property_id) VALUES
+                                  (?, ?)'''
+NODE_FEATURE_INSERT_CMD = '''INSERT INTO node_features
+                                 (node_id, feature_id) VALUES
+                                 (?, ?)'''
+RUNNING_JOB_INSERT_CMD = '''INSERT INTO running_jobs
+                                (job_id, node_id, first_core, nr_cores,
+                                 cluster_id)
+                            VALUES
+                                (?, ?, ?, ?, ?)'''
+
+BULK_BATCH_SIZE = 5000
+BULK_PRAGMAS = [
+    ('journal_mode', 'MEMORY'),
+    ('synchronous', 'OFF'),
+    ('cache_size', -65536),
+]
+
+def insert_partitions(conn, partition_list, cluster_id=0):
+    '''insert partitions of the given cluster, and return a dictionary of
+       partition names and IDs'''
     cursor = conn.cursor()
     partition_insert_cmd = '''INSERT INTO partitions
-                                  (partition_name) VALUES (?)'''
+                                  (partition_name, cluster_id) VALUES
+                                  (?, ?)'''
     partitions = {}
     for partition_name in partition_list:
-        cursor.execute(partition_insert_cmd, (partition_name, ))
+        cursor.execute(partition_insert_cmd, (partition_name, cluster_id))
         partitions[partition_name] = cursor.lastrowid
     cursor.close()
     conn.commit()
@@ -46,72 +81,210 @@ def insert_qos_levels(conn, qos_levels):
     cursor.close()
     conn.commit()
 
-def insert_node_info(conn, nodes, partitions, do_jobs=False):
-    '''insert node information, including properties and features'''
+def read_names(conn, kind):
+    '''read the interned names of a kind, either 'property' or 'feature',
+       returns a dictionary of names and their IDs'''
+    query = '''SELECT {0}, {0}_id FROM {0}_names'''.format(kind)
+    return dict(conn.execute(query))
+
+def intern_name(cursor, names, kind, name):
+    '''return the ID of a property or feature name, the name is added to
+       the dictionary table of its kind, and to names if it is new'''
+    name_id = names.get(name)
+    if name_id is None:
+        name_insert_cmd = '''INSERT INTO {0}_names
+                                 ({0}) VALUES (?)'''.format(kind)
+        cursor.execute(name_insert_cmd, (name, ))
+        name_id = names[name] = cursor.lastrowid
+    return name_id
+
+def insert_node_info(conn, nodes, partitions, do_jobs=False,
+                     metrics=NO_METRICS, classifier=None, cluster_id=0):
+    '''insert node information, including properties and features, and
+       update the summary tables, nodes are part of the given cluster;
+       nodes are classified by the given NodeClassifier, or a new one for
+       the partitions; the time spent classifying nodes, and committing is
+       recorded in metrics; returns the number of nodes inserted'''
+    if classifier is None:
+        classifier = NodeClassifier(partitions)
     cursor = conn.cursor()
-    node_insert_cmd = '''INSERT INTO nodes
-                             (hostname, partition_id, rack, iru, np, mem)
-                         VALUES
-                             (?, ?, ?, ?, ?, ?)'''
-    prop_insert_cmd = '''INSERT INTO properties
-                             (node_id, property) VALUES
-                             (?, ?)'''
-    feature_insert_cmd = '''INSERT INTO features
-                                (node_id, feature) VALUES
-                                (?, ?)'''
-    running_job_insert_cmd = '''INSERT INTO running_jobs
-                                    (job_id, node_id) VALUES
-                                    (?, ?)'''
+    property_names = read_names(conn, 'property')
+    feature_names = read_names(conn, 'feature')
+    classify_time, nr_classified = 0.0, 0
+    nr_nodes = 0
     for node in nodes:
-        partition_id = compute_partition(node, partitions)
-        rack, iru, _ = hostname2rackinfo(node.hostname)
+        start = time.time()
+        partition_id, rack, iru, features = classifier.classify(node)
+        classify_time += time.time() - start
+        nr_classified += 1
         if partition_id:
             if node.status:
-                cursor.execute(node_insert_cmd, (node.hostname,
+                nr_nodes += 1
+                cursor.execute(NODE_INSERT_CMD, (None,
+                                                 node.hostname,
                                                  partition_id,
                                                  rack,
                                                  iru,
                                                  node.np,
-                                                 node.memory))
+                                                 node.memory,
+                                                 node.state,
+                                                 nr_used_cores(node),
+                                                 cluster_id))
                 node_id = cursor.lastrowid
+                cursor.execute(NODE_STATUS_INSERT_CMD,
+                               (node_id, ) + status_row(node.status))
                 for node_property in node.properties:
-                    cursor.execute(prop_insert_cmd,
-                                   (node_id, node_property))
-                for node_feature in compute_features(node):
-                    cursor.execute(feature_insert_cmd,
-                                   (node_id, node_feature))
+                    property_id = intern_name(cursor, property_names,
+                                              'property', node_property)
+                    cursor.execute(NODE_PROPERTY_INSERT_CMD,
+                                   (node_id, property_id))
+                for node_feature in features:
+                    feature_id = intern_name(cursor, feature_names,
+                                             'feature', node_feature)
+                    cursor.execute(NODE_FEATURE_INSERT_CMD,
+                                   (node_id, feature_id))
                 if do_jobs:
-                    for job_id in node.job_ids:
-                        cursor.execute(running_job_insert_cmd,
-                                       (job_id, node_id))
+                    for job_id, first_core, nr_cores in core_ranges(
+                            node.jobs):
+                        cursor.execute(RUNNING_JOB_INSERT_CMD,
+                                       (job_id, node_id, first_core,
+                                        nr_cores, cluster_id))
             else:
                 msg = 'E: node {0} has no status\n'.format(node.hostname)
                 sys.stderr.write(msg)
     cursor.close()
-    conn.commit()
+    metrics.add('classify', classify_time, nr_classified)
+    from summarize_node_db import update_summaries
+    with metrics.phase('commit'):
+        update_summaries(conn)
+        conn.commit()
+    return nr_nodes
 
-def insert_jobs(conn, jobs):
-    '''insert information on jobs, active and non-active'''
+def set_bulk_pragmas(conn, pragmas=None):
+    '''Apply PRAGMAs that speed up a bulk load at the expense of
+       durability, only use this on a database that is being created'''
+    if pragmas is None:
+        pragmas = BULK_PRAGMAS
+    cursor = conn.cursor()
+    for pragma, value in pragmas:
+        cursor.execute('''PRAGMA {0} = {1}'''.format(pragma, value))
+    cursor.close()
+
+def nr_used_cores(node):
+    '''return the number of cores of the node that run jobs'''
+    if node.jobs:
+        return len(node.jobs)
+    else:
+        return 0
+
+def node_partition_id(node, partitions):
+    '''Compute the partition ID of a node, partitions is a dictionary that
+       maps partition names to their IDs; returns None if the node is in
+       none of the partitions, for a node in several, the ID of the first
+       one compute_partition reports'''
+    return lookup_partition_id(compute_partition(node, partitions),
+                               partitions)
+
+def insert_node_info_bulk(conn, nodes, partitions, do_jobs=False,
+                          batch_size=BULK_BATCH_SIZE, cluster_id=0,
+                          metrics=NO_METRICS, classifier=None):
+    '''insert node information, including properties and features,
+       using executemany on batches of batch_size nodes, all in a single
+       transaction that also updates the summary tables, nodes are part
+       of the given cluster; nodes are classified by the given
+       NodeClassifier, or a new one for the partitions; the time spent
+       classifying nodes, and committing is recorded in metrics; returns
+       the number of nodes inserted'''
+    if classifier is None:
+        classifier = NodeClassifier(partitions)
+    cursor = conn.cursor()
+    property_names = read_names(conn, 'property')
+    feature_names = read_names(conn, 'feature')
+    cursor.execute('''SELECT max(node_id) FROM nodes''')
+    node_id = cursor.fetchone()[0] or 0
+    node_rows, status_rows, prop_rows = [], [], []
+    feature_rows, job_rows = [], []
+    nr_nodes = 0
+    classify_time, nr_classified = 0.0, 0
+
+    def flush():
+        '''write the buffered rows, and clear the buffers'''
+        cursor.executemany(NODE_INSERT_CMD, node_rows)
+        cursor.executemany(NODE_STATUS_INSERT_CMD, status_rows)
+        cursor.executemany(NODE_PROPERTY_INSERT_CMD, prop_rows)
+        cursor.executemany(NODE_FEATURE_INSERT_CMD, feature_rows)
+        if do_jobs:
+            cursor.executemany(RUNNING_JOB_INSERT_CMD, job_rows)
+        for rows in (node_rows, status_rows, prop_rows, feature_rows,
+                     job_rows):
+            del rows[:]
+
+    for node in nodes:
+        start = time.time()
+        partition_id, rack, iru, features = classifier.classify(node)
+        classify_time += time.time() - start
+        nr_classified += 1
+        if not partition_id:
+            continue
+        if not node.status:
+            msg = 'E: node {0} has no status\n'.format(node.hostname)
+            sys.stderr.write(msg)
+            continue
+        node_id += 1
+        nr_nodes += 1
+        node_rows.append((node_id, node.hostname, partition_id, rack, iru,
+                          node.np, node.memory, node.state,
+                          nr_used_cores(node), cluster_id))
+        status_rows.append((node_id, ) + status_row(node.status))
+        prop_rows.extend((node_id, intern_name(cursor, property_names,
+                                               'property', node_property))
+                         for node_property in node.properties)
+        feature_rows.extend((node_id, intern_name(cursor, feature_names,
+                                                  'feature', node_feature))
+                            for node_feature in features)
+        if do_jobs:
+            job_rows.extend((job_id, node_id, first_core, nr_cores,
+                             cluster_id)
+                            for job_id, first_core, nr_cores in
+                                core_ranges(node.jobs))
+        if len(node_rows) >= batch_size:
+            flush()
+    flush()
+    cursor.close()
+    metrics.add('classify', classify_time, nr_classified)
+    from summarize_node_db import update_summaries
+    with metrics.phase('commit'):
+        update_summaries(conn)
+        conn.commit()
+    return nr_nodes
+
+def insert_jobs(conn, jobs, cluster_id=0):
+    '''insert information on jobs, active and non-active, of the given
+       cluster'''
     cursor = conn.cursor()
     active_jobs_insert_cmd = '''INSERT INTO jobs
                                     (job_id, user, state, procs,
-                                     remaining, starttime) VALUES
-                                    (?, ?, ?, ?, ?, ?)'''
+                                     remaining, starttime, cluster_id)
+                                VALUES
+                                    (?, ?, ?, ?, ?, ?, ?)'''
     nonactive_jobs_insert_cmd = '''INSERT INTO jobs
                                        (job_id, user, state, procs,
-                                        wclimit, queuetime) VALUES
-                                       (?, ?, ?, ?, ?, ?)'''
+                                        wclimit, queuetime, cluster_id)
+                                   VALUES
+                                       (?, ?, ?, ?, ?, ?, ?)'''
     for job_state in jobs:
         if job_state == 'active':
             for job in jobs[job_state]:
                 cursor.execute(active_jobs_insert_cmd,
                                (job.id, job.username, job.state,
-                                job.procs, job.remaining, job.starttime))
+                                job.procs, job.remaining, job.starttime,
+                                cluster_id))
         else:
             for job in jobs[job_state]:
                 cursor.execute(nonactive_jobs_insert_cmd,
                                (job.id, job.username, job.state,
-                                job.procs, job.wclimit, job.queuetime))
+                                job.procs, job.wclimit, job.queuetime,
+                                cluster_id))
     conn.commit()
 
 def read_config(config_file_name, is_verbose=False):
@@ -130,54 +303,167 @@ def read_config(config_file_name, is_verbose=False):
             sys.exit(NO_CONFIG_FILE_ERROR)
     return config
 
-def get_nodes(pbsnodes_cmd, checknode_cmd, pbsnodes_file_name=None,
-              checknode_file_name=None, is_verbose=False):
-    '''Retrieve node information, either by running the pbsnodes command,
-       or reading the information from a file, returns a list of nodes'''
-    pbsnodes_parser = PbsnodesParser()
-    if pbsnodes_file_name:
-        try:
-            with open(pbsnodes_file_name, 'r') as node_file:
-                nodes = pbsnodes_parser.parse_file(node_file)
-        except IOError as error:
-            msg = '### error reading pbsnodes file:  {0}'
-            sys.stderr.write(msg.format(str(error)))
-            sys.exit(NO_PBSNODES_FILE_ERROR)
-    else:
-        try:
-            node_output = subprocess.check_output([pbsnodes_cmd])
-            nodes = pbsnodes_parser.parse(node_output)
-            if is_verbose:
-                print '{0:d} nodes found'.format(len(nodes))
-        except subprocess.CalledProcessError:
-            sys.stderr.write('### error: could not execute pbsnodes\n')
-            sys.exit(PBSNODES_CMD_ERROR)
-    checknodeParser = ChecknodeParser()
-    for node in nodes:
-        pass
+def get_nodes(pbsnodes_cmd, pbsnodes_file_name=None, is_verbose=False,
+              cache=NO_CACHE, metrics=NO_METRICS, pbsnodes_parser=None):
+    '''Retrieve node information, either by running the pbsnodes command
+       through the command cache, or reading the information from a file,
+       the collect and parse phases are recorded in metrics; the output is
+       parsed by the given parser, or a PbsnodesParser; returns a list of
+       nodes'''
+    if pbsnodes_parser is None:
+        from vsc.pbs.pbsnodes import PbsnodesParser
+        pbsnodes_parser = PbsnodesParser()
+    with metrics.phase('collect') as phase:
+        if pbsnodes_file_name:
+            try:
+                with open(pbsnodes_file_name, 'r') as node_file:
+                    node_output = node_file.read()
+            except IOError as error:
+                msg = '### error reading pbsnodes file:  {0}'
+                sys.stderr.write(msg.format(str(error)))
+                sys.exit(NO_PBSNODES_FILE_ERROR)
+        else:
+            try:
+                node_output = cache.check_output([pbsnodes_cmd])
+            except (OSError, subprocess.CalledProcessError):
+                sys.stderr.write('### error: could not execute pbsnodes\n')
+                sys.exit(PBSNODES_CMD_ERROR)
+        phase.rows = node_output.count('\n')
+    with metrics.phase('parse') as phase:
+        nodes = pbsnodes_parser.parse(node_output)
+        phase.rows = len(nodes)
+    if is_verbose:
+        print '{0:d} nodes found'.format(len(nodes))
     return nodes
 
-def get_jobs(showq_cmd, showq_file_name=None, is_verbose=False):
-    '''Retrieve job information, either by running the showq command,
-       or reading the information from a file'''
-    if showq_file_name:
-        try:
-            showq_parser = ShowqParser()
-            with open(showq_file_name, 'r') as job_file:
-                jobs = showq_parser.parse_file(job_file)
-        except IOError as error:
-            msg = '### error reading showq file:  {0}'
-            sys.stderr.write(msg.format(str(error)))
-            sys.exit(NO_SHOWQ_FILE_ERROR)
-    else:
-        try:
-            job_output = subprocess.check_output([showq_cmd])
-            jobs = showq_parser.parse(job_output)
-            if is_verbose:
-                print '{0:d} nodes found'.format(len(jobs))
-        except subprocess.CalledProcessError:
-            sys.stderr.write('### error: could not execute showq\n')
-            sys.exit(SHOWQ_CMD_ERROR)
+def iter_pbsnodes_records(lines):
+    '''Generator that groups lines of pbsnodes output into records, i.e.,
+       strings that describe a single node, records are separated by
+       blank lines'''
+    record = []
+    for line in lines:
+        if line.strip():
+            record.append(line)
+        elif record:
+            yield ''.join(record)
+            record = []
+    if record:
+        yield ''.join(record)
+
+def iter_nodes(lines, pbsnodes_parser=None, metrics=NO_METRICS):
+    '''Generator that parses pbsnodes output one record at a time, and
+       yields the nodes, the time spent parsing is recorded in metrics as
+       the parse phase'''
+    if pbsnodes_parser is None:
+        from vsc.pbs.pbsnodes import PbsnodesParser
+        pbsnodes_parser = PbsnodesParser()
+    parse_time, nr_nodes = 0.0, 0
+    for record in iter_pbsnodes_records(lines):
+        start = time.time()
+        nodes = pbsnodes_parser.parse(record)
+        parse_time += time.time() - start
+        for node in nodes:
+            nr_nodes += 1
+            yield node
+    metrics.add('parse', parse_time, nr_nodes)
+
+def _iter_file_lines(pbsnodes_file):
+    '''generator over the lines of an open file, that closes it when all
+       lines have been read'''
+    with pbsnodes_file:
+        for line in pbsnodes_file:
+            yield line
+
+def open_pbsnodes_output(pbsnodes_cmd, pbsnodes_file_name=None,
+                         cache=NO_CACHE):
+    '''Return an iterator over the lines of pbsnodes output, either of
+       the file, or of the command through the command cache; the file is
+       opened, or the command started and its first line read, before
+       this returns, so that a missing file raises IOError, and a command
+       that can not be run raises OSError or CalledProcessError right
+       away; the latter can also be raised while iterating'''
+    if pbsnodes_file_name:
+        return _iter_file_lines(open(pbsnodes_file_name, 'r'))
+    lines = cache.iter_output([pbsnodes_cmd])
+    first_lines = list(itertools.islice(lines, 1))
+    return itertools.chain(first_lines, lines)
+
+@contextmanager
+def exit_on_pbsnodes_error():
+    '''context manager that turns errors reading the pbsnodes output
+       into an error message, and exits'''
+    try:
+        yield
+    except IOError as error:
+        msg = '### error reading pbsnodes file:  {0}'
+        sys.stderr.write(msg.format(str(error)))
+        sys.exit(NO_PBSNODES_FILE_ERROR)
+    except (OSError, subprocess.CalledProcessError):
+        sys.stderr.write('### error: could not execute pbsnodes\n')
+        sys.exit(PBSNODES_CMD_ERROR)
+
+def stream_records(pbsnodes_cmd, pbsnodes_file_name=None, cache=NO_CACHE,
+                   metrics=NO_METRICS):
+    '''Return an iterator that yields pbsnodes records one at a time,
+       either while the pbsnodes command is still running, or while
+       reading the file or the cached output, the time spent reading is
+       recorded in metrics as the collect phase; errors are raised as by
+       open_pbsnodes_output'''
+    lines = open_pbsnodes_output(pbsnodes_cmd, pbsnodes_file_name, cache)
+    return iter_pbsnodes_records(metrics.timed_iter('collect', lines))
+
+def stream_nodes(pbsnodes_cmd, pbsnodes_file_name=None, cache=NO_CACHE,
+                 pbsnodes_parser=None, metrics=NO_METRICS):
+    '''Return an iterator that yields nodes one at a time, either while
+       the pbsnodes command is still running, or while reading the file,
+       so that only a single node is in memory, the collect and parse
+       phases are recorded in metrics; errors are raised as by
+       open_pbsnodes_output'''
+    lines = open_pbsnodes_output(pbsnodes_cmd, pbsnodes_file_name, cache)
+    return iter_nodes(metrics.timed_iter('collect', lines), pbsnodes_parser,
+                      metrics)
+
+def get_node_checks_file(checknode_file_name):
+    '''Retrieve checknode information for all nodes from a file that
+       contains the concatenated output of checknode'''
+    from collect_node_checks import read_node_checks
+    try:
+        with open(checknode_file_name, 'r') as checknode_file:
+            return read_node_checks(checknode_file)
+    except IOError as error:
+        msg = '### error reading checknode file:  {0}'
+        sys.stderr.write(msg.format(str(error)))
+        sys.exit(NO_CHECKNODE_FILE_ERROR)
+
+def get_jobs(showq_cmd, showq_file_name=None, is_verbose=False,
+             cache=NO_CACHE, metrics=NO_METRICS):
+    '''Retrieve job information, either by running the showq command
+       through the command cache, or reading the information from a
+       file, the collect_showq and parse_showq phases are recorded in
+       metrics'''
+    from vsc.moab.showq import ShowqParser
+    showq_parser = ShowqParser()
+    with metrics.phase('collect_showq') as phase:
+        if showq_file_name:
+            try:
+                with open(showq_file_name, 'r') as job_file:
+                    job_output = job_file.read()
+            except IOError as error:
+                msg = '### error reading showq file:  {0}'
+                sys.stderr.write(msg.format(str(error)))
+                sys.exit(NO_SHOWQ_FILE_ERROR)
+        else:
+            try:
+                job_output = cache.check_output([showq_cmd])
+            except (OSError, subprocess.CalledProcessError):
+                sys.stderr.write('### error: could not execute showq\n')
+                sys.exit(SHOWQ_CMD_ERROR)
+        phase.rows = job_output.count('\n')
+    with metrics.phase('parse_showq') as phase:
+        jobs = showq_parser.parse(job_output)
+        phase.rows = sum(len(jobs[job_state]) for job_state in jobs)
+    if is_verbose:
+        print '{0:d} jobs found'.format(phase.rows)
     return jobs
 
 def get_partitions(partition_str, config):
@@ -195,7 +481,7 @@ def get_qos_levels(qos_str, config):
     '''Get QOS levels, either from command line options, or from
        configuration file'''
     if qos_str:
-        return qos_levels.split(',')
+        return qos_str.split(',')
     elif config and 'qos_levels' in config:
         return config['qos_levels']
     else:
@@ -235,12 +521,16 @@ def get_showq_cmd(showq_str, config):
         sys.stderr.write('### error: no showq command specified\n')
         sys.exit(NO_SHOWQ_CMD_ERROR)
 
-if __name__ == '__main__':
+def main(argv=None, prog=None):
+    '''load a node database, argv are the command line arguments, by default
+       sys.argv[1:], prog is the program name in messages'''
     from argparse import ArgumentParser
-    import os.path, sqlite3, subprocess
-    import create_node_db
+    import atexit, os.path, sqlite3
+    import collect_node_checks, command_cache, load_metrics, publish_node_db
+    from collect_cluster_info import ConcurrentCollector
 
-    arg_parser = ArgumentParser(description=('loads a database with node '
+    arg_parser = ArgumentParser(prog=prog,
+                                description=('loads a database with node '
                                              'information'))
     arg_parser.add_argument('--conf', help='JSON configuration file')
     arg_parser.add_argument('--pbsnodes_file', help='pbsnodes file')
@@ -256,37 +546,261 @@ if __name__ == '__main__':
                             help='create job-related tables')
     arg_parser.add_argument('--force', action='store_true',
                             help='force to create a new DB')
+    arg_parser.add_argument('--update', action='store_true',
+                            help=('update an existing DB, only changed '
+                                  'rows are written'))
+    arg_parser.add_argument('--atomic', action='store_true',
+                            help=('build the DB in a snapshot file, and '
+                                  'atomically replace an existing DB by it'))
+    arg_parser.add_argument('--generations', type=int,
+                            default=publish_node_db.NR_GENERATIONS,
+                            help=('number of previous DBs to keep when '
+                                  'using --atomic'))
+    arg_parser.add_argument('--bulk', action='store_true',
+                            help=('bulk load nodes in a single transaction, '
+                                  'and create indices afterwards'))
+    arg_parser.add_argument('--batch_size', type=int,
+                            default=BULK_BATCH_SIZE,
+                            help='number of nodes per batch for bulk load')
+    arg_parser.add_argument('--bulk_pragmas', action='store_true',
+                            help=('use journal_mode, synchronous and '
+                                  'cache_size settings for fast loading'))
+    arg_parser.add_argument('--stream', action='store_true',
+                            help=('parse and insert nodes while pbsnodes '
+                                  'output is being read'))
+    arg_parser.add_argument('--native_parser', action='store_true',
+                            help=('parse pbsnodes output with the parser '
+                                  'of pbsnodes_parser.py, rather than '
+                                  'PbsnodesParser'))
+    arg_parser.add_argument('--parallel', action='store_true',
+                            help=('run pbsnodes, showq and, with '
+                                  '--checknode_all, checknode '
+                                  'concurrently'))
+    arg_parser.add_argument('--timings', action='store_true',
+                            help='report the wall-clock time of each phase')
+    arg_parser.add_argument('--metrics',
+                            help=('file to write the time, rows, rows/s '
+                                  'and cumulative peak RSS of each phase '
+                                  'to, - for standard output'))
+    arg_parser.add_argument('--metrics_format', default='json',
+                            choices=load_metrics.FORMATS,
+                            help='format of the metrics file')
+    arg_parser.add_argument('--profile',
+                            help=('file to write cProfile statistics of '
+                                  'loading the nodes and jobs to'))
     arg_parser.add_argument('--verbose', action='store_true',
                             help='show information for debugging')
     arg_parser.add_argument('--pbsnodes', help='pbsnodes command to use')
     arg_parser.add_argument('--checknode', help='checknode command to use')
+    arg_parser.add_argument('--checknodes', action='store_true',
+                            help='collect checknode information for nodes')
+    arg_parser.add_argument('--checknode_all', action='store_true',
+                            help=('run a single "checknode ALL" rather '
+                                  'than checknode for each node once the '
+                                  'nodes are loaded, --checknode_timeout '
+                                  'applies to that single call'))
+    arg_parser.add_argument('--checknode_workers', type=int,
+                            default=collect_node_checks.NR_WORKERS,
+                            help=('number of concurrent checknode commands '
+                                  'when run for each node'))
+    arg_parser.add_argument('--checknode_timeout', type=int,
+                            default=collect_node_checks.CHECKNODE_TIMEOUT,
+                            help='timeout in seconds for checknode')
     arg_parser.add_argument('--showq', help='showq command to use')
-    options = arg_parser.parse_args()
+    arg_parser.add_argument('--cache_dir', default=command_cache.CACHE_DIR,
+                            help='directory to cache command output in')
+    arg_parser.add_argument('--cache_ttl', type=float,
+                            default=command_cache.TTL,
+                            help=('time in seconds cached pbsnodes and '
+                                  'showq output is used, 0 to disable'))
+    options = arg_parser.parse_args(argv)
+    timer = load_metrics.LoadMetrics()
     config = read_config(options.conf, options.verbose)
     partition_list = get_partitions(options.partitions, config)
     qos_levels = get_qos_levels(options.qos_levels, config)
     pbsnodes_cmd = get_pbsnodes_cmd(options.pbsnodes, config)
-    checknode_cmd = get_checknode_cmd(options.checknode, config)
-    nodes = get_nodes(pbsnodes_cmd, checknode_cmd,
-                      pbsnodes_file_name=options.pbsnodes_file,
-                      checknode_file_name=options.checknode_file,
-                      is_verbose=options.verbose)
-    if not os.path.isfile(options.db):
+    if options.jobs:
+        showq_cmd = get_showq_cmd(options.showq, config)
+    if options.checknodes and not options.checknode_file:
+        checknode_cmd = get_checknode_cmd(options.checknode, config)
+    cache = command_cache.CommandCache(options.cache_dir, options.cache_ttl)
+    if options.native_parser:
+        from pbsnodes_parser import LOADER_FIELDS, PbsnodesRecordParser
+        pbsnodes_parser = PbsnodesRecordParser(LOADER_FIELDS)
+    else:
+        pbsnodes_parser = None
+    is_update = options.update and os.path.isfile(options.db)
+    is_rebuild = False
+    if is_update:
+        import create_node_db
         with sqlite3.connect(options.db) as conn:
-            create_node_db.init_db(conn, create_node_db.DB_DESC)
-    elif not options.force:
-        msg = "### error: DB '{0}' already exists"
-        sys.stderr.write(msg.format(options.db))
-        sys.exit(DB_EXISTS_ERROR)
+            is_update = create_node_db.has_schema(conn,
+                                                  create_node_db.DB_DESC)
+        if not is_update:
+            msg = ("W: DB '{0}' was created with another schema version, "
+                   "it is rebuilt\n")
+            sys.stderr.write(msg.format(options.db))
+            is_rebuild = True
+    collector = ConcurrentCollector(timer, options.parallel)
+    if not options.stream and not is_update:
+        collector.submit('pbsnodes', get_nodes, pbsnodes_cmd,
+                         options.pbsnodes_file, options.verbose, cache,
+                         timer, pbsnodes_parser)
+    if options.jobs:
+        collector.submit('showq', get_jobs, showq_cmd, options.showq_file,
+                         options.verbose, cache, timer)
+    if options.checknodes:
+        if options.checknode_file:
+            collector.submit('checknode', get_node_checks_file,
+                             options.checknode_file)
+        elif options.checknode_all:
+            collector.submit('checknode',
+                             collect_node_checks.collect_all_node_checks,
+                             checknode_cmd, options.checknode_timeout)
+
+    is_snapshot = options.atomic and not is_update
+    if is_snapshot:
+        db_name = publish_node_db.create_snapshot_file(options.db)
+        atexit.register(publish_node_db.remove_snapshot_file, db_name)
+    else:
+        db_name = options.db
+    if options.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if is_update:
+        import update_node_db
+        with sqlite3.connect(db_name) as conn:
+            with timer.phase('insert_partitions') as phase:
+                partitions = update_node_db.update_partitions(conn,
+                                                              partition_list)
+                phase.rows = len(partitions)
+            with timer.phase('insert_qos_levels') as phase:
+                update_node_db.update_qos_levels(conn, qos_levels)
+                phase.rows = len(qos_levels)
+            if options.jobs:
+                update_node_db.init_jobs_tables(conn)
+            node_hashes = update_node_db.read_node_hashes(conn)
+            record_hashes = {}
+            with exit_on_pbsnodes_error():
+                records = stream_records(pbsnodes_cmd, options.pbsnodes_file,
+                                         cache, timer)
+            nodes = update_node_db.iter_refreshed_nodes(records, node_hashes,
+                                                        record_hashes,
+                                                        pbsnodes_parser,
+                                                        timer)
+            with exit_on_pbsnodes_error():
+                with timer.phase('insert_node_info') as phase:
+                    stats = update_node_db.update_node_info(conn, nodes,
+                                                            partitions,
+                                                            options.jobs,
+                                                            record_hashes)
+                    phase.rows = stats['parsed']
+            if options.verbose:
+                msg = ('nodes: {inserted:d} inserted, {updated:d} updated, '
+                       '{deleted:d} deleted, {unchanged:d} unchanged, '
+                       '{status_updated:d} status updates, {skipped:d} '
+                       'skipped, {parsed:d} parsed')
+                print msg.format(**stats)
+            if options.jobs:
+                jobs = collector.result('showq')
+                with timer.phase('insert_jobs') as phase:
+                    stats = update_node_db.update_jobs(conn, jobs)
+                    phase.rows = sum(len(jobs[state]) for state in jobs)
+                if options.verbose:
+                    msg = ('jobs: {inserted:d} inserted, {updated:d} '
+                           'updated, {deleted:d} deleted')
+                    print msg.format(**stats)
     else:
-        with sqlite3.connect(self._file_name) as conn:
-            create_node_db.init_db(conn, create_node_db.DB_DESC, force=True)
-    with sqlite3.connect(options.db) as conn:
-        partitions = insert_partitions(conn, partition_list)
-        insert_qos_levels(conn, qos_levels)
-        insert_node_info(conn, nodes, partitions, options.jobs)
-        if options.jobs:
-            showq_cmd = get_showq_cmd(options.showq, config)
-            jobs = get_jobs(showq_cmd, options.showq_file,
-                            options.verbose)
-            insert_jobs(conn, jobs)
+        import create_node_db
+        create_indexes = not options.bulk
+        db_exists = os.path.isfile(options.db) and not options.atomic
+        if db_exists and not (options.force or is_rebuild):
+            msg = "### error: DB '{0}' already exists"
+            sys.stderr.write(msg.format(options.db))
+            sys.exit(DB_EXISTS_ERROR)
+        if options.stream:
+            with exit_on_pbsnodes_error():
+                nodes = stream_nodes(pbsnodes_cmd, options.pbsnodes_file,
+                                     cache, pbsnodes_parser, timer)
+        with timer.phase('init_db'):
+            with sqlite3.connect(db_name) as conn:
+                create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                       force=db_exists,
+                                       create_jobs_tables=options.jobs,
+                                       create_indexes=create_indexes)
+        with sqlite3.connect(db_name) as conn:
+            if options.bulk_pragmas:
+                set_bulk_pragmas(conn)
+            with timer.phase('insert_partitions') as phase:
+                partitions = insert_partitions(conn, partition_list)
+                phase.rows = len(partitions)
+            with timer.phase('insert_qos_levels') as phase:
+                insert_qos_levels(conn, qos_levels)
+                phase.rows = len(qos_levels)
+            with exit_on_pbsnodes_error():
+                if not options.stream:
+                    nodes = collector.result('pbsnodes')
+                with timer.phase('insert_node_info') as phase:
+                    if options.bulk:
+                        nr_nodes = insert_node_info_bulk(
+                            conn, nodes, partitions, options.jobs,
+                            options.batch_size, metrics=timer
+                        )
+                        if options.verbose:
+                            print '{0:d} nodes inserted'.format(nr_nodes)
+                    else:
+                        nr_nodes = insert_node_info(conn, nodes,
+                                                    partitions, options.jobs,
+                                                    metrics=timer)
+                    phase.rows = nr_nodes
+            if options.jobs:
+                jobs = collector.result('showq')
+                with timer.phase('insert_jobs') as phase:
+                    insert_jobs(conn, jobs)
+                    phase.rows = sum(len(jobs[state]) for state in jobs)
+            if options.bulk:
+                with timer.phase('init_indexes'):
+                    create_node_db.init_indexes(
+                        conn, create_node_db.DB_DESC,
+                        create_jobs_tables=options.jobs
+                    )
+    if options.profile:
+        profiler.disable()
+        profiler.dump_stats(options.profile)
+    if options.checknodes:
+        with sqlite3.connect(db_name) as conn:
+            if options.checknode_file or options.checknode_all:
+                node_checks = collector.result('checknode')
+            else:
+                hostnames = [row[0] for row in
+                             conn.execute('''SELECT hostname FROM nodes''')]
+                with timer.phase('checknode'):
+                    node_checks = collect_node_checks.collect_node_checks(
+                        checknode_cmd, hostnames,
+                        nr_workers=options.checknode_workers,
+                        timeout=options.checknode_timeout
+                    )
+            with timer.phase('insert_node_checks'):
+                nr_checks = collect_node_checks.insert_node_checks(
+                    conn, node_checks
+                )
+            if options.verbose:
+                print '{0:d} node checks inserted'.format(nr_checks)
+    collector.close()
+    if is_snapshot:
+        with timer.phase('publish'):
+            problems = publish_node_db.check_integrity(db_name)
+            if problems:
+                msg = '### error: integrity check failed for {0}: {1}\n'
+                sys.stderr.write(msg.format(db_name, '; '.join(problems)))
+                sys.exit(DB_INTEGRITY_ERROR)
+            publish_node_db.publish_snapshot(db_name, options.db,
+                                             options.generations)
+    if options.timings:
+        timer.report()
+    if options.metrics:
+        timer.write(options.metrics, options.metrics_format)
+
+if __name__ == '__main__':
+    main()
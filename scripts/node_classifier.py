@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+'''Memoized classification of nodes, i.e., their partition, features,
+   rack and IRU; a cluster has only a few distinct combinations of
+   properties and resources, so compute_partition and compute_features
+   are called once per combination, and classifying a node is mostly a
+   dictionary lookup; the rack information is cached per rack and IRU
+   prefix of the hostname, e.g., r1i0 for r1i0n1, which is extracted by a
+   precompiled regular expression, other hostnames are cached as is'''
+
+import re
+
+from vsc.pbs.utils import compute_features, compute_partition
+from vsc.utils import hostname2rackinfo
+
+CACHE_SIZE = 16384
+HOSTNAME_CACHE_SIZE = 16384
+
+RACK_PREFIX_RE = re.compile(r'(r\d+(?:i\d+)?)n\d+$')
+
+def lookup_partition_id(partition, partition_ids):
+    '''return the ID of a partition as computed by compute_partition, i.e.,
+       None, a name, or several names as a list or comma-separated, given
+       a dictionary that maps partition names to their IDs; for several
+       names, the ID of the first known one is returned, None if there is
+       none'''
+    if not partition:
+        return None
+    if isinstance(partition, basestring):
+        partition = partition.split(',')
+    for name in partition:
+        if name in partition_ids:
+            return partition_ids[name]
+    return None
+
+class NodeClassifier(object):
+    '''Classifies nodes for a given set of partitions, results are cached
+       by the node's properties, number of cores, memory and GPUs; caches
+       are bounded, and are cleared when they are full'''
+
+    def __init__(self, partitions, cache_size=CACHE_SIZE,
+                 hostname_cache_size=HOSTNAME_CACHE_SIZE):
+        '''create a classifier, partitions is either a list of partition
+           names, or a dictionary that maps partition names to their
+           IDs'''
+        self._partitions = partitions
+        self._cache_size = cache_size
+        self._hostname_cache_size = hostname_cache_size
+        self._classes = {}
+        self._rack_info = {}
+        self.hits = 0
+        self.misses = 0
+        self.hostname_hits = 0
+        self.hostname_misses = 0
+
+    @staticmethod
+    def node_key(node):
+        '''return the key that determines the partition and features of a
+           node'''
+        return (tuple(node.properties), node.np, node.memory,
+                getattr(node, 'gpus', None))
+
+    def _compute_class(self, node):
+        '''compute the partition ID and features of a node'''
+        partition = compute_partition(node, self._partitions)
+        if isinstance(self._partitions, dict):
+            partition_id = lookup_partition_id(partition, self._partitions)
+        else:
+            partition_id = partition
+        return partition_id, tuple(compute_features(node))
+
+    def node_class(self, node):
+        '''return the partition ID, or name if partitions is a list, and
+           the features of a node as a tuple'''
+        key = self.node_key(node)
+        node_class = self._classes.get(key)
+        if node_class is None:
+            self.misses += 1
+            node_class = self._compute_class(node)
+            if len(self._classes) >= self._cache_size:
+                self._classes.clear()
+            self._classes[key] = node_class
+        else:
+            self.hits += 1
+        return node_class
+
+    def rack_info(self, hostname):
+        '''return the rack and IRU of the node with the given hostname,
+           nodes with the same rack and IRU prefix share the result'''
+        match = RACK_PREFIX_RE.match(hostname)
+        key = match.group(1) if match else hostname
+        rack_info = self._rack_info.get(key)
+        if rack_info is None:
+            self.hostname_misses += 1
+            rack, iru, _ = hostname2rackinfo(hostname)
+            rack_info = (rack, iru)
+            if len(self._rack_info) >= self._hostname_cache_size:
+                self._rack_info.clear()
+            self._rack_info[key] = rack_info
+        else:
+            self.hostname_hits += 1
+        return rack_info
+
+    def classify(self, node):
+        '''return the partition ID, rack, IRU and features of a node, the
+           partition ID is None, and the other values are not computed if
+           the node is in none of the partitions'''
+        partition_id, features = self.node_class(node)
+        if not partition_id:
+            return None, None, None, ()
+        rack, iru = self.rack_info(node.hostname)
+        return partition_id, rack, iru, features
+
+    @property
+    def cache_stats(self):
+        '''hits, misses and sizes of the classification and hostname
+           caches'''
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'size': len(self._classes),
+            'hostname_hits': self.hostname_hits,
+            'hostname_misses': self.hostname_misses,
+            'hostname_size': len(self._rack_info),
+        }
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+'''Read-side API to query a database with information on nodes in a
+   compute cluster, the tables described by create_node_db.DB_DESC are
+   read once into memory, lookups by partition, property, feature and
+   resources are precomputed, as is the occupancy of nodes by running
+   jobs if the database has it, and answers to repeated questions are
+   cached; the snapshot is reloaded automatically when the database file
+   is replaced or modified; in a database with several clusters, nodes
+   and jobs are looked up by hostname or job ID within a cluster'''
+
+import os, sqlite3
+from collections import namedtuple, OrderedDict
+from contextlib import closing
+
+CACHE_SIZE = 1024
+
+Node = namedtuple('Node', ['node_id', 'hostname', 'partition', 'rack',
+                           'iru', 'np', 'ngpus', 'mem', 'properties',
+                           'features', 'cluster'])
+
+def _has_table(conn, table_name):
+    '''check whether the database has a table with the given name'''
+    return conn.execute(
+        '''SELECT COUNT(*) FROM sqlite_master
+               WHERE type = 'table' AND name = ?''', (table_name, )
+    ).fetchone()[0] > 0
+
+class LRUCache(object):
+    '''Least recently used cache with a bounded size that keeps track of
+       hits and misses'''
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        '''create an empty cache that holds at most maxsize items'''
+        self._maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        '''return the value for the key, if it is not in the cache, it is
+           computed by calling compute without arguments, and stored'''
+        try:
+            value = self._items.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = compute()
+            self.misses += 1
+            if len(self._items) >= self._maxsize:
+                self._items.popitem(last=False)
+        self._items[key] = value
+        return value
+
+    def clear(self):
+        '''remove all items from the cache'''
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+def parse_nodes_spec(nodes_spec):
+    '''parse a PBS nodes specification, e.g., 4:ppn=20:mem128, returns the
+       number of nodes, the number of cores per node, and a list of
+       required properties or features'''
+    if nodes_spec.startswith('nodes='):
+        nodes_spec = nodes_spec[len('nodes='):]
+    parts = nodes_spec.split(':')
+    if parts[0].isdigit():
+        nr_nodes = int(parts.pop(0))
+    else:
+        nr_nodes = 1
+    ppn = 1
+    required = []
+    for part in parts:
+        if part.startswith('ppn='):
+            ppn = int(part[len('ppn='):])
+        elif part:
+            required.append(part)
+    return nr_nodes, ppn, required
+
+class NodeDB(object):
+    '''In-memory snapshot of a node database with precomputed lookups and
+       an LRU cache for queries'''
+
+    def __init__(self, db_name, cache_size=CACHE_SIZE):
+        '''create a snapshot of the database with the given file name'''
+        self._db_name = db_name
+        self._cache = LRUCache(cache_size)
+        self._signature = None
+        self.nr_loads = 0
+        self._check_snapshot()
+
+    def _file_signature(self):
+        '''identifies a version of the database file'''
+        stat = os.stat(self._db_name)
+        return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+    def _check_snapshot(self):
+        '''reload the snapshot if the database file changed'''
+        signature = self._file_signature()
+        if signature != self._signature:
+            self._load()
+            self._cache.clear()
+            self._signature = signature
+
+    def _load(self):
+        '''read the tables and compute the lookups'''
+        with closing(sqlite3.connect(self._db_name)) as conn:
+            partitions = dict(conn.execute(
+                '''SELECT partition_id, partition_name FROM partitions'''
+            ))
+            if _has_table(conn, 'clusters'):
+                clusters = dict(conn.execute(
+                    '''SELECT cluster_id, cluster_name FROM clusters'''
+                ))
+            else:
+                clusters = {}
+            properties = {}
+            for node_id, node_property in conn.execute(
+                    '''SELECT node_id, property FROM properties'''):
+                properties.setdefault(node_id, set()).add(node_property)
+            features = {}
+            for node_id, node_feature in conn.execute(
+                    '''SELECT node_id, feature FROM features'''):
+                features.setdefault(node_id, set()).add(node_feature)
+            rows = conn.execute('''SELECT node_id, hostname, partition_id,
+                                          rack, iru, np, ngpus, mem,
+                                          cluster_id
+                                       FROM nodes''').fetchall()
+            if _has_table(conn, 'running_jobs'):
+                job_rows = conn.execute(
+                    '''SELECT job_id, node_id, first_core, nr_cores
+                           FROM running_jobs
+                           ORDER BY node_id, first_core'''
+                ).fetchall()
+            else:
+                job_rows = []
+        self._nodes = {}
+        self._cluster_ids = dict((cluster_name, cluster_id)
+                                 for cluster_id, cluster_name
+                                 in clusters.iteritems())
+        self._by_hostname = {}
+        self._by_partition = {}
+        self._by_property = {}
+        self._by_feature = {}
+        self._by_resources = {}
+        for row in rows:
+            node_id = row[0]
+            partition = partitions.get(row[2], row[2])
+            node = Node(node_id, row[1], partition, row[3], row[4], row[5],
+                        row[6], row[7],
+                        frozenset(properties.get(node_id, ())),
+                        frozenset(features.get(node_id, ())),
+                        clusters.get(row[8]))
+            self._nodes[node_id] = node
+            self._by_hostname.setdefault(node.hostname, {})[row[8]] = node
+            self._by_partition.setdefault(partition, set()).add(node_id)
+            for node_property in node.properties:
+                self._by_property.setdefault(node_property,
+                                             set()).add(node_id)
+            for node_feature in node.features:
+                self._by_feature.setdefault(node_feature,
+                                            set()).add(node_id)
+            self._by_resources.setdefault((node.np, node.mem),
+                                          set()).add(node_id)
+        self._jobs_by_node = {}
+        self._by_job = {}
+        cluster_of_node = dict((row[0], row[8]) for row in rows)
+        for job_id, node_id, first_core, nr_cores in job_rows:
+            self._jobs_by_node.setdefault(node_id, []).append(
+                (str(job_id), first_core, nr_cores)
+            )
+            self._by_job.setdefault(str(job_id), {}).setdefault(
+                cluster_of_node.get(node_id), set()
+            ).add(node_id)
+        self.nr_loads += 1
+
+    def _in_cluster(self, entries, cluster, name):
+        '''select the entry of the given cluster from a dictionary with
+           cluster IDs as keys, None if there is none; without a cluster,
+           the name must be unique across clusters, a ValueError is
+           raised otherwise'''
+        if cluster is None:
+            if len(entries) > 1:
+                msg = '{0} is in several clusters, specify one'
+                raise ValueError(msg.format(name))
+            return next(entries.itervalues(), None)
+        return entries.get(self._cluster_ids.get(cluster))
+
+    @property
+    def cache_stats(self):
+        '''hits and misses of the query cache'''
+        return {'hits': self._cache.hits, 'misses': self._cache.misses,
+                'size': len(self._cache)}
+
+    def clusters(self):
+        '''return the names of the clusters in the database, empty if it
+           has a single cluster only'''
+        self._check_snapshot()
+        return sorted(self._cluster_ids)
+
+    def partitions(self):
+        '''return the names of the partitions that have nodes'''
+        self._check_snapshot()
+        return sorted(self._by_partition)
+
+    def node(self, hostname, cluster=None):
+        '''return the node with the given hostname in the cluster with the
+           given name, or None; the cluster is required if the hostname
+           occurs in several clusters'''
+        self._check_snapshot()
+        return self._in_cluster(self._by_hostname.get(hostname, {}),
+                                cluster, hostname)
+
+    def nodes_by_partition(self, partition):
+        '''return the IDs of the nodes in the partition'''
+        self._check_snapshot()
+        return frozenset(self._by_partition.get(partition, ()))
+
+    def nodes_by_property(self, node_property):
+        '''return the IDs of the nodes with the property'''
+        self._check_snapshot()
+        return frozenset(self._by_property.get(node_property, ()))
+
+    def nodes_by_feature(self, node_feature):
+        '''return the IDs of the nodes with the feature'''
+        self._check_snapshot()
+        return frozenset(self._by_feature.get(node_feature, ()))
+
+    def nodes_by_resources(self, min_np=0, min_mem=0):
+        '''return the IDs of the nodes with at least min_np cores and
+           min_mem memory'''
+        self._check_snapshot()
+        node_ids = set()
+        for (np, mem), bucket in self._by_resources.iteritems():
+            if np >= min_np and (mem or 0) >= min_mem:
+                node_ids.update(bucket)
+        return frozenset(node_ids)
+
+    def jobs_on_node(self, hostname, cluster=None):
+        '''return the jobs running on the node with the given hostname as
+           a list of (job ID, first core, number of cores) tuples, empty
+           if the database has no job information'''
+        node = self.node(hostname, cluster)
+        if node is None:
+            return []
+        return list(self._jobs_by_node.get(node.node_id, ()))
+
+    def nodes_of_job(self, job_id, cluster=None):
+        '''return the IDs of the nodes the job runs on in the cluster with
+           the given name, which is required if the job ID occurs in
+           several clusters'''
+        self._check_snapshot()
+        return frozenset(self._in_cluster(self._by_job.get(str(job_id), {}),
+                                          cluster, job_id) or ())
+
+    def free_cores(self, hostname, cluster=None):
+        '''return the number of cores of the node with the given hostname
+           that run no jobs, or None if there is no such node'''
+        node = self.node(hostname, cluster)
+        if node is None:
+            return None
+        nr_used = sum(nr_cores for _, _, nr_cores in
+                      self._jobs_by_node.get(node.node_id, ()))
+        return max(node.np - nr_used, 0)
+
+    def hostnames(self, node_ids):
+        '''return the sorted hostnames of the nodes with the given IDs'''
+        self._check_snapshot()
+        return sorted(self._nodes[node_id].hostname
+                      for node_id in node_ids if node_id in self._nodes)
+
+    def _matching_nodes(self, partition, ppn, mem, required):
+        '''compute the IDs of the nodes that satisfy the requirements,
+           required properties may be either node properties or
+           features'''
+        node_ids = set(self.nodes_by_resources(ppn, mem))
+        if partition:
+            node_ids &= self._by_partition.get(partition, set())
+        for name in required:
+            node_ids &= (self._by_property.get(name, set()) |
+                         self._by_feature.get(name, set()))
+        return frozenset(node_ids)
+
+    def matching_nodes(self, partition=None, ppn=1, mem=0, required=()):
+        '''return the nodes in the partition that have at least ppn cores,
+           mem memory, and all required properties or features'''
+        self._check_snapshot()
+        key = ('matching_nodes', partition, ppn, mem, frozenset(required))
+        node_ids = self._cache.get(
+            key, lambda: self._matching_nodes(partition, ppn, mem, required)
+        )
+        return [self._nodes[node_id] for node_id in node_ids]
+
+    def is_feasible(self, nodes_spec, partition=None, mem=0):
+        '''check whether a PBS nodes specification, e.g.,
+           nodes=4:ppn=20:mem128, can ever be satisfied in the partition,
+           mem is the minimum memory per node'''
+        self._check_snapshot()
+        key = ('is_feasible', nodes_spec, partition, mem)
+
+        def compute():
+            '''compute whether the specification is feasible'''
+            nr_nodes, ppn, required = parse_nodes_spec(nodes_spec)
+            node_ids = self._matching_nodes(partition, ppn, mem, required)
+            return len(node_ids) >= nr_nodes
+
+        return self._cache.get(key, compute)
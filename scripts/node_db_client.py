@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''Thin client for the node database query server, it only depends on
+   the standard library, so that short-lived programs start fast; a
+   client keeps its connection open, so that several queries can be
+   sent over it; the protocol is one JSON object per line in both
+   directions, i.e., {"query": name, "args": [...]} as request, and
+   {"result": ...} or {"error": message} as response'''
+
+import json, os, socket
+
+SOCKET_PATH = os.environ.get('VSC_CLUSTER_DB_SOCKET',
+                             '/var/run/vsc-cluster-db/node_db.sock')
+TIMEOUT = 5.0
+
+class QueryError(Exception):
+    '''Raised when the server reports an error for a query'''
+    pass
+
+class NodeDBClient(object):
+    '''Client for the node database query server, query methods are
+       available by name, e.g., client.node('r1i0n1'), or by calling
+       query'''
+
+    def __init__(self, socket_path=SOCKET_PATH, timeout=TIMEOUT):
+        '''create a client for the server listening on socket_path, the
+           connection is made when the first query is sent'''
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._socket = None
+        self._file = None
+
+    def connect(self):
+        '''connect to the server, raises socket.error if that fails'''
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(self._timeout)
+        self._socket.connect(self._socket_path)
+        self._file = self._socket.makefile('rb')
+
+    def close(self):
+        '''close the connection to the server'''
+        if self._socket:
+            self._file.close()
+            self._socket.close()
+            self._socket = None
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def query(self, name, *args):
+        '''send a query with the given name and arguments, and return its
+           result; raises QueryError if the server reports an error'''
+        if self._socket is None:
+            self.connect()
+        request = json.dumps({'query': name, 'args': args},
+                             separators=(',', ':'))
+        try:
+            self._socket.sendall(request + '\n')
+            line = self._file.readline()
+        except socket.error:
+            self.close()
+            raise
+        if not line:
+            self.close()
+            raise QueryError('connection closed by server')
+        response = json.loads(line)
+        if 'error' in response:
+            raise QueryError(response['error'])
+        return response['result']
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args: self.query(name, *args)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+'''Server that answers queries on a node database over a Unix domain
+   socket, from an in-memory snapshot that is reloaded when the database
+   file is replaced, so that many short-lived clients, e.g., qlint, do
+   not each open the database and run the same joins; the number of
+   requests, errors, and the latency per query are kept, and are
+   returned by the stats query; node_db_client.py is the client; the
+   socket's directory must be owned by root or the server's user, and
+   may not be writable by others, the size of requests, the number of
+   connections, and their idle time are limited'''
+
+import json, os, socket, SocketServer, stat, sys, threading, time
+
+from node_db import CACHE_SIZE, NodeDB
+from node_db_client import SOCKET_PATH
+
+SOCKET_IN_USE_ERROR = 1
+SOCKET_MODE = 0600
+SOCKET_DIR_MODE = 0755
+MAX_CONNECTIONS = 64
+MAX_REQUEST_SIZE = 64*1024
+IDLE_TIMEOUT = 60.0
+
+def check_socket_dir(socket_path):
+    '''create the directory of the socket if it does not exist, raises
+       socket.error if it is not owned by root or the current user, or
+       if others can write to it'''
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    if not os.path.isdir(socket_dir):
+        try:
+            os.makedirs(socket_dir, SOCKET_DIR_MODE)
+        except OSError as error:
+            raise socket.error(str(error))
+    dir_stat = os.lstat(socket_dir)
+    if not stat.S_ISDIR(dir_stat.st_mode):
+        reason = 'not a directory'
+    elif dir_stat.st_uid not in (0, os.getuid()):
+        reason = 'owned by another user'
+    elif dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        reason = 'writable by other users'
+    else:
+        return
+    msg = 'socket directory {0} is {1}'
+    raise socket.error(msg.format(socket_dir, reason))
+
+def remove_stale_socket(socket_path):
+    '''remove the socket file if it is a socket of the current user that
+       no server listens on, raises socket.error if the socket is in use,
+       or if the file is not such a socket'''
+    try:
+        file_stat = os.lstat(socket_path)
+    except OSError:
+        return
+    if (not stat.S_ISSOCK(file_stat.st_mode) or
+            file_stat.st_uid != os.getuid()):
+        msg = '{0} exists, and is not a socket of this user'
+        raise socket.error(msg.format(socket_path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except socket.error:
+        os.remove(socket_path)
+    else:
+        raise socket.error('socket {0} in use'.format(socket_path))
+    finally:
+        probe.close()
+
+def node_to_dict(node):
+    '''convert a Node to a dictionary that can be serialized to JSON'''
+    if node is None:
+        return None
+    node_dict = node._asdict()
+    node_dict['properties'] = sorted(node.properties)
+    node_dict['features'] = sorted(node.features)
+    return node_dict
+
+def _node(node_db, hostname, cluster=None):
+    '''return the node with the given hostname as a dictionary'''
+    return node_to_dict(node_db.node(hostname, cluster))
+
+def _nodes_by_partition(node_db, partition):
+    '''return the hostnames of the nodes in the partition'''
+    return node_db.hostnames(node_db.nodes_by_partition(partition))
+
+def _nodes_by_property(node_db, node_property):
+    '''return the hostnames of the nodes with the property'''
+    return node_db.hostnames(node_db.nodes_by_property(node_property))
+
+def _nodes_by_feature(node_db, node_feature):
+    '''return the hostnames of the nodes with the feature'''
+    return node_db.hostnames(node_db.nodes_by_feature(node_feature))
+
+def _matching_nodes(node_db, partition=None, ppn=1, mem=0, required=()):
+    '''return the sorted hostnames of the nodes that match the
+       requirements'''
+    return sorted(node.hostname for node in
+                  node_db.matching_nodes(partition, ppn, mem, required))
+
+def _nodes_of_job(node_db, job_id, cluster=None):
+    '''return the hostnames of the nodes the job runs on'''
+    return node_db.hostnames(node_db.nodes_of_job(job_id, cluster))
+
+QUERIES = {
+    'clusters': lambda node_db: node_db.clusters(),
+    'partitions': lambda node_db: node_db.partitions(),
+    'node': _node,
+    'nodes_by_partition': _nodes_by_partition,
+    'nodes_by_property': _nodes_by_property,
+    'nodes_by_feature': _nodes_by_feature,
+    'matching_nodes': _matching_nodes,
+    'is_feasible': lambda node_db, *args: node_db.is_feasible(*args),
+    'jobs_on_node': lambda node_db, *args: node_db.jobs_on_node(*args),
+    'nodes_of_job': _nodes_of_job,
+    'free_cores': lambda node_db, *args: node_db.free_cores(*args),
+}
+
+class QueryStats(object):
+    '''Number of requests and errors, and latencies per query'''
+
+    def __init__(self):
+        '''create empty statistics'''
+        self._start = time.time()
+        self._queries = {}
+        self.nr_errors = 0
+
+    def add(self, name, latency, is_error=False):
+        '''add a request for the query with the given name'''
+        stats = self._queries.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += latency
+        stats[2] = max(stats[2], latency)
+        if is_error:
+            self.nr_errors += 1
+
+    def to_dict(self):
+        '''return the statistics as a dictionary, latencies are in
+           seconds'''
+        queries = {}
+        for name, (count, total, max_latency) in self._queries.items():
+            queries[name] = {
+                'count': count,
+                'mean_latency': total/count,
+                'max_latency': max_latency,
+            }
+        return {
+            'uptime': time.time() - self._start,
+            'requests': sum(stats[0] for stats in self._queries.values()),
+            'errors': self.nr_errors,
+            'queries': queries,
+        }
+
+def _response_line(response):
+    '''serialize a response as a line of JSON'''
+    return json.dumps(response, separators=(',', ':')) + '\n'
+
+class QueryHandler(SocketServer.StreamRequestHandler):
+    '''Handles the requests of a client connection, one JSON object per
+       line of at most MAX_REQUEST_SIZE bytes; the connection is closed
+       when a request is too long, or the client is idle for
+       IDLE_TIMEOUT seconds'''
+
+    timeout = IDLE_TIMEOUT
+
+    def handle(self):
+        '''answer the requests of the client until it disconnects'''
+        try:
+            while True:
+                line = self.rfile.readline(MAX_REQUEST_SIZE + 1)
+                if not line:
+                    break
+                if len(line) > MAX_REQUEST_SIZE:
+                    msg = 'request exceeds {0:d} bytes'
+                    self.wfile.write(_response_line(
+                        {'error': msg.format(MAX_REQUEST_SIZE)}
+                    ))
+                    break
+                self.wfile.write(_response_line(self.server.answer(line)))
+                self.wfile.flush()
+        except socket.error:
+            pass
+
+class NodeDBServer(SocketServer.ThreadingMixIn,
+                   SocketServer.UnixStreamServer):
+    '''Unix domain socket server for queries on a NodeDB, at most
+       max_connections clients are served concurrently, others are
+       refused, queries are serialized, since a query may reload the
+       snapshot'''
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, node_db, mode=SOCKET_MODE,
+                 max_connections=MAX_CONNECTIONS):
+        '''create a server for the node_db listening on socket_path, a
+           stale socket of the current user is removed, a socket in use,
+           any other file, or an unsafe directory is an error'''
+        check_socket_dir(socket_path)
+        remove_stale_socket(socket_path)
+        old_umask = os.umask(0177)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, socket_path,
+                                                   QueryHandler)
+        finally:
+            os.umask(old_umask)
+        os.chmod(socket_path, mode)
+        self._socket_path = socket_path
+        self._node_db = node_db
+        self._lock = threading.Lock()
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self.stats = QueryStats()
+
+    def process_request(self, request, client_address):
+        '''serve the connection in a thread, or refuse it if there are
+           too many connections already'''
+        if not self._connections.acquire(False):
+            try:
+                request.sendall(_response_line(
+                    {'error': 'too many connections'}
+                ))
+            except socket.error:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            SocketServer.ThreadingMixIn.process_request(self, request,
+                                                        client_address)
+        except:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        '''serve the connection, and release its slot when it is
+           closed'''
+        try:
+            SocketServer.ThreadingMixIn.process_request_thread(
+                self, request, client_address
+            )
+        finally:
+            self._connections.release()
+
+    def answer(self, line):
+        '''answer a request, returns the response as a dictionary'''
+        start = time.time()
+        name = None
+        try:
+            request = json.loads(line)
+            name = request['query']
+            args = request.get('args', [])
+            if name == 'stats':
+                with self._lock:
+                    response = {'result': self.stats.to_dict()}
+                    response['result']['nr_loads'] = self._node_db.nr_loads
+                    response['result']['cache'] = self._node_db.cache_stats
+            elif isinstance(name, basestring) and name in QUERIES:
+                with self._lock:
+                    response = {'result': QUERIES[name](self._node_db,
+                                                        *args)}
+            else:
+                response = {'error': 'unknown query {0}'.format(name)}
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            response = {'error': 'invalid request: {0}'.format(error)}
+        except Exception as error:
+            response = {'error': str(error)}
+        if not isinstance(name, basestring) or (name != 'stats' and
+                                                name not in QUERIES):
+            name = 'invalid'
+        with self._lock:
+            self.stats.add(name, time.time() - start, 'error' in response)
+        return response
+
+    def server_close(self):
+        '''close the socket, and remove the socket file'''
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self._socket_path)
+        except OSError:
+            pass
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    import signal
+
+    arg_parser = ArgumentParser(description=('serves queries on a node '
+                                             'database over a Unix domain '
+                                             'socket'))
+    arg_parser.add_argument('--db', default='nodes.db',
+                            help='database file to serve')
+    arg_parser.add_argument('--socket', default=SOCKET_PATH,
+                            help='Unix domain socket to listen on')
+    arg_parser.add_argument('--mode', type=lambda mode: int(mode, 8),
+                            default=SOCKET_MODE,
+                            help=('permissions of the socket, octal, e.g., '
+                                  '0666 to serve all users'))
+    arg_parser.add_argument('--max_connections', type=int,
+                            default=MAX_CONNECTIONS,
+                            help='number of clients served concurrently')
+    arg_parser.add_argument('--cache_size', type=int, default=CACHE_SIZE,
+                            help='number of query results to cache')
+    arg_parser.add_argument('--verbose', action='store_true',
+                            help='show information for debugging')
+    options = arg_parser.parse_args()
+    node_db = NodeDB(options.db, options.cache_size)
+    try:
+        server = NodeDBServer(options.socket, node_db, options.mode,
+                              options.max_connections)
+    except socket.error as error:
+        sys.stderr.write('### error: {0}\n'.format(str(error)))
+        sys.exit(SOCKET_IN_USE_ERROR)
+
+    def shutdown(signal_nr, frame):
+        '''stop serving on SIGTERM'''
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    if options.verbose:
+        print 'serving {0} on {1}'.format(options.db, options.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if options.verbose:
+            print json.dumps(server.stats.to_dict(), sort_keys=True)
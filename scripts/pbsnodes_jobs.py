@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+'''Functions to parse the jobs field of pbsnodes output, i.e.,
+   0/123.master,1/123.master,2-3/124.master,..., into ranges of cores
+   that are allocated to the same job'''
+
+def job_id_of(job):
+    '''strip the server name from a job ID as reported by pbsnodes, e.g.,
+       20033686.icts-p-svcs-1 becomes 20033686, as in showq output'''
+    return str(job).split('.', 1)[0]
+
+def split_jobs(jobs_str):
+    '''split a raw jobs string into a dictionary with cores as keys, and
+       job IDs as values, both single cores and core ranges, e.g., 0-3,
+       are supported'''
+    jobs = {}
+    for item in jobs_str.split(','):
+        cores, _, job = item.strip().partition('/')
+        if not job:
+            continue
+        first_core, _, last_core = cores.partition('-')
+        try:
+            first_core = int(first_core)
+            last_core = int(last_core) if last_core else first_core
+        except ValueError:
+            continue
+        for core in xrange(first_core, last_core + 1):
+            jobs[core] = job
+    return jobs
+
+def core_ranges(jobs):
+    '''compute the ranges of consecutive cores allocated to the same job,
+       jobs is either the raw jobs string, or a dictionary with cores as
+       keys and job IDs as values; returns a list of (job ID, first core,
+       number of cores) tuples, ordered by first core'''
+    if isinstance(jobs, basestring):
+        jobs = split_jobs(jobs)
+    ranges = []
+    for core in sorted(jobs):
+        job_id = job_id_of(jobs[core])
+        if ranges:
+            range_job_id, first_core, nr_cores = ranges[-1]
+            if range_job_id == job_id and first_core + nr_cores == core:
+                ranges[-1] = (job_id, first_core, nr_cores + 1)
+                continue
+        ranges.append((job_id, core, 1))
+    return ranges
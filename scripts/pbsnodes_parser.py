@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+'''Parser for pbsnodes output that makes a single pass over the lines,
+   and only keeps the requested fields of each record in a NodeRecord
+   with __slots__; the jobs and status fields, which can be very long,
+   are kept as raw strings, and are only decoded when they are accessed;
+   memory, cpuload and memload are derived as by PbsnodesParser, i.e.,
+   memory in bytes from physmem, cpuload as loadave per core, and memload
+   as the fraction of totmem that is not available'''
+
+from pbsnodes_jobs import job_id_of, split_jobs
+from pbsnodes_status import parse_kb
+
+FIELDS = ['state', 'np', 'properties', 'jobs', 'status', 'gpus', 'ntype',
+          'note']
+LOADER_FIELDS = ['state', 'np', 'properties', 'jobs', 'status', 'gpus']
+
+def split_status_fields(status_str):
+    '''split a raw status string into a dictionary of strings with all its
+       fields'''
+    status = {}
+    for item in status_str.split(','):
+        key, sep, value = item.partition('=')
+        if sep:
+            status[key] = value
+    return status
+
+def status_value(status_str, key):
+    '''return the raw value of a single field of a raw status string
+       without splitting it, None if the field is not present'''
+    key += '='
+    if status_str.startswith(key):
+        start = len(key)
+    else:
+        start = status_str.find(',' + key)
+        if start < 0:
+            return None
+        start += len(key) + 1
+    end = status_str.find(',', start)
+    return status_str[start:] if end < 0 else status_str[start:end]
+
+class NodeRecord(object):
+    '''Node as described by a pbsnodes record, fields that were not
+       requested, or that are absent from the record are None, properties
+       are a list, jobs a dictionary with cores as keys, and job IDs
+       without the server name as values, as for PbsnodesParser, status
+       a dictionary of strings; jobs and status are empty dictionaries
+       for a record without them'''
+
+    __slots__ = ('hostname', 'state', 'np', 'properties', 'gpus', 'ntype',
+                 'note', '_jobs_str', '_jobs', '_status_str', '_status',
+                 '_memory')
+
+    def __init__(self, hostname):
+        '''create a record for the node with the given hostname'''
+        self.hostname = hostname
+        self.state = None
+        self.np = None
+        self.properties = None
+        self.gpus = None
+        self.ntype = None
+        self.note = None
+        self._jobs_str = None
+        self._jobs = None
+        self._status_str = None
+        self._status = None
+        self._memory = None
+
+    @property
+    def jobs(self):
+        '''jobs running on the node, decoded when first accessed'''
+        if self._jobs is None:
+            self._jobs = {}
+            if self._jobs_str:
+                for core, job in split_jobs(self._jobs_str).iteritems():
+                    self._jobs[core] = job_id_of(job)
+        return self._jobs
+
+    @property
+    def job_ids(self):
+        '''list of the IDs of the jobs on each core'''
+        return self.jobs.values()
+
+    @property
+    def status(self):
+        '''status of the node, decoded when first accessed'''
+        if self._status is None:
+            if self._status_str:
+                self._status = split_status_fields(self._status_str)
+            else:
+                self._status = {}
+        return self._status
+
+    def _status_value(self, key):
+        '''value of a status field, without decoding the status'''
+        if self._status is not None:
+            return self._status.get(key)
+        elif self._status_str:
+            return status_value(self._status_str, key)
+        else:
+            return None
+
+    @property
+    def memory(self):
+        '''physical memory in bytes, None if the status has no physmem,
+           the status is not decoded to compute it'''
+        if self._memory is None:
+            physmem = self._status_value('physmem')
+            if physmem:
+                self._memory = parse_kb(physmem)*1024
+        return self._memory
+
+    @property
+    def cpuload(self):
+        '''load average per core, None if unknown'''
+        loadave = self._status_value('loadave')
+        if loadave and self.np:
+            return float(loadave)/self.np
+        return None
+
+    @property
+    def memload(self):
+        '''fraction of the total memory that is not available, None if
+           unknown'''
+        availmem = self._status_value('availmem')
+        totmem = self._status_value('totmem')
+        if availmem and totmem:
+            return 1.0 - float(parse_kb(availmem))/parse_kb(totmem)
+        return None
+
+    def __repr__(self):
+        return 'NodeRecord({0!r})'.format(self.hostname)
+
+class PbsnodesRecordParser(object):
+    '''Parser for pbsnodes output that creates a NodeRecord per node, it
+       has the same parse and parse_file methods as PbsnodesParser, and
+       iter_nodes to parse while the output is read'''
+
+    def __init__(self, fields=None):
+        '''create a parser that only keeps the given fields, by default
+           all of FIELDS; the hostname is always kept'''
+        if fields is None:
+            fields = FIELDS
+        for field in fields:
+            if field not in FIELDS:
+                raise ValueError('unknown field {0}'.format(field))
+        self._fields = frozenset(fields)
+
+    def iter_nodes(self, lines):
+        '''Generator over the nodes described by the lines of pbsnodes
+           output, a record starts with the hostname, followed by indented
+           key = value lines'''
+        fields = self._fields
+        record = None
+        for line in lines:
+            indent = line[:1]
+            if indent == ' ' or indent == '\t':
+                key, _, value = line.partition(' = ')
+                key = key.lstrip()
+                if key not in fields or record is None:
+                    continue
+                value = value.rstrip()
+                if key == 'jobs':
+                    record._jobs_str = value
+                elif key == 'status':
+                    record._status_str = value
+                elif key == 'properties':
+                    record.properties = value.split(',') if value else []
+                elif key == 'np':
+                    record.np = int(value)
+                elif key == 'state':
+                    record.state = value
+                elif key == 'gpus':
+                    record.gpus = int(value)
+                elif key == 'ntype':
+                    record.ntype = value
+                elif key == 'note':
+                    record.note = value
+            elif line:
+                hostname = line.strip()
+                if hostname:
+                    if record is not None:
+                        yield record
+                    record = NodeRecord(hostname)
+        if record is not None:
+            yield record
+
+    def parse(self, pbsnodes_output):
+        '''parse pbsnodes output given as a string, returns a list of
+           nodes'''
+        return list(self.iter_nodes(pbsnodes_output.split('\n')))
+
+    def parse_file(self, pbsnodes_file):
+        '''parse pbsnodes output read from a file, returns a list of
+           nodes'''
+        return list(self.iter_nodes(pbsnodes_file))
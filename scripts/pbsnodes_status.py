@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+'''Functions to parse the status field of pbsnodes output, i.e.,
+   rectime=...,loadave=...,physmem=...kb,..., into typed values'''
+
+def parse_kb(value):
+    '''convert a memory size as reported by pbsnodes, e.g., 65932076kb, to
+       an integer number of kb'''
+    if value.endswith('kb'):
+        value = value[:-2]
+    return int(value)
+
+STATUS_FIELDS = [
+    ('rectime', int),
+    ('state', str),
+    ('loadave', float),
+    ('physmem', parse_kb),
+    ('availmem', parse_kb),
+    ('totmem', parse_kb),
+    ('ncpus', int),
+    ('nusers', int),
+    ('nsessions', int),
+    ('idletime', int),
+    ('netload', int),
+]
+STATUS_CONVERTERS = dict(STATUS_FIELDS)
+STATUS_COLUMNS = [name for name, _ in STATUS_FIELDS]
+
+def split_status(status_str):
+    '''split a raw status string into a dictionary of strings'''
+    status = {}
+    for item in status_str.split(','):
+        key, _, value = item.partition('=')
+        if key in STATUS_CONVERTERS:
+            status[key] = value
+    return status
+
+def parse_status(status):
+    '''parse a node's status, either the raw status string, or a dictionary
+       of strings, returns a dictionary with typed values for the fields
+       in STATUS_FIELDS that are present and valid'''
+    if isinstance(status, basestring):
+        status = split_status(status)
+    values = {}
+    for key, convert in STATUS_FIELDS:
+        value = status.get(key)
+        if value:
+            try:
+                values[key] = convert(value)
+            except ValueError:
+                pass
+    return values
+
+def status_row(status):
+    '''return a tuple with the typed values of a node's status, ordered
+       as STATUS_COLUMNS, missing values are None'''
+    values = parse_status(status)
+    return tuple(values.get(column) for column in STATUS_COLUMNS)
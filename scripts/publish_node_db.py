@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+'''Functions to publish a database with information on nodes in a
+   compute cluster atomically: the database is built in a snapshot file
+   next to the published database, and once it is complete, it is renamed
+   to the published file name, so that readers always see either the old
+   or the new database, never one that is under construction'''
+
+import os, shutil, sqlite3, tempfile
+from contextlib import closing
+
+SNAPSHOT_SUFFIX = '.tmp'
+NR_GENERATIONS = 2
+
+def create_snapshot_file(db_name):
+    '''Create an empty snapshot file in the directory of the published
+       database, returns its name'''
+    db_dir = os.path.dirname(os.path.abspath(db_name))
+    prefix = '.{0}.'.format(os.path.basename(db_name))
+    snapshot_fd, snapshot_name = tempfile.mkstemp(prefix=prefix,
+                                                  suffix=SNAPSHOT_SUFFIX,
+                                                  dir=db_dir)
+    os.close(snapshot_fd)
+    return snapshot_name
+
+def remove_snapshot_file(snapshot_name):
+    '''Remove a snapshot file, if it still exists'''
+    try:
+        os.remove(snapshot_name)
+    except OSError:
+        pass
+
+def check_integrity(db_name):
+    '''Run a quick integrity check on the database, returns a list of
+       problems, which is empty if the database is fine'''
+    with closing(sqlite3.connect(db_name)) as conn:
+        result = conn.execute('''PRAGMA quick_check''').fetchall()
+    return [row[0] for row in result if row[0] != 'ok']
+
+def generation_name(db_name, generation):
+    '''Return the file name of an older generation of the database'''
+    return '{0}.{1:d}'.format(db_name, generation)
+
+def rotate_generations(db_name, nr_generations=NR_GENERATIONS):
+    '''Keep the currently published database as generation 1, shifting
+       older generations, only nr_generations are kept, the published
+       file itself is left in place'''
+    if nr_generations <= 0 or not os.path.isfile(db_name):
+        return
+    for generation in xrange(nr_generations - 1, 0, -1):
+        old_name = generation_name(db_name, generation)
+        if os.path.isfile(old_name):
+            os.rename(old_name, generation_name(db_name, generation + 1))
+    first_name = generation_name(db_name, 1)
+    if os.path.isfile(first_name):
+        os.remove(first_name)
+    try:
+        os.link(db_name, first_name)
+    except OSError:
+        shutil.copy2(db_name, first_name)
+
+def _fsync(path):
+    '''flush a file or directory to disk'''
+    path_fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(path_fd)
+    finally:
+        os.close(path_fd)
+
+def publish_snapshot(snapshot_name, db_name,
+                     nr_generations=NR_GENERATIONS):
+    '''Atomically replace the published database by the snapshot, the
+       previously published database is kept as a generation'''
+    _fsync(snapshot_name)
+    if os.path.isfile(db_name):
+        shutil.copymode(db_name, snapshot_name)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(snapshot_name, 0666 & ~umask)
+    rotate_generations(db_name, nr_generations)
+    os.rename(snapshot_name, db_name)
+    _fsync(os.path.dirname(os.path.abspath(db_name)))
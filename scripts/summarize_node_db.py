@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+'''Functions to maintain summary tables in a database with information on
+   nodes in a compute cluster, i.e., node counts, cores and memory, total
+   and free, per partition, and per cluster for rack, (rack, iru) and
+   feature, so that dashboards can read a few rows rather than aggregate
+   the nodes table; the summaries are recomputed in the transaction that
+   modifies the nodes, so that they are always consistent with it'''
+
+from create_node_db import SUMMARY_COLUMNS
+
+DOWN_STATES = ['down', 'offline', 'unknown']
+
+IS_DOWN_EXPR = '({0})'.format(' OR '.join(
+    "n.state LIKE '%{0}%'".format(state) for state in DOWN_STATES
+))
+
+SUMMARY_EXPRS = [
+    'COUNT(*)',
+    'SUM(n.np)',
+    'SUM(n.mem)',
+    'COALESCE(SUM(s.availmem), 0)',
+    '''SUM(CASE WHEN {0} THEN 0
+               ELSE MAX(n.np - COALESCE(n.nr_used_cores, 0), 0)
+           END)'''.format(IS_DOWN_EXPR),
+    '''SUM(CASE WHEN NOT {0} AND COALESCE(n.nr_used_cores, 0) = 0
+               THEN 1 ELSE 0
+           END)'''.format(IS_DOWN_EXPR),
+    '''SUM(CASE WHEN NOT {0} AND n.nr_used_cores > 0
+               THEN 1 ELSE 0
+           END)'''.format(IS_DOWN_EXPR),
+    'SUM(CASE WHEN {0} THEN 1 ELSE 0 END)'.format(IS_DOWN_EXPR),
+]
+
+SUMMARIES = [
+    ('partition_summary', ['partition_id'], 'n.partition_id', '',
+     'n.partition_id IS NOT NULL'),
+    ('rack_summary', ['cluster_id', 'rack'], 'n.cluster_id, n.rack', '',
+     'n.rack IS NOT NULL'),
+    ('iru_summary', ['cluster_id', 'rack', 'iru'],
+     'n.cluster_id, n.rack, n.iru', '',
+     'n.rack IS NOT NULL AND n.iru IS NOT NULL'),
+    ('feature_summary', ['cluster_id', 'feature_id'],
+     'n.cluster_id, f.feature_id',
+     'JOIN node_features AS f ON f.node_id = n.node_id', '1'),
+]
+
+def update_summaries(conn):
+    '''recompute the summary tables from the nodes, node_status and
+       node_features tables, the caller is responsible for committing,
+       so that this can be part of the transaction that modified the
+       nodes'''
+    cursor = conn.cursor()
+    for table_name, key_columns, key_exprs, join, condition in SUMMARIES:
+        cursor.execute('''DELETE FROM {0}'''.format(table_name))
+        cursor.execute(
+            '''INSERT INTO {0}
+                   ({1}, {2})
+                   SELECT {3}, {4}
+                       FROM nodes AS n
+                            LEFT JOIN node_status AS s
+                                ON s.node_id = n.node_id
+                            {5}
+                       WHERE {6}
+                       GROUP BY {3}'''.format(
+                table_name, ', '.join(key_columns),
+                ', '.join(SUMMARY_COLUMNS), key_exprs,
+                ', '.join(SUMMARY_EXPRS), join, condition
+            )
+        )
+    cursor.close()
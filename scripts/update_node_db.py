@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+'''Functions to update an existing database with information on nodes in
+   a compute cluster with a PBS torque resource manager, only the rows
+   that changed are inserted, updated or deleted, so that node IDs remain
+   stable between updates'''
+
+import hashlib, re, sys, time
+
+from create_node_db import DB_DESC, has_table, init_table
+from load_metrics import NO_METRICS
+from load_node_db import intern_name, nr_used_cores, read_names
+from node_classifier import NodeClassifier
+from pbsnodes_jobs import core_ranges
+from pbsnodes_status import STATUS_COLUMNS, status_row
+from summarize_node_db import update_summaries
+
+RECTIME_RE = re.compile(r'rectime=(\d+)')
+
+class UnchangedNode(object):
+    '''Placeholder for a node with a pbsnodes record that did not change
+       since the previous update, so it was not parsed'''
+
+    __slots__ = ('hostname', )
+
+    def __init__(self, hostname):
+        '''create a placeholder for the node with the given hostname'''
+        self.hostname = hostname
+
+def read_node_hashes(conn, cluster_id=0):
+    '''read the rectime and the hash of the pbsnodes record of the nodes
+       of the given cluster in the database, returns a dictionary with
+       hostnames as keys, and (rectime, hash) tuples as values'''
+    node_hashes = {}
+    for hostname, rectime, content_hash in conn.execute(
+            '''SELECT hostname, rectime, content_hash
+                   FROM nodes, node_status
+                   WHERE nodes.node_id = node_status.node_id AND
+                         nodes.cluster_id = ? AND
+                         content_hash IS NOT NULL''', (cluster_id, )):
+        node_hashes[hostname] = (rectime, content_hash)
+    return node_hashes
+
+def iter_refreshed_nodes(records, node_hashes, record_hashes,
+                         pbsnodes_parser=None, metrics=NO_METRICS):
+    '''Generator that parses the pbsnodes records of nodes that reported
+       new data, i.e., the record's rectime or hash differs from the one
+       in node_hashes, for other nodes an UnchangedNode is yielded, the
+       hash of each record is stored in record_hashes; the time spent
+       parsing is recorded in metrics as the parse phase'''
+    if pbsnodes_parser is None:
+        from vsc.pbs.pbsnodes import PbsnodesParser
+        pbsnodes_parser = PbsnodesParser()
+    parse_time, nr_parsed = 0.0, 0
+    for record in records:
+        hostname = record.split('\n', 1)[0].strip()
+        content_hash = hashlib.sha1(record).hexdigest()
+        record_hashes[hostname] = content_hash
+        match = RECTIME_RE.search(record)
+        if match and (node_hashes.get(hostname) ==
+                      (int(match.group(1)), content_hash)):
+            yield UnchangedNode(hostname)
+        else:
+            start = time.time()
+            nodes = pbsnodes_parser.parse(record)
+            parse_time += time.time() - start
+            for node in nodes:
+                nr_parsed += 1
+                yield node
+    metrics.add('parse', parse_time, nr_parsed)
+
+def update_partitions(conn, partition_list, cluster_id=0):
+    '''insert partitions of the given cluster that are not in the
+       database yet, and return a dictionary of the cluster's partition
+       names and IDs'''
+    cursor = conn.cursor()
+    partitions = {}
+    for partition_id, partition_name in cursor.execute(
+            '''SELECT partition_id, partition_name FROM partitions
+                   WHERE cluster_id = ?''', (cluster_id, )):
+        partitions[partition_name] = partition_id
+    partition_insert_cmd = '''INSERT INTO partitions
+                                  (partition_name, cluster_id) VALUES
+                                  (?, ?)'''
+    for partition_name in partition_list:
+        if partition_name not in partitions:
+            cursor.execute(partition_insert_cmd,
+                           (partition_name, cluster_id))
+            partitions[partition_name] = cursor.lastrowid
+    cursor.close()
+    conn.commit()
+    return partitions
+
+def update_qos_levels(conn, qos_levels):
+    '''insert QOS levels that are not in the database yet'''
+    cursor = conn.cursor()
+    known_qos_levels = set(row[0] for row in
+                           cursor.execute('''SELECT qos FROM qos_levels'''))
+    qos_insert_cmd = '''INSERT INTO qos_levels
+                                  (qos) VALUES (?)'''
+    cursor.executemany(qos_insert_cmd,
+                       [(qos, ) for qos in qos_levels
+                                if qos not in known_qos_levels])
+    cursor.close()
+    conn.commit()
+
+def _read_node_values(cursor, table_name, column_name):
+    '''read the values of the given column for each node in the table,
+       returns a dictionary with node IDs as keys, and lists of values'''
+    query = '''SELECT node_id, {0} FROM {1}'''.format(column_name, table_name)
+    node_values = {}
+    for node_id, value in cursor.execute(query):
+        node_values.setdefault(node_id, []).append(value)
+    return node_values
+
+def _diff_node_values(node_id, old_values, new_values, inserts, deletes):
+    '''add rows for values that need to be inserted or deleted for a node,
+       returns True if anything changed'''
+    old_values = set(old_values)
+    new_values = set(new_values)
+    deletes.extend((node_id, value) for value in old_values - new_values)
+    inserts.extend((node_id, value) for value in new_values - old_values)
+    return old_values != new_values
+
+def update_node_info(conn, nodes, partitions, do_jobs=False,
+                     record_hashes=None, classifier=None, cluster_id=0):
+    '''update node information, including properties, features, running
+       jobs and the summary tables, for the nodes of the given cluster,
+       nodes are identified by hostname and partition ID, nodes of other
+       clusters are left alone, UnchangedNode placeholders are kept as
+       is, the hashes of the pbsnodes records are stored when
+       record_hashes is given; nodes are classified by the given
+       NodeClassifier, or a new one for the partitions; returns a
+       dictionary with the number of nodes that were inserted, updated,
+       deleted, unchanged, skipped and parsed'''
+    if classifier is None:
+        classifier = NodeClassifier(partitions)
+    cursor = conn.cursor()
+    node_insert_cmd = '''INSERT INTO nodes
+                             (hostname, partition_id, rack, iru, np, mem,
+                              state, nr_used_cores, content_hash,
+                              cluster_id)
+                         VALUES
+                             (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    hash_update_cmd = '''UPDATE nodes
+                             SET content_hash = ?
+                             WHERE node_id = ?'''
+    node_update_cmd = '''UPDATE nodes
+                             SET rack = ?, iru = ?, np = ?, mem = ?,
+                                 state = ?, nr_used_cores = ?
+                             WHERE node_id = ?'''
+    prop_insert_cmd = '''INSERT INTO node_properties
+                             (node_id, property_id) VALUES
+                             (?, ?)'''
+    prop_delete_cmd = '''DELETE FROM node_properties
+                             WHERE node_id = ? AND property_id = ?'''
+    feature_insert_cmd = '''INSERT INTO node_features
+                                (node_id, feature_id) VALUES
+                                (?, ?)'''
+    feature_delete_cmd = '''DELETE FROM node_features
+                                WHERE node_id = ? AND feature_id = ?'''
+    running_job_insert_cmd = '''INSERT INTO running_jobs
+                                    (job_id, node_id, first_core,
+                                     nr_cores, cluster_id) VALUES
+                                    (?, ?, ?, ?, ?)'''
+    running_job_delete_cmd = '''DELETE FROM running_jobs
+                                    WHERE node_id = ?'''
+    status_replace_cmd = '''INSERT OR REPLACE INTO node_status
+                                (node_id, {0}) VALUES
+                                (?, {1})'''.format(
+        ', '.join(STATUS_COLUMNS), ', '.join('?'*len(STATUS_COLUMNS))
+    )
+    stats = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0,
+             'status_updated': 0, 'skipped': 0, 'parsed': 0}
+    if record_hashes is None:
+        record_hashes = {}
+    db_nodes, db_hashes, db_hostnames = {}, {}, {}
+    for row in cursor.execute('''SELECT node_id, hostname, partition_id,
+                                        rack, iru, np, mem, state,
+                                        nr_used_cores, content_hash
+                                     FROM nodes
+                                     WHERE cluster_id = ?''',
+                              (cluster_id, )):
+        db_nodes[(row[1], row[2])] = (row[0], tuple(row[3:9]))
+        db_hashes[row[0]] = row[9]
+        db_hostnames.setdefault(row[1], []).append(row[0])
+    db_status = {}
+    for row in cursor.execute('''SELECT node_id, {0}
+                                     FROM node_status'''.format(
+                                  ', '.join(STATUS_COLUMNS))):
+        db_status[row[0]] = tuple(row[1:])
+    property_names = read_names(conn, 'property')
+    feature_names = read_names(conn, 'feature')
+    db_properties = _read_node_values(cursor, 'node_properties',
+                                      'property_id')
+    db_features = _read_node_values(cursor, 'node_features', 'feature_id')
+    db_jobs = {}
+    if do_jobs:
+        for node_id, job_id, first_core, nr_cores in cursor.execute(
+                '''SELECT node_id, job_id, first_core, nr_cores
+                       FROM running_jobs
+                       WHERE cluster_id = ?''', (cluster_id, )):
+            db_jobs.setdefault(node_id, []).append((str(job_id), first_core,
+                                                    nr_cores))
+    node_updates, status_updates, hash_updates = [], [], []
+    prop_inserts, prop_deletes = [], []
+    feature_inserts, feature_deletes = [], []
+    job_node_ids, job_inserts = [], []
+    seen_node_ids = set()
+    for node in nodes:
+        if isinstance(node, UnchangedNode):
+            seen_node_ids.update(db_hostnames.get(node.hostname, []))
+            stats['skipped'] += 1
+            continue
+        stats['parsed'] += 1
+        partition_id, rack, iru, features = classifier.classify(node)
+        if not partition_id:
+            continue
+        if not node.status:
+            msg = 'E: node {0} has no status\n'.format(node.hostname)
+            sys.stderr.write(msg)
+            continue
+        values = (rack, iru, node.np, node.memory, node.state,
+                  nr_used_cores(node))
+        key = (node.hostname, partition_id)
+        is_changed = False
+        if key in db_nodes:
+            node_id, db_values = db_nodes[key]
+            is_new = False
+            if db_values != values:
+                node_updates.append(values + (node_id, ))
+                is_changed = True
+        else:
+            cursor.execute(node_insert_cmd,
+                           key + values +
+                           (record_hashes.get(node.hostname), cluster_id))
+            node_id = cursor.lastrowid
+            db_hashes[node_id] = record_hashes.get(node.hostname)
+            is_new = True
+        seen_node_ids.add(node_id)
+        if db_hashes[node_id] != record_hashes.get(node.hostname):
+            hash_updates.append((record_hashes.get(node.hostname), node_id))
+        status_values = status_row(node.status)
+        if db_status.get(node_id) != status_values:
+            status_updates.append((node_id, ) + status_values)
+        property_ids = [intern_name(cursor, property_names, 'property',
+                                    node_property)
+                        for node_property in node.properties]
+        is_changed |= _diff_node_values(node_id,
+                                        db_properties.get(node_id, []),
+                                        property_ids,
+                                        prop_inserts, prop_deletes)
+        feature_ids = [intern_name(cursor, feature_names, 'feature',
+                                   node_feature)
+                       for node_feature in features]
+        is_changed |= _diff_node_values(node_id,
+                                        db_features.get(node_id, []),
+                                        feature_ids,
+                                        feature_inserts, feature_deletes)
+        if do_jobs:
+            job_ranges = core_ranges(node.jobs)
+            if sorted(db_jobs.get(node_id, [])) != sorted(job_ranges):
+                job_node_ids.append((node_id, ))
+                job_inserts.extend((job_id, node_id, first_core, nr_cores,
+                                    cluster_id)
+                                   for job_id, first_core, nr_cores in
+                                       job_ranges)
+                is_changed = True
+        if is_new:
+            stats['inserted'] += 1
+        elif is_changed:
+            stats['updated'] += 1
+        else:
+            stats['unchanged'] += 1
+    node_deletes = [(node_id, ) for node_id, _ in db_nodes.values()
+                                if node_id not in seen_node_ids]
+    stats['deleted'] = len(node_deletes)
+    stats['status_updated'] = len(status_updates)
+    cursor.executemany(node_update_cmd, node_updates)
+    cursor.executemany(status_replace_cmd, status_updates)
+    cursor.executemany(hash_update_cmd, hash_updates)
+    cursor.executemany(prop_delete_cmd, prop_deletes)
+    cursor.executemany(prop_insert_cmd, prop_inserts)
+    cursor.executemany(feature_delete_cmd, feature_deletes)
+    cursor.executemany(feature_insert_cmd, feature_inserts)
+    if do_jobs:
+        cursor.executemany(running_job_delete_cmd,
+                           job_node_ids + node_deletes)
+        cursor.executemany(running_job_insert_cmd, job_inserts)
+    for table_name in ('node_properties', 'node_features', 'node_status',
+                       'node_checks', 'nodes'):
+        if not has_table(conn, table_name):
+            continue
+        cursor.executemany('''DELETE FROM {0}
+                                  WHERE node_id = ?'''.format(table_name),
+                           node_deletes)
+    cursor.close()
+    if (node_updates or status_updates or stats['inserted'] or
+            node_deletes or prop_inserts or prop_deletes or
+            feature_inserts or feature_deletes):
+        update_summaries(conn)
+    conn.commit()
+    return stats
+
+def init_jobs_tables(conn):
+    '''create the job-related tables if the database has none, e.g.,
+       when it was loaded without jobs'''
+    for table_name in sorted(DB_DESC):
+        if table_name.endswith('jobs') and not has_table(conn, table_name):
+            init_table(conn, table_name, DB_DESC[table_name])
+    conn.commit()
+
+def update_jobs(conn, jobs, cluster_id=0):
+    '''update information on jobs, active and non-active, of the given
+       cluster, jobs of that cluster that are no longer known are deleted;
+       returns a dictionary with the number of jobs that were inserted,
+       updated and deleted'''
+    cursor = conn.cursor()
+    job_replace_cmd = '''INSERT OR REPLACE INTO jobs
+                             (job_id, user, state, procs, remaining,
+                              starttime, wclimit, queuetime, cluster_id)
+                         VALUES
+                             (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+    job_delete_cmd = '''DELETE FROM jobs
+                            WHERE job_id = ? AND cluster_id = ?'''
+    db_jobs = {}
+    for row in cursor.execute('''SELECT job_id, user, state, procs,
+                                        remaining, starttime, wclimit,
+                                        queuetime
+                                     FROM jobs
+                                     WHERE cluster_id = ?''',
+                              (cluster_id, )):
+        db_jobs[str(row[0])] = tuple(row[1:])
+    job_rows = {}
+    for job_state in jobs:
+        for job in jobs[job_state]:
+            if job_state == 'active':
+                values = (job.username, job.state, job.procs,
+                          job.remaining, job.starttime, None, None)
+            else:
+                values = (job.username, job.state, job.procs,
+                          None, None, job.wclimit, job.queuetime)
+            job_rows[str(job.id)] = values
+    job_deletes = [(job_id, cluster_id) for job_id in db_jobs
+                                        if job_id not in job_rows]
+    job_changes = [(job_id, ) + values + (cluster_id, )
+                   for job_id, values in job_rows.items()
+                   if db_jobs.get(job_id) != values]
+    cursor.executemany(job_delete_cmd, job_deletes)
+    cursor.executemany(job_replace_cmd, job_changes)
+    cursor.close()
+    conn.commit()
+    nr_inserted = len([row for row in job_changes if row[0] not in db_jobs])
+    return {
+        'inserted': nr_inserted,
+        'updated': len(job_changes) - nr_inserted,
+        'deleted': len(job_deletes),
+    }
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+'''module to test the synthetic cluster generator and the benchmark'''
+
+import json, shutil, StringIO, tempfile, unittest
+import benchmark_node_db
+from generate_cluster import (ClusterGenerator, node_hostname,
+                              parse_extra_properties, read_templates)
+from vsc.pbs.pbsnodes import PbsnodesParser
+from vsc.moab.showq import ShowqParser
+
+class GenerateClusterTest(unittest.TestCase):
+    '''Tests for the synthetic cluster generator'''
+
+    def setUp(self):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            self._templates = read_templates(pbsnodes_file)
+
+    def generate(self, nr_nodes, **kwargs):
+        generator = ClusterGenerator(self._templates, nr_nodes, seed=13,
+                                     **kwargs)
+        pbsnodes_output = StringIO.StringIO()
+        generator.write_pbsnodes(pbsnodes_output)
+        showq_output = StringIO.StringIO()
+        generator.write_showq(showq_output)
+        return pbsnodes_output.getvalue(), showq_output.getvalue()
+
+    def test_read_templates(self):
+        self.assertEqual(173, len(self._templates))
+        self.assertEqual(('state', 'job-exclusive'), self._templates[0][0])
+
+    def test_node_hostname(self):
+        self.assertEqual(('r1i0n1', 1, 0), node_hostname(0))
+        self.assertEqual(('r1i1n1', 1, 1), node_hostname(16))
+        self.assertEqual(('r2i0n3', 2, 0), node_hostname(66))
+
+    def test_nodes(self):
+        nr_nodes = 500
+        pbsnodes_output, _ = self.generate(nr_nodes)
+        nodes = PbsnodesParser().parse(pbsnodes_output)
+        self.assertEqual(nr_nodes, len(nodes))
+        self.assertEqual(nr_nodes, len(set(node.hostname for node in nodes)))
+        for node in nodes:
+            self.assertTrue(node.status)
+            rack_property = node.hostname[:node.hostname.index('i')]
+            self.assertIn(rack_property, node.properties)
+            if node.jobs:
+                self.assertTrue(len(node.jobs) <= node.np)
+            if node.state == 'job-exclusive':
+                self.assertEqual(node.np, len(node.jobs))
+
+    def test_reproducible(self):
+        self.assertEqual(self.generate(100), self.generate(100))
+
+    def test_job_density(self):
+        pbsnodes_output, _ = self.generate(200, job_density=0.0)
+        nodes = PbsnodesParser().parse(pbsnodes_output)
+        self.assertFalse(any(node.jobs for node in nodes))
+
+    def test_extra_properties(self):
+        extra_properties = parse_extra_properties('ssd,ib:0')
+        self.assertEqual([('ssd', 1.0), ('ib', 0.0)], extra_properties)
+        pbsnodes_output, _ = self.generate(
+            50, extra_properties=extra_properties
+        )
+        for node in PbsnodesParser().parse(pbsnodes_output):
+            self.assertIn('ssd', node.properties)
+            self.assertNotIn('ib', node.properties)
+
+    def test_status_fields(self):
+        pbsnodes_output, _ = self.generate(
+            50, status_fields=['rectime', 'state', 'physmem', 'availmem',
+                               'totmem', 'loadave']
+        )
+        for node in PbsnodesParser().parse(pbsnodes_output):
+            self.assertNotIn('uname', node.status)
+            self.assertIn('physmem', node.status)
+
+    def test_showq(self):
+        pbsnodes_output, showq_output = self.generate(300)
+        nodes = PbsnodesParser().parse(pbsnodes_output)
+        running_jobs = set()
+        for node in nodes:
+            running_jobs.update(str(job).split('.')[0]
+                                for job in node.jobs.values())
+        jobs = ShowqParser().parse(showq_output)
+        self.assertEqual(running_jobs,
+                         set(job.id for job in jobs['active']))
+        self.assertTrue(jobs['eligible'])
+        self.assertTrue(jobs['blocked'])
+
+class BenchmarkTest(unittest.TestCase):
+    '''Tests for the load and query benchmark'''
+
+    def setUp(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            self._config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            self._templates = read_templates(pbsnodes_file)
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_run_benchmark(self):
+        result = benchmark_node_db.run_benchmark(
+            self._templates, 200, self._config['partitions'],
+            self._config['qos_levels'], self._dir, job_density=0.5, seed=1,
+            nr_repeats=2
+        )
+        self.assertEqual(200, result['nr_nodes'])
+        for phase in ['parse_pbsnodes', 'compute_partition',
+                      'compute_features', 'insert_nodes',
+                      'insert_node_properties', 'insert_running_jobs',
+                      'insert_jobs', 'init_indexes',
+                      'insert_node_info_bulk']:
+            self.assertIn(phase, result['phases'])
+        self.assertEqual(200, result['phases']['parse_pbsnodes']['rows'])
+        self.assertEqual(result['phases']['insert_nodes']['rows'],
+                         result['phases']['insert_node_info_bulk']['rows'])
+        layouts = result['name_layouts']
+        for name in layouts['legacy']['queries']:
+            self.assertEqual(layouts['legacy']['queries'][name]['rows'],
+                             layouts['interned']['queries'][name]['rows'])
+        self.assertLess(layouts['interned']['db_size'],
+                        layouts['legacy']['db_size'])
+        self.assertEqual(
+            set(name for name, _ in benchmark_node_db.QUERIES),
+            set(result['queries'])
+        )
+        self.assertEqual(1, result['queries']['node_by_hostname']['rows'])
+        json.dumps(result)
+
+    def test_compare_results(self):
+        baseline = {'runs': [{
+            'nr_nodes': 1000,
+            'phases': {'parse': {'time': 1.0}, 'commit': {'time': 1.0}},
+            'queries': {'q': {'min': 0.0001}},
+        }]}
+        results = {'runs': [{
+            'nr_nodes': 1000,
+            'phases': {'parse': {'time': 2.0}, 'commit': {'time': 1.1},
+                       'new': {'time': 3.0}},
+            'queries': {'q': {'min': 0.0005}},
+        }]}
+        self.assertEqual(
+            [(1000, 'parse', 1.0, 2.0)],
+            benchmark_node_db.compare_results(baseline, results)
+        )
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+'''module to test the vectorized capacity engine'''
+
+import json, sqlite3, StringIO, sys, unittest
+import create_node_db
+import load_node_db
+from capacity_engine import CapacityEngine
+from summarize_node_db import IS_DOWN_EXPR
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class CapacityEngineTest(unittest.TestCase):
+    '''Tests the vectorized capacity engine'''
+
+    def setUp(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        stderr_tmp = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        self._conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(self._conn, create_node_db.DB_DESC,
+                               create_jobs_tables=True)
+        partitions = load_node_db.insert_partitions(self._conn,
+                                                    config['partitions'])
+        load_node_db.insert_node_info(self._conn, nodes, partitions,
+                                      do_jobs=True)
+        sys.stderr = stderr_tmp
+        self._engine = CapacityEngine(self._conn)
+
+    def tearDown(self):
+        self._conn.close()
+
+    def _count_free(self, partition, mem):
+        cursor = self._conn.execute(
+            '''SELECT COUNT(*) FROM nodes AS n, partitions AS p
+                   WHERE n.partition_id = p.partition_id AND
+                         p.partition_name = ? AND n.mem >= ? AND
+                         NOT {0} AND
+                         n.node_id NOT IN
+                             (SELECT node_id FROM running_jobs)'''.format(
+                IS_DOWN_EXPR
+            ),
+            (partition, mem)
+        )
+        return cursor.fetchone()[0]
+
+    def test_counts(self):
+        nr_nodes = 163
+        nr_thinking_nodes = 143
+        nr_128gb_nodes = 32
+        self.assertEquals(nr_nodes, self._engine.nr_nodes)
+        self.assertTrue(self._engine.nr_classes < nr_nodes)
+        self.assertEquals(nr_thinking_nodes,
+                          self._engine.count_nodes('thinking'))
+        self.assertEquals(20*nr_thinking_nodes,
+                          self._engine.count_cores('thinking'))
+        self.assertEquals(nr_128gb_nodes,
+                          self._engine.count_nodes(required=['mem128']))
+        self.assertEquals(0, self._engine.count_nodes('thinking', ppn=24))
+        self.assertEquals(0, self._engine.count_nodes('no_such_partition'))
+        self.assertEquals(0, self._engine.count_nodes(required=['no_such']))
+
+    def test_free_nodes(self):
+        for mem in [0, 64*1024**2, 128*1024**2]:
+            self.assertEquals(self._count_free('thinking', mem),
+                              self._engine.count_free_nodes('thinking',
+                                                            mem=mem))
+        self.assertTrue(self._engine.count_free_nodes('thinking') <
+                        self._engine.count_nodes('thinking'))
+
+    def test_down_nodes(self):
+        nr_free = self._engine.count_free_nodes('thinking')
+        node_id, = self._conn.execute(
+            '''SELECT n.node_id FROM nodes AS n, partitions AS p
+                   WHERE n.partition_id = p.partition_id AND
+                         p.partition_name = 'thinking' AND
+                         n.state = 'free' AND
+                         n.node_id NOT IN
+                             (SELECT node_id FROM running_jobs)'''
+        ).fetchone()
+        for state in ['down', 'offline', 'down,offline', 'unknown']:
+            self._conn.execute('UPDATE nodes SET state = ? WHERE node_id = ?',
+                               (state, node_id))
+            engine = CapacityEngine(self._conn)
+            self.assertEquals(nr_free - 1,
+                              engine.count_free_nodes('thinking'))
+            self.assertEquals(self._engine.count_nodes('thinking'),
+                              engine.count_nodes('thinking'))
+
+    def test_feasible(self):
+        self.assertTrue(self._engine.is_feasible(4, 'thinking', ppn=20,
+                                                 required=['mem128']))
+        self.assertFalse(self._engine.is_feasible(33, 'thinking', ppn=20,
+                                                  required=['mem128']))
+        self.assertFalse(self._engine.is_feasible(1, 'thinking', ngpus=1))
+
+    def test_evaluate(self):
+        requests = [
+            {'nodes': 4, 'partition': 'thinking', 'ppn': 20,
+             'required': ['mem128']},
+            {'nodes': 33, 'partition': 'thinking', 'required': ['mem128']},
+            {'partition': 'no_such_partition'},
+            {'required': ['no_such']},
+            {'ppn': 24, 'mem': 64*1024**2},
+            {},
+        ]
+        results = self._engine.evaluate(requests)
+        for request_nr, request in enumerate(requests):
+            args = (request.get('partition'), request.get('ppn', 1),
+                    request.get('mem', 0), request.get('ngpus', 0),
+                    request.get('required', ()))
+            self.assertEquals(self._engine.count_nodes(*args),
+                              results['nr_nodes'][request_nr])
+            self.assertEquals(self._engine.count_cores(*args),
+                              results['nr_cores'][request_nr])
+            self.assertEquals(self._engine.count_free_nodes(*args),
+                              results['nr_free_nodes'][request_nr])
+            self.assertEquals(self._engine.is_feasible(
+                request.get('nodes', 1), *args
+            ), results['feasible'][request_nr])
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+'''module to test storing the holds of jobs'''
+
+import os, shutil, sqlite3, stat, StringIO, sys, tempfile
+import unittest
+from argparse import Namespace
+import check_holds
+import vsc.moab.checkjob
+
+class HeldJob(object):
+    '''Job with the attributes that store_hold_info uses'''
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.username = 'vsc30001'
+        self.account = 'lp_test'
+        self.state = 'Idle'
+        self.holds = ['system']
+
+class RecordingParser(object):
+    '''Checkjob parser that records the output it is given per job'''
+
+    outputs = []
+
+    def parse(self, job, output):
+        RecordingParser.outputs.append((job.id, output))
+
+class CheckHoldsTest(unittest.TestCase):
+    '''Tests checking and storing the holds of jobs'''
+
+    def setUp(self):
+        self._conn = sqlite3.connect(':memory:')
+        self._dir = tempfile.mkdtemp()
+        self._checkjob_cmd = os.path.join(self._dir, 'checkjob')
+        with open(self._checkjob_cmd, 'w') as cmd_file:
+            cmd_file.write('#!/bin/sh\n'
+                           'for job_id in "$@"\n'
+                           'do\n'
+                           '    echo "job $job_id"\n'
+                           '    echo "Holds:    System"\n'
+                           '    echo\n'
+                           'done\n')
+        os.chmod(self._checkjob_cmd, stat.S_IRWXU)
+        self._parser = vsc.moab.checkjob.CheckjobParser
+        vsc.moab.checkjob.CheckjobParser = RecordingParser
+        RecordingParser.outputs = []
+
+    def tearDown(self):
+        vsc.moab.checkjob.CheckjobParser = self._parser
+        shutil.rmtree(self._dir)
+        self._conn.close()
+
+    def test_split_checkjob_output(self):
+        cmd_output = ('checking jobs\n'
+                      'job 20030021\n'
+                      'Holds:    System\n'
+                      '\n'
+                      'job 20030022[3]\n'
+                      'Holds:    Batch\n')
+        self.assertEqual({
+            '20030021': 'job 20030021\nHolds:    System\n\n',
+            '20030022[3]': 'job 20030022[3]\nHolds:    Batch\n',
+        }, check_holds.split_checkjob_output(cmd_output))
+        self.assertEqual({}, check_holds.split_checkjob_output(''))
+
+    def test_get_hold_info(self):
+        jobs = [HeldJob(str(20030000 + job_nr)) for job_nr in xrange(13)]
+        for jobs_per_call in (1, 4, 20):
+            RecordingParser.outputs = []
+            options = Namespace(checkjob=self._checkjob_cmd, workers=3,
+                                jobs_per_call=jobs_per_call)
+            check_holds.get_hold_info(jobs, options)
+            self.assertEqual(sorted(job.id for job in jobs),
+                             sorted(job_id for job_id, _ in
+                                    RecordingParser.outputs))
+            for job_id, output in RecordingParser.outputs:
+                self.assertEqual(
+                    'job {0}\nHolds:    System\n\n'.format(job_id), output
+                )
+
+    def test_failing_checkjob(self):
+        options = Namespace(checkjob=os.path.join(self._dir, 'missing'),
+                            workers=2, jobs_per_call=2)
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            check_holds.get_hold_info([HeldJob('20030021'),
+                                       HeldJob('20030022')], options)
+            self.assertIn('W: could not execute checkjob for '
+                          '20030021,20030022', sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+        self.assertEqual([], RecordingParser.outputs)
+
+    def test_job_ids(self):
+        self._conn.execute('''CREATE TABLE held_jobs
+                                  (job_id INTEGER PRIMARY KEY,
+                                   user TEXT NOT NULL)''')
+        jobs = [HeldJob('20030021'), HeldJob('20030022[3]'),
+                HeldJob('20030023.master1.thinking.gent.vsc')]
+        check_holds.store_hold_info(self._conn, jobs)
+        check_holds.store_hold_info(self._conn, jobs)
+        rows = self._conn.execute('''SELECT job_id, holds
+                                         FROM held_jobs
+                                         ORDER BY job_id''').fetchall()
+        self.assertEqual([(job.id, 'system') for job in jobs], rows)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''module to test the single entry point for the cluster database
+   scripts'''
+
+import os, shutil, sqlite3, StringIO, subprocess, sys, tempfile
+import unittest
+import cluster_db
+from create_node_db import has_table, read_schema_version
+
+class ClusterDbTest(unittest.TestCase):
+    '''Tests running subcommands through the entry point'''
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._db_name = os.path.join(self._dir, 'nodes.db')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_create(self):
+        argv = list(sys.argv)
+        cluster_db.run_command('create', ['--db', self._db_name, '--jobs'])
+        self.assertEqual(argv, sys.argv)
+        with sqlite3.connect(self._db_name) as conn:
+            self.assertTrue(has_table(conn, 'nodes'))
+            self.assertTrue(has_table(conn, 'running_jobs'))
+
+    def test_load_update(self):
+        args = ['--db', self._db_name,
+                '--conf', '../../../vsc-tools-lib/conf/config.json',
+                '--pbsnodes_file', 'data/pbsnodes.txt',
+                '--pbsnodes', '/bin/false', '--showq', '/bin/false',
+                '--cache_ttl', '0']
+        cluster_db.run_command('load', args)
+        with sqlite3.connect(self._db_name) as conn:
+            nr_nodes = conn.execute('''SELECT COUNT(*)
+                                           FROM nodes''').fetchone()[0]
+        self.assertEqual(163, nr_nodes)
+        cluster_db.run_command('update', args)
+        with sqlite3.connect(self._db_name) as conn:
+            hashes = conn.execute('''SELECT COUNT(content_hash)
+                                         FROM nodes''').fetchone()[0]
+        self.assertEqual(nr_nodes, hashes)
+
+    def test_update_old_schema(self):
+        args = ['--db', self._db_name,
+                '--conf', '../../../vsc-tools-lib/conf/config.json',
+                '--pbsnodes_file', 'data/pbsnodes.txt',
+                '--pbsnodes', '/bin/false', '--cache_ttl', '0']
+        cluster_db.run_command('load', args)
+        with sqlite3.connect(self._db_name) as conn:
+            version = read_schema_version(conn)
+            conn.execute('''PRAGMA user_version = 0''')
+            conn.execute('''DROP TABLE node_status''')
+        cluster_db.run_command('update', args)
+        with sqlite3.connect(self._db_name) as conn:
+            self.assertEqual(version, read_schema_version(conn))
+            nr_nodes = conn.execute('''SELECT COUNT(*)
+                                           FROM node_status''').fetchone()[0]
+        self.assertEqual(163, nr_nodes)
+
+    def test_exit(self):
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            with self.assertRaises(SystemExit):
+                cluster_db.run_command('dump', ['--format', 'xml'],
+                                       'cluster_db dump')
+            self.assertIn('usage: cluster_db dump', sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+    def test_startup_times(self):
+        module, import_time = cluster_db.load_command('dump')
+        self.assertEqual('dump_node_states', module.__name__)
+        self.assertTrue(callable(module.main))
+        times = cluster_db.startup_times(import_time)
+        self.assertGreaterEqual(times['startup'], times['imports'])
+
+    def test_lazy_imports(self):
+        code = ('import sys, cluster_db\n'
+                'cluster_db.run_command("dump", sys.argv[1:])\n'
+                'print " ".join(name for name in sys.modules\n'
+                '               if sys.modules[name])\n')
+        process = subprocess.Popen([sys.executable, '-c', code,
+                                    '--pbsnodes_file', 'data/pbsnodes.txt',
+                                    '--output', os.devnull,
+                                    '--cache_ttl', '0'],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        output, _ = process.communicate()
+        self.assertEqual(0, process.returncode)
+        modules = output.split()
+        self.assertIn('dump_node_states', modules)
+        for module_name in ('sqlite3', 'create_node_db',
+                            'summarize_node_db'):
+            self.assertNotIn(module_name, modules)
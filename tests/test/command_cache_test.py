@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+'''module to test the cache for command output'''
+
+import os, shutil, stat, subprocess, tempfile, unittest
+from multiprocessing.pool import ThreadPool
+from command_cache import CommandCache
+
+class CommandCacheTest(unittest.TestCase):
+    '''Tests the cache for command output'''
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache_dir = os.path.join(self._dir, 'cache')
+        self._count_file_name = os.path.join(self._dir, 'count')
+        self._cmd = os.path.join(self._dir, 'cmd')
+        with open(self._cmd, 'w') as cmd_file:
+            cmd_file.write('#!/bin/sh\n'
+                           'echo run >> {0}\n'
+                           'sleep 0.2\n'
+                           'echo "output for $1"\n'
+                           'echo "second line"\n'
+                           'test "$1" != fail\n'.format(
+                               self._count_file_name
+                           ))
+        os.chmod(self._cmd, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _nr_runs(self):
+        try:
+            with open(self._count_file_name, 'r') as count_file:
+                return len(count_file.readlines())
+        except IOError:
+            return 0
+
+    def test_ttl(self):
+        cache = CommandCache(self._cache_dir, 60)
+        expected = 'output for a\nsecond line\n'
+        self.assertEquals(expected, cache.check_output([self._cmd, 'a']))
+        self.assertEquals(expected, cache.check_output([self._cmd, 'a']))
+        self.assertEquals(1, self._nr_runs())
+        self.assertEquals(1, cache.hits)
+        cache.check_output([self._cmd, 'b'])
+        self.assertEquals(2, self._nr_runs())
+        self.assertEquals([], [file_name
+                               for file_name in os.listdir(self._cache_dir)
+                               if file_name.startswith('.')])
+        os.utime(cache.file_name([self._cmd, 'a']), (0, 0))
+        cache.check_output([self._cmd, 'a'])
+        self.assertEquals(3, self._nr_runs())
+
+    def test_no_cache(self):
+        cache = CommandCache(self._cache_dir, 0)
+        cache.check_output([self._cmd, 'a'])
+        cache.check_output([self._cmd, 'a'])
+        self.assertEquals(2, self._nr_runs())
+        self.assertFalse(os.path.exists(self._cache_dir))
+
+    def test_unsafe_cache_dir(self):
+        cache = CommandCache(self._cache_dir, 60)
+        cache.check_output([self._cmd, 'a'])
+        self.assertEquals(0700, stat.S_IMODE(os.stat(self._cache_dir).st_mode))
+        os.chmod(self._cache_dir, 0777)
+        os.utime(cache.file_name([self._cmd, 'a']), None)
+        cache.check_output([self._cmd, 'a'])
+        self.assertEquals(['output for a\n', 'second line\n'],
+                          list(cache.iter_output([self._cmd, 'a'])))
+        self.assertEquals(3, self._nr_runs())
+        self.assertEquals(0, cache.hits)
+
+    def test_foreign_cache_dir(self):
+        if os.getuid() != 0:
+            self.skipTest('changing the owner requires root')
+        os.makedirs(self._cache_dir, 0700)
+        os.chown(self._cache_dir, 65534, -1)
+        cache = CommandCache(self._cache_dir, 60)
+        cache.check_output([self._cmd, 'a'])
+        cache.check_output([self._cmd, 'a'])
+        self.assertEquals(2, self._nr_runs())
+        self.assertEquals([], os.listdir(self._cache_dir))
+
+    def test_failure(self):
+        cache = CommandCache(self._cache_dir, 60)
+        for _ in xrange(2):
+            with self.assertRaises(subprocess.CalledProcessError):
+                cache.check_output([self._cmd, 'fail'])
+        self.assertEquals(2, self._nr_runs())
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(cache.iter_output([self._cmd, 'fail']))
+        self.assertFalse(os.path.exists(cache.file_name([self._cmd,
+                                                         'fail'])))
+
+    def test_concurrent(self):
+        cache = CommandCache(self._cache_dir, 60)
+        pool = ThreadPool(4)
+        try:
+            outputs = pool.map(lambda _: cache.check_output([self._cmd, 'a']),
+                               xrange(8))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEquals(1, len(set(outputs)))
+        self.assertEquals(1, self._nr_runs())
+
+    def test_iter_output(self):
+        cache = CommandCache(self._cache_dir, 60)
+        lines = list(cache.iter_output([self._cmd, 'a']))
+        self.assertEquals(['output for a\n', 'second line\n'], lines)
+        self.assertEquals(lines, list(cache.iter_output([self._cmd, 'a'])))
+        self.assertEquals(''.join(lines),
+                          cache.check_output([self._cmd, 'a']))
+        self.assertEquals(1, self._nr_runs())
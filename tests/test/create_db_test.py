@@ -21,8 +21,11 @@ class CreateNodeDbTest(unittest.TestCase):
             pass
 
     def test_create(self):
-        tables = {'partitions', 'nodes', 'properties', 'features',
-                  'qos_levels'}
+        tables = {'clusters', 'partitions', 'nodes', 'property_names',
+                  'node_properties', 'feature_names', 'node_features',
+                  'node_status', 'node_checks', 'qos_levels',
+                  'partition_summary', 'rack_summary', 'iru_summary',
+                  'feature_summary'}
         with sqlite3.connect(self._file_name) as conn:
             create_node_db.init_db(conn, create_node_db.DB_DESC)
             cursor = conn.cursor()
@@ -34,3 +37,58 @@ class CreateNodeDbTest(unittest.TestCase):
                     self.assertIn(row[0], tables)
                     nr_rows += 1
             self.assertEquals(len(tables), nr_rows)
+
+    def test_compatibility_views(self):
+        with sqlite3.connect(self._file_name) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC)
+            cursor = conn.cursor()
+            cursor.execute("""INSERT INTO property_names (property)
+                                  VALUES ('ivybridge')""")
+            cursor.execute("""INSERT INTO node_properties
+                                  (node_id, property_id) VALUES (1, ?)""",
+                           (cursor.lastrowid, ))
+            result = cursor.execute("""SELECT node_id, property
+                                           FROM properties""")
+            self.assertEquals([(1, 'ivybridge')], result.fetchall())
+            create_node_db.init_db(conn, create_node_db.DB_DESC, force=True)
+            result = cursor.execute("""SELECT name FROM sqlite_master
+                                           WHERE type = 'view'""")
+            self.assertEquals({'properties', 'features'},
+                              set(row[0] for row in result))
+
+    def test_prepare_schema(self):
+        schema = create_node_db.prepare_schema(create_node_db.DB_DESC)
+        self.assertIs(schema,
+                      create_node_db.prepare_schema(create_node_db.DB_DESC))
+        self.assertEquals(set(create_node_db.DB_DESC),
+                          set(table_name for table_name, _ in schema))
+        is_view = [table_desc.get('type') == 'view'
+                   for _, table_desc in schema]
+        self.assertEquals(sorted(is_view), is_view)
+
+    def test_schema_transaction(self):
+        with sqlite3.connect(self._file_name) as conn:
+            isolation_level = conn.isolation_level
+            with self.assertRaises(sqlite3.OperationalError):
+                with create_node_db.schema_transaction(conn):
+                    conn.execute('''CREATE TABLE t1 (x INTEGER)''')
+                    conn.execute('''CREATE TABLE t1 (x INTEGER)''')
+            self.assertEquals(isolation_level, conn.isolation_level)
+            self.assertFalse(create_node_db.has_table(conn, 't1'))
+
+    def test_schema_version(self):
+        version = create_node_db.schema_version(create_node_db.DB_DESC)
+        self.assertNotEqual(
+            version,
+            create_node_db.schema_version(create_node_db.HISTORY_DB_DESC)
+        )
+        with sqlite3.connect(self._file_name) as conn:
+            self.assertFalse(create_node_db.has_schema(
+                conn, create_node_db.DB_DESC
+            ))
+            create_node_db.init_db(conn, create_node_db.DB_DESC)
+            self.assertEquals(version,
+                              create_node_db.read_schema_version(conn))
+            self.assertTrue(create_node_db.has_schema(
+                conn, create_node_db.DB_DESC
+            ))
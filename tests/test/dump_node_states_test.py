@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+'''module to test dumping node states'''
+
+import json, sqlite3, StringIO, sys, unittest
+import create_node_db
+import dump_node_states
+import load_node_db
+
+class DumpNodeStatesTest(unittest.TestCase):
+    '''Tests for dumping node states from pbsnodes output and a node
+       database'''
+
+    def setUp(self):
+        with open('../../../vsc-tools-lib/conf/config.json', 'r') as config:
+            self._partitions = json.load(config)['partitions']
+        self._stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self._stderr
+
+    def _pbsnodes_rows(self, *args):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            nodes = load_node_db.iter_nodes(pbsnodes_file)
+            return list(dump_node_states.pbsnodes_rows(
+                nodes, self._partitions, *args
+            ))
+
+    def _db_rows(self, *args):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            nodes = list(load_node_db.iter_nodes(pbsnodes_file))
+        conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(conn, create_node_db.DB_DESC,
+                               create_jobs_tables=True)
+        partitions = load_node_db.insert_partitions(conn, self._partitions)
+        load_node_db.insert_node_info(conn, nodes, partitions, do_jobs=True)
+        rows = list(dump_node_states.db_rows(conn, *args, fetch_size=10))
+        conn.close()
+        return rows
+
+    def test_filters(self):
+        self.assertEqual(163, len(self._pbsnodes_rows()))
+        rows = self._pbsnodes_rows(set(['gpu', 'phi']))
+        self.assertEqual(20, len(rows))
+        self.assertEqual(set(['gpu', 'phi']), set(row[1] for row in rows))
+        rows = self._pbsnodes_rows(None, set([1]))
+        self.assertTrue(rows)
+        self.assertEqual(set([1]), set(row[2] for row in rows))
+        rows = self._pbsnodes_rows(None, None, set(['free']))
+        self.assertTrue(rows)
+        self.assertTrue(all('free' in row[6].split(',') for row in rows))
+
+    def test_db(self):
+        self.assertEqual(self._pbsnodes_rows(), self._db_rows())
+        self.assertEqual(self._pbsnodes_rows(set(['gpu']), None,
+                                             set(['free'])),
+                         self._db_rows(set(['gpu']), None, set(['free'])))
+
+    def test_formats(self):
+        rows = self._pbsnodes_rows()
+        columns = ['hostname', 'state', 'mem', 'jobs']
+        out = StringIO.StringIO()
+        nr_rows = dump_node_states.dump_rows(out, rows, columns, 'csv',
+                                             chunk_size=128)
+        self.assertEqual(len(rows), nr_rows)
+        lines = out.getvalue().splitlines()
+        self.assertEqual('hostname;state;mem;jobs', lines[0])
+        self.assertEqual(len(rows) + 1, len(lines))
+        out = StringIO.StringIO()
+        dump_node_states.dump_rows(out, rows, columns, 'jsonl')
+        first = json.loads(out.getvalue().splitlines()[0])
+        self.assertEqual(rows[0][0], first['hostname'])
+        self.assertEqual(rows[0][5], first['mem'])
+        out = StringIO.StringIO()
+        dump_node_states.dump_rows(out, rows, columns, 'binary')
+        out.seek(0)
+        result = list(dump_node_states.read_binary(out))
+        self.assertEqual(columns, result[0])
+        self.assertEqual([(row[0], row[6], row[5], row[9]) for row in rows],
+                         result[1:])
+
+    def test_chunks(self):
+        out = StringIO.StringIO()
+        writer = dump_node_states.ChunkedWriter(out, 10)
+        writer.write('12345')
+        self.assertEqual('', out.getvalue())
+        writer.write('67890')
+        self.assertEqual('1234567890', out.getvalue())
+        writer.write('a')
+        writer.flush()
+        self.assertEqual('1234567890a', out.getvalue())
+        self.assertEqual(2, writer.nr_chunks)
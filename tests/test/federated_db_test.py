@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+'''module to test loading several clusters into a single database'''
+
+import json, os, shutil, sqlite3, stat, StringIO, sys, tempfile, time
+import unittest
+from contextlib import closing
+import create_node_db
+import load_federated_db
+import update_node_db
+from capacity_engine import CapacityEngine
+from generate_cluster import ClusterGenerator, read_templates
+from node_db import NodeDB
+
+class FederatedDbTest(unittest.TestCase):
+    '''Tests loading several clusters into a single database'''
+
+    def setUp(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            config = json.load(config_file)
+        self._dir = tempfile.mkdtemp()
+        pbsnodes_cmd = os.path.join(self._dir, 'pbsnodes')
+        with open(pbsnodes_cmd, 'w') as cmd_file:
+            cmd_file.write('#!/bin/sh\n'
+                           'sleep 1\n'
+                           'cat {0}\n'.format(os.path.abspath(
+                               'data/pbsnodes.txt'
+                           )))
+        os.chmod(pbsnodes_cmd, stat.S_IRWXU)
+        self._clusters = {
+            'first': {
+                'partitions': config['partitions'],
+                'qos_levels': config['qos_levels'],
+                'pbsnodes_cmd': pbsnodes_cmd,
+            },
+            'second': {
+                'partitions': ['thinking'],
+                'qos_levels': config['qos_levels'] + ['other'],
+                'pbsnodes_cmd': pbsnodes_cmd,
+            },
+        }
+        self._conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(self._conn, create_node_db.DB_DESC)
+        self._stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self._stderr
+        self._conn.close()
+        shutil.rmtree(self._dir)
+
+    def test_load(self):
+        start_time = time.time()
+        nr_nodes = load_federated_db.load_clusters(self._conn,
+                                                   self._clusters)
+        self.assertTrue(time.time() - start_time < 1.8)
+        self.assertEquals({'first': 163, 'second': 143}, nr_nodes)
+        cursor = self._conn.cursor()
+        result = cursor.execute(
+            '''SELECT cluster_name, partition_name, COUNT(*)
+                   FROM nodes
+                        JOIN partitions USING (partition_id)
+                        JOIN clusters
+                            ON clusters.cluster_id = nodes.cluster_id
+                   WHERE partitions.cluster_id = nodes.cluster_id
+                   GROUP BY cluster_name, partition_name'''
+        )
+        self.assertEquals([('first', 'gpu', 12), ('first', 'phi', 8),
+                           ('first', 'thinking', 143),
+                           ('second', 'thinking', 143)],
+                          sorted(result.fetchall()))
+        result = cursor.execute('''SELECT COUNT(*) FROM qos_levels''')
+        self.assertEquals(len(self._clusters['second']['qos_levels']),
+                          result.fetchone()[0])
+        result = cursor.execute(
+            '''SELECT cluster_name, SUM(nr_nodes)
+                   FROM rack_summary
+                        JOIN clusters USING (cluster_id)
+                   GROUP BY cluster_name'''
+        )
+        self.assertEquals([('first', 163), ('second', 143)],
+                          sorted(result.fetchall()))
+
+    def test_error(self):
+        self._clusters['second']['pbsnodes_cmd'] = os.path.join(self._dir,
+                                                                'missing')
+        with self.assertRaises(SystemExit):
+            load_federated_db.load_clusters(self._conn, self._clusters)
+
+    def test_jobs(self):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            generator = ClusterGenerator(read_templates(pbsnodes_file), 40,
+                                         seed=13)
+        pbsnodes_file_name = os.path.join(self._dir, 'pbsnodes.txt')
+        with open(pbsnodes_file_name, 'w') as pbsnodes_file:
+            generator.write_pbsnodes(pbsnodes_file)
+        showq_file_name = os.path.join(self._dir, 'showq.txt')
+        with open(showq_file_name, 'w') as showq_file:
+            generator.write_showq(showq_file)
+        for cluster in self._clusters.values():
+            cluster['pbsnodes_file'] = pbsnodes_file_name
+            cluster['showq_file'] = showq_file_name
+        db_name = os.path.join(self._dir, 'nodes.db')
+        with closing(sqlite3.connect(db_name)) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                   create_jobs_tables=True)
+            load_federated_db.load_clusters(conn, self._clusters,
+                                            do_jobs=True)
+            self.assertEquals([], conn.execute(
+                '''PRAGMA foreign_key_check'''
+            ).fetchall())
+            cluster_ids = dict(conn.execute(
+                '''SELECT cluster_name, cluster_id FROM clusters'''
+            ))
+            job_id, hostname = conn.execute(
+                '''SELECT job_id, hostname
+                       FROM running_jobs JOIN nodes USING (node_id)
+                       WHERE nodes.cluster_id = ?
+                       ORDER BY job_id, hostname''', (cluster_ids['second'], )
+            ).fetchone()
+            first_nodes = conn.execute(
+                '''SELECT COUNT(*) FROM nodes WHERE cluster_id = ?''',
+                (cluster_ids['first'], )
+            ).fetchone()[0]
+            self.assertEquals(first_nodes, CapacityEngine(
+                conn, 'first'
+            ).count_nodes())
+        node_db = NodeDB(db_name)
+        self.assertEquals(['first', 'second'], node_db.clusters())
+        with self.assertRaises(ValueError):
+            node_db.node(hostname)
+        with self.assertRaises(ValueError):
+            node_db.nodes_of_job(job_id)
+        for cluster_name in cluster_ids:
+            node = node_db.node(hostname, cluster_name)
+            self.assertEquals(cluster_name, node.cluster)
+            self.assertIn(str(job_id), [job[0] for job in
+                                        node_db.jobs_on_node(hostname,
+                                                             cluster_name)])
+            node_ids = node_db.nodes_of_job(job_id, cluster_name)
+            self.assertIn(node.node_id, node_ids)
+            self.assertEquals(set([cluster_name]),
+                              set(node_db.node(node_db.hostnames([node_id])[0],
+                                               cluster_name).cluster
+                                  for node_id in node_ids))
+        with closing(sqlite3.connect(db_name)) as conn:
+            partitions = update_node_db.update_partitions(
+                conn, ['thinking'], cluster_ids['second']
+            )
+            update_node_db.update_node_info(conn, [], partitions, True,
+                                            cluster_id=cluster_ids['second'])
+            update_node_db.update_jobs(conn, {}, cluster_ids['second'])
+            result = conn.execute(
+                '''SELECT cluster_id, COUNT(*) FROM nodes
+                       GROUP BY cluster_id'''
+            )
+            self.assertEquals([(cluster_ids['first'], first_nodes)],
+                              result.fetchall())
+            for table_name in ('jobs', 'running_jobs'):
+                result = conn.execute(
+                    '''SELECT DISTINCT cluster_id FROM {0}'''.format(
+                        table_name
+                    )
+                )
+                self.assertEquals([(cluster_ids['first'], )],
+                                  result.fetchall())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+'''module to test the collection of node state history'''
+
+import os, shutil, unittest
+import collect_node_history
+
+class NodeHistoryTest(unittest.TestCase):
+    '''Tests the collection of node state history by replaying dumps'''
+
+    def setUp(self):
+        self._file_name = 'data/history.db'
+        self._dump_dir = 'data/dumps'
+        self.tearDown()
+        os.mkdir(self._dump_dir)
+        for dump_nr in xrange(3):
+            dump_name = 'pbsnodes_{0:d}.txt'.format(dump_nr)
+            shutil.copy('data/pbsnodes.txt',
+                        os.path.join(self._dump_dir, dump_name))
+
+    def tearDown(self):
+        for file_name in [self._file_name, self._file_name + '-wal',
+                          self._file_name + '-shm']:
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+        shutil.rmtree(self._dump_dir, ignore_errors=True)
+
+    def test_next_sample_time(self):
+        next_sample_time = collect_node_history.next_sample_time
+        self.assertEquals(160.0, next_sample_time(100.0, 60.0, 130.0))
+        self.assertEquals(160.0, next_sample_time(100.0, 60.0, 100.0))
+        self.assertEquals(280.0, next_sample_time(100.0, 60.0, 250.0))
+        self.assertEquals(280.0, next_sample_time(100.0, 60.0, 220.0))
+        self.assertEquals(250.0, next_sample_time(100.0, 0.0, 250.0))
+
+    def test_replay(self):
+        nr_nodes = 173
+        conn = collect_node_history.open_history_db(self._file_name)
+        try:
+            nr_samples = collect_node_history.replay_dumps(conn,
+                                                           self._dump_dir)
+            self.assertEquals(3, nr_samples)
+            cursor = conn.cursor()
+            result = cursor.execute('''PRAGMA journal_mode''')
+            self.assertEquals('wal', result.fetchone()[0])
+            result = cursor.execute('''SELECT sampletime, nr_nodes
+                                           FROM samples''')
+            self.assertEquals([(1410207632, nr_nodes)]*3, result.fetchall())
+            result = cursor.execute('''SELECT s.state, s.loadave,
+                                              s.availmem, s.nr_jobs,
+                                              s.rectime
+                                           FROM node_samples AS s
+                                               JOIN history_nodes
+                                                   USING (node_id)
+                                           WHERE hostname = 'r1i0n1' ''')
+            self.assertEquals([(u'job-exclusive', 20.13, 24891628, 1,
+                                1410207630)]*3, result.fetchall())
+            result = cursor.execute('''SELECT count(*) FROM node_samples''')
+            self.assertEquals(3*nr_nodes, result.fetchone()[0])
+            result = cursor.execute('''SELECT count(*) FROM history_nodes''')
+            self.assertEquals(nr_nodes, result.fetchone()[0])
+        finally:
+            conn.close()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''module to test the bulk ingest of archived dumps into a history
+   database'''
+
+import gzip, os, shutil, tarfile, tempfile, unittest
+import ingest_node_history
+from collect_node_history import open_history_db
+from generate_cluster import ClusterGenerator, read_templates
+from vsc.moab.showq import ShowqParser
+
+class IngestHistoryTest(unittest.TestCase):
+    '''Tests the bulk ingest of archived pbsnodes and showq dumps'''
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._dump_dir = os.path.join(self._dir, 'dumps')
+        self._db_name = os.path.join(self._dir, 'history.db')
+        os.makedirs(os.path.join(self._dump_dir, 'day1'))
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            templates = read_templates(pbsnodes_file)
+        for dump_nr in xrange(3):
+            shutil.copy('data/pbsnodes.txt',
+                        os.path.join(self._dump_dir, 'day1',
+                                     'pbsnodes_{0:d}.txt'.format(dump_nr)))
+        generator = ClusterGenerator(templates, 100, seed=13)
+        showq_name = os.path.join(self._dump_dir, 'day1', 'showq_1.txt.gz')
+        with gzip.open(showq_name, 'wb') as showq_file:
+            generator.write_showq(showq_file)
+        with gzip.open(showq_name, 'rb') as showq_file:
+            self._jobs = ShowqParser().parse(showq_file.read())
+        with open(os.path.join(self._dump_dir, 'README'), 'w') as readme:
+            readme.write('not a dump\n')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _ingest(self, archive, **kwargs):
+        conn = open_history_db(self._db_name)
+        try:
+            nr_dumps = ingest_node_history.ingest(
+                conn, ingest_node_history.iter_dumps(archive), 2, **kwargs
+            )
+            counts = [conn.execute(query).fetchone()[0] for query in [
+                '''SELECT COUNT(*) FROM samples''',
+                '''SELECT COUNT(*) FROM node_samples''',
+                '''SELECT COUNT(*) FROM history_nodes''',
+                '''SELECT COUNT(*) FROM job_samples''',
+                '''SELECT COUNT(*) FROM ingested_files''',
+                '''SELECT COUNT(*) FROM node_samples
+                       WHERE node_id NOT IN
+                           (SELECT node_id FROM history_nodes)''',
+            ]]
+            sample = conn.execute(
+                '''SELECT s.sampletime, s.nr_nodes, s.nr_active_jobs
+                       FROM samples AS s JOIN snapshots USING (sample_id)
+                       WHERE snapshot = ?''',
+                (os.path.join('day1', '1.txt'), )
+            ).fetchone()
+        finally:
+            conn.close()
+        return nr_dumps, counts, sample
+
+    def test_dump_kind(self):
+        self.assertEqual(('pbsnodes', 'day1/0101.txt'),
+                         ingest_node_history.dump_kind(
+                             'day1/pbsnodes_0101.txt'
+                         ))
+        self.assertEqual(('showq', 'day1/0101.txt'),
+                         ingest_node_history.dump_kind(
+                             'day1/showq-0101.txt.gz'
+                         ))
+        self.assertEqual((None, None),
+                         ingest_node_history.dump_kind('day1/README'))
+
+    def test_ingest_dir(self):
+        nr_nodes = 173
+        nr_jobs = sum(len(jobs) for jobs in self._jobs.values())
+        nr_dumps, counts, sample = self._ingest(self._dump_dir,
+                                                batch_size=2)
+        self.assertEqual(4, nr_dumps)
+        self.assertEqual([3, 3*nr_nodes, nr_nodes, nr_jobs, 4, 0], counts)
+        self.assertEqual((1410207632, nr_nodes, len(self._jobs['active'])),
+                         sample)
+
+    def test_ingest_tar(self):
+        tar_name = os.path.join(self._dir, 'dumps.tar.gz')
+        with tarfile.open(tar_name, 'w:gz') as tar:
+            tar.add(self._dump_dir, arcname='.')
+        _, dir_counts, dir_sample = self._ingest(self._dump_dir)
+        os.remove(self._db_name)
+        nr_dumps, counts, sample = self._ingest(tar_name)
+        self.assertEqual(4, nr_dumps)
+        self.assertEqual(dir_counts, counts)
+        self.assertEqual(dir_sample, sample)
+
+    def test_resume(self):
+        os.rename(os.path.join(self._dump_dir, 'day1', 'pbsnodes_1.txt'),
+                  os.path.join(self._dir, 'pbsnodes_1.txt'))
+        nr_dumps, counts, sample = self._ingest(self._dump_dir)
+        self.assertEqual(3, nr_dumps)
+        self.assertEqual(0, sample[1])
+        os.rename(os.path.join(self._dir, 'pbsnodes_1.txt'),
+                  os.path.join(self._dump_dir, 'day1', 'pbsnodes_1.txt'))
+        nr_dumps, resumed_counts, sample = self._ingest(self._dump_dir)
+        self.assertEqual(1, nr_dumps)
+        self.assertEqual(173, sample[1])
+        self.assertEqual(3, resumed_counts[0])
+        self.assertEqual(counts[2], resumed_counts[2])
+        nr_dumps, _, _ = self._ingest(self._dump_dir)
+        self.assertEqual(0, nr_dumps)
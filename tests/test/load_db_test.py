@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 '''module to test the loading of a cluster database'''
 
-import json, os, sqlite3, StringIO, sys, unittest
+import json, os, shutil, sqlite3, stat, StringIO, sys, tempfile
+import unittest
 import create_node_db
 import load_node_db
 from vsc.pbs.pbsnodes import PbsnodesParser
@@ -66,3 +67,106 @@ class LoadNodeDbTest(unittest.TestCase):
             result = cursor.execute("""SELECT count(*) FROM properties
                                            WHERE property = 'ivybridge'""")
             self.assertEquals(nr_ivybridge_nodes, result.fetchone()[0])
+
+    def test_load_bulk(self):
+        pbsnodes_file_name = 'data/pbsnodes.txt'
+        partitions = self._config['partitions']
+        error_msg = 'E: node r3i0n2 has no status\n'
+        nr_128gb_nodes = 32
+        nr_ivybridge_nodes = 143
+        with open(pbsnodes_file_name, 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        with sqlite3.connect(self._file_name) as conn:
+            partition_ids = load_node_db.insert_partitions(conn, partitions)
+            stderr_tmp = sys.stderr
+            sys.stderr = StringIO.StringIO()
+            nr_inserted = load_node_db.insert_node_info_bulk(
+                conn, nodes, partition_ids, batch_size=50
+            )
+            self.assertEquals(error_msg, sys.stderr.getvalue())
+            sys.stderr = stderr_tmp
+            cursor = conn.cursor()
+            result = cursor.execute('''SELECT count(*) FROM nodes''')
+            self.assertEquals(nr_inserted, result.fetchone()[0])
+            result = cursor.execute("""SELECT count(*) FROM features
+                                           WHERE feature = 'mem128'""")
+            self.assertEquals(nr_128gb_nodes, result.fetchone()[0])
+            result = cursor.execute("""SELECT count(*) FROM properties
+                                           WHERE property = 'ivybridge'""")
+            self.assertEquals(nr_ivybridge_nodes, result.fetchone()[0])
+            result = cursor.execute('''SELECT count(*)
+                                           FROM nodes, node_status
+                                           WHERE nodes.node_id =
+                                                 node_status.node_id''')
+            self.assertEquals(nr_inserted, result.fetchone()[0])
+            result = cursor.execute('''SELECT count(*)
+                                           FROM nodes, partitions
+                                           WHERE nodes.partition_id =
+                                                 partitions.partition_id''')
+            self.assertEquals(nr_inserted, result.fetchone()[0])
+
+    def test_stream_nodes(self):
+        pbsnodes_file_name = 'data/pbsnodes.txt'
+        with open(pbsnodes_file_name, 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        stream = load_node_db.stream_nodes(None, pbsnodes_file_name)
+        self.assertEquals([node.hostname for node in nodes],
+                          [node.hostname for node in stream])
+
+    def test_stream_errors(self):
+        with self.assertRaises(IOError):
+            load_node_db.stream_nodes(None, 'data/no_such_file.txt')
+        with self.assertRaises(OSError):
+            load_node_db.stream_records('data/no_such_command')
+        with self.assertRaises(SystemExit):
+            with load_node_db.exit_on_pbsnodes_error():
+                list(load_node_db.stream_nodes('/bin/false'))
+
+    def test_partitions_before_pbsnodes(self):
+        tmp_dir = tempfile.mkdtemp()
+        db_name = os.path.join(tmp_dir, 'nodes.db')
+        marker_name = os.path.join(tmp_dir, 'nr_partitions')
+        pbsnodes_cmd = os.path.join(tmp_dir, 'pbsnodes')
+        with open(pbsnodes_cmd, 'w') as cmd_file:
+            cmd_file.write('''#!{0}
+import sqlite3, sys, time
+nr_partitions = 0
+deadline = time.time() + 5.0
+while not nr_partitions and time.time() < deadline:
+    time.sleep(0.05)
+    try:
+        conn = sqlite3.connect({1!r}, timeout=0.1)
+        nr_partitions = conn.execute(
+            "SELECT COUNT(*) FROM partitions"
+        ).fetchone()[0]
+        conn.close()
+    except sqlite3.Error:
+        pass
+with open({2!r}, 'w') as marker_file:
+    marker_file.write(str(nr_partitions))
+with open({3!r}, 'r') as pbsnodes_file:
+    sys.stdout.write(pbsnodes_file.read())
+'''.format(sys.executable, db_name, marker_name,
+           os.path.abspath('data/pbsnodes.txt')))
+        os.chmod(pbsnodes_cmd, stat.S_IRWXU)
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            load_node_db.main(['--db', db_name, '--parallel',
+                               '--conf', config_file_name,
+                               '--pbsnodes', pbsnodes_cmd, '--cache_ttl', '0'])
+        finally:
+            sys.stderr = stderr
+        try:
+            with open(marker_name, 'r') as marker_file:
+                self.assertEquals(len(self._config['partitions']),
+                                  int(marker_file.read()))
+            with sqlite3.connect(db_name) as conn:
+                nr_nodes = conn.execute('''SELECT COUNT(*)
+                                               FROM nodes''').fetchone()[0]
+            self.assertEquals(163, nr_nodes)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+'''module to test the metrics of the phases of a load'''
+
+import json, os, shutil, sqlite3, StringIO, sys, tempfile, unittest
+import create_node_db
+import load_node_db
+from load_metrics import LoadMetrics, NO_METRICS
+
+class LoadMetricsTest(unittest.TestCase):
+    '''Tests for the metrics of the phases of a load'''
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_phases(self):
+        metrics = LoadMetrics()
+        with metrics.phase('parse') as phase:
+            phase.rows = 10
+        with metrics.phase('commit'):
+            pass
+        metrics.add('classify', 0.5, 20)
+        phases = dict((phase['name'], phase)
+                      for phase in metrics.to_dict()['phases'])
+        self.assertEqual(set(['parse', 'commit', 'classify']), set(phases))
+        self.assertEqual(10, phases['parse']['rows'])
+        self.assertIsNone(phases['commit']['rows'])
+        self.assertIsNone(phases['commit']['rows_per_s'])
+        self.assertAlmostEqual(40.0, phases['classify']['rows_per_s'])
+        self.assertTrue(phases['parse']['cumulative_peak_rss'] > 0)
+        self.assertTrue(phases['parse']['cumulative_peak_rss'] <=
+                        phases['commit']['cumulative_peak_rss'])
+        self.assertEqual(3, len(metrics.phases))
+
+    def test_disabled(self):
+        with NO_METRICS.phase('parse') as phase:
+            phase.rows = 10
+        NO_METRICS.add('classify', 0.5, 20)
+        self.assertEqual([], NO_METRICS.phases)
+
+    def test_prometheus(self):
+        metrics = LoadMetrics()
+        metrics.add('insert_jobs', 2.0, 10)
+        metrics.add('insert_jobs', 2.0, 30)
+        lines = metrics.to_prometheus().splitlines()
+        self.assertIn('vsc_cluster_db_load_phase_rows{phase="insert_jobs"} 40',
+                      lines)
+        self.assertIn(('vsc_cluster_db_load_phase_rows_per_second'
+                       '{phase="insert_jobs"} 10.0'), lines)
+        self.assertIn('# TYPE vsc_cluster_db_load_phase_seconds gauge',
+                      lines)
+
+    def test_write(self):
+        metrics = LoadMetrics()
+        metrics.add('parse', 1.0, 10)
+        file_name = os.path.join(self._dir, 'metrics.json')
+        metrics.write(file_name)
+        with open(file_name, 'r') as metrics_file:
+            result = json.load(metrics_file)
+        self.assertEqual('parse', result['phases'][0]['name'])
+        self.assertEqual(['metrics.json'], os.listdir(self._dir))
+
+    def test_load(self):
+        with open('../../../vsc-tools-lib/conf/config.json', 'r') as config:
+            partitions = json.load(config)['partitions']
+        metrics = LoadMetrics()
+        nodes = load_node_db.get_nodes(None, 'data/pbsnodes.txt',
+                                       metrics=metrics)
+        conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(conn, create_node_db.DB_DESC)
+        partitions = load_node_db.insert_partitions(conn, partitions)
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            nr_nodes = load_node_db.insert_node_info_bulk(
+                conn, nodes, partitions, metrics=metrics
+            )
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(163, nr_nodes)
+        phases = dict((phase['name'], phase)
+                      for phase in metrics.to_dict()['phases'])
+        self.assertEqual(['classify', 'collect', 'commit', 'parse'],
+                         sorted(phases))
+        self.assertEqual(len(nodes), phases['parse']['rows'])
+        self.assertEqual(len(nodes), phases['classify']['rows'])
+
+    def test_stream_and_update(self):
+        db_name = os.path.join(self._dir, 'nodes.db')
+        args = ['--db', db_name, '--pbsnodes', '/bin/false',
+                '--pbsnodes_file', 'data/pbsnodes.txt',
+                '--conf', '../../../vsc-tools-lib/conf/config.json']
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            nr_lines = len(pbsnodes_file.readlines())
+        nr_parsed = []
+        for mode in ['--stream', '--update', '--update']:
+            file_name = os.path.join(self._dir, 'metrics.json')
+            stderr = sys.stderr
+            sys.stderr = StringIO.StringIO()
+            try:
+                load_node_db.main(args + [mode, '--metrics', file_name])
+            finally:
+                sys.stderr = stderr
+            with open(file_name, 'r') as metrics_file:
+                phases = dict((phase['name'], phase) for phase in
+                              json.load(metrics_file)['phases'])
+            self.assertEqual(nr_lines, phases['collect']['rows'])
+            nr_parsed.append(phases['parse']['rows'])
+        # nodes in no partition are not stored, so they are always parsed
+        self.assertEqual([173, 173, 173 - 163], nr_parsed)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+'''module to test the collection of checknode information'''
+
+import os, sqlite3, stat, tempfile, unittest
+import create_node_db
+import collect_node_checks
+
+class NodeChecksTest(unittest.TestCase):
+    '''Tests the parsing and storing of checknode information'''
+
+    def setUp(self):
+        self._file_name = 'data/nodes.db'
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    def tearDown(self):
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    def test_timeout(self):
+        cmd_fd, cmd_name = tempfile.mkstemp()
+        with os.fdopen(cmd_fd, 'w') as cmd_file:
+            cmd_file.write('#!/bin/sh\nexec sleep 10\n')
+        os.chmod(cmd_name, stat.S_IRWXU)
+        try:
+            self.assertEquals({}, collect_node_checks.collect_node_checks(
+                cmd_name, ['r1i0n1', 'r1i0n2'], timeout=0.5
+            ))
+        finally:
+            os.remove(cmd_name)
+
+    def test_collect_all(self):
+        cmd_fd, cmd_name = tempfile.mkstemp()
+        with os.fdopen(cmd_fd, 'w') as cmd_file:
+            cmd_file.write('#!/bin/sh\n'
+                           'test "$1" = ALL || exit 1\n'
+                           'exec cat {0}\n'.format(
+                               os.path.abspath('data/checknode.txt')
+                           ))
+        os.chmod(cmd_name, stat.S_IRWXU)
+        try:
+            node_checks = collect_node_checks.collect_all_node_checks(
+                cmd_name
+            )
+        finally:
+            os.remove(cmd_name)
+        with open('data/checknode.txt', 'r') as checknode_file:
+            self.assertEquals(collect_node_checks.read_node_checks(
+                checknode_file
+            ), node_checks)
+        self.assertEquals(set(['r1i0n1', 'r1i0n2', 'r3i0n2']),
+                          set(node_checks.keys()))
+        self.assertEquals('Busy', node_checks['r1i0n2']['state'])
+
+    def test_read(self):
+        with open('data/checknode.txt', 'r') as checknode_file:
+            node_checks = collect_node_checks.read_node_checks(
+                checknode_file
+            )
+        self.assertEquals(set(['r1i0n1', 'r1i0n2', 'r3i0n2']),
+                          set(node_checks.keys()))
+        info = node_checks['r1i0n2']
+        self.assertEquals('Busy', info['state'])
+        self.assertAlmostEquals(20.08, info['cpuload'])
+        self.assertEquals(20, info['conf_procs'])
+        self.assertEquals(62*1024, info['conf_mem'])
+        self.assertEquals(29*1024, info['util_mem'])
+        self.assertEquals(60*1024, info['ded_mem'])
+        info = node_checks['r3i0n2']
+        self.assertEquals('Down', info['state'])
+        self.assertNotIn('util_procs', info)
+
+    def test_insert(self):
+        with open('data/checknode.txt', 'r') as checknode_file:
+            node_checks = collect_node_checks.read_node_checks(
+                checknode_file
+            )
+        with sqlite3.connect(self._file_name) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC)
+            cursor = conn.cursor()
+            cursor.executemany('''INSERT INTO nodes
+                                      (hostname, partition_id, np, mem)
+                                      VALUES (?, 1, 20, 64)''',
+                               [('r1i0n1', ), ('r1i0n2', ), ('r1i0n3', )])
+            nr_checks = collect_node_checks.insert_node_checks(conn,
+                                                               node_checks)
+            self.assertEquals(2, nr_checks)
+            result = cursor.execute('''SELECT hostname, util_procs
+                                           FROM nodes, node_checks
+                                           WHERE nodes.node_id =
+                                                 node_checks.node_id''')
+            self.assertEquals(set([('r1i0n1', 20), ('r1i0n2', 20)]),
+                              set(result.fetchall()))
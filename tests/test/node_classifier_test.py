@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+'''module to test the memoized classification of nodes'''
+
+import json, unittest
+from vsc.pbs.pbsnodes import PbsnodesParser
+from vsc.pbs.utils import compute_features, compute_partition
+from vsc.utils import hostname2rackinfo
+from node_classifier import NodeClassifier, lookup_partition_id
+
+class NodeClassifierTest(unittest.TestCase):
+    '''Tests for the memoized classification of nodes'''
+
+    def setUp(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            self._partitions = json.load(config_file)['partitions']
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            self._nodes = PbsnodesParser().parse_file(pbsnodes_file)
+
+    def test_classify(self):
+        classifier = NodeClassifier(self._partitions)
+        for node in self._nodes:
+            partition = compute_partition(node, self._partitions)
+            if partition:
+                rack, iru, _ = hostname2rackinfo(node.hostname)
+                expected = (partition, rack, iru,
+                            tuple(compute_features(node)))
+            else:
+                expected = (None, None, None, ())
+            self.assertEqual(expected, classifier.classify(node))
+        stats = classifier.cache_stats
+        self.assertEqual(len(self._nodes), stats['hits'] + stats['misses'])
+        self.assertTrue(stats['hits'] > stats['misses'])
+        self.assertTrue(stats['hostname_hits'] > stats['hostname_misses'])
+
+    def test_partition_ids(self):
+        partitions = dict((name, partition_id) for partition_id, name in
+                          enumerate(self._partitions, 1))
+        classifier = NodeClassifier(partitions)
+        for node in self._nodes:
+            partition = compute_partition(node, self._partitions)
+            partition_id, _, _, _ = classifier.classify(node)
+            self.assertEqual(partitions.get(partition), partition_id)
+
+    def test_lookup_partition_id(self):
+        partitions = {'thinking': 1, 'gpu': 2}
+        self.assertEqual(1, lookup_partition_id('thinking', partitions))
+        self.assertEqual(2, lookup_partition_id('gpu,thinking', partitions))
+        self.assertEqual(1, lookup_partition_id(['phi', 'thinking'],
+                                                partitions))
+        self.assertIsNone(lookup_partition_id('phi', partitions))
+        self.assertIsNone(lookup_partition_id(None, partitions))
+
+    def test_bounded(self):
+        classifier = NodeClassifier(self._partitions, cache_size=2,
+                                    hostname_cache_size=2)
+        for node in self._nodes:
+            classifier.classify(node)
+        stats = classifier.cache_stats
+        self.assertTrue(stats['size'] <= 2)
+        self.assertTrue(stats['hostname_size'] <= 2)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+'''module to test the query server for a cluster database'''
+
+import json, os, shutil, socket, sqlite3, stat, StringIO, sys, tempfile
+import threading, time, unittest
+import create_node_db
+import load_node_db
+import node_db
+from node_db_client import NodeDBClient, QueryError
+from node_db_server import MAX_REQUEST_SIZE, NodeDBServer
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class NodeDbServerTest(unittest.TestCase):
+    '''Tests the query server for a cluster database'''
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._file_name = os.path.join(self._dir, 'nodes.db')
+        self._socket_path = os.path.join(self._dir, 'nodes.sock')
+        self._create_db(self._file_name)
+        self._server = NodeDBServer(self._socket_path,
+                                    node_db.NodeDB(self._file_name))
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        shutil.rmtree(self._dir)
+
+    def _create_db(self, file_name, nr_nodes=None):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            nodes = pbsnodes_parser.parse_file(pbsnode_file)[:nr_nodes]
+        stderr_tmp = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            with sqlite3.connect(file_name) as conn:
+                create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                       create_jobs_tables=True)
+                partitions = load_node_db.insert_partitions(
+                    conn, config['partitions']
+                )
+                load_node_db.insert_node_info(conn, nodes, partitions,
+                                              do_jobs=True)
+        finally:
+            sys.stderr = stderr_tmp
+
+    def test_queries(self):
+        with NodeDBClient(self._socket_path) as client:
+            self.assertIn('thinking', client.partitions())
+            node = client.node('r1i0n1')
+            self.assertEquals('thinking', node['partition'])
+            self.assertEquals(20, node['np'])
+            self.assertIn('ivybridge', node['properties'])
+            self.assertIsNone(client.node('no_such_node'))
+            self.assertEquals(143, len(client.nodes_by_partition('thinking')))
+            self.assertEquals(32, len(client.nodes_by_feature('mem128')))
+            self.assertTrue(client.is_feasible('nodes=4:ppn=20:mem128',
+                                               'thinking'))
+            self.assertFalse(client.is_feasible('nodes=4:ppn=24:mem128',
+                                                'thinking'))
+            self.assertEquals(
+                len(client.nodes_by_partition('thinking')),
+                len(client.matching_nodes('thinking', 20))
+            )
+
+    def test_jobs(self):
+        with sqlite3.connect(self._file_name) as conn:
+            hostname, job_id, nr_cores = conn.execute(
+                '''SELECT n.hostname, j.job_id, j.nr_cores
+                       FROM nodes AS n, running_jobs AS j
+                       WHERE n.node_id = j.node_id
+                       ORDER BY n.hostname LIMIT 1'''
+            ).fetchone()
+        with NodeDBClient(self._socket_path) as client:
+            jobs = client.jobs_on_node(hostname)
+            self.assertIn(str(job_id), [job[0] for job in jobs])
+            self.assertIn(hostname, client.nodes_of_job(job_id))
+            node = client.node(hostname)
+            nr_used = sum(job[2] for job in jobs)
+            self.assertEquals(max(node['np'] - nr_used, 0),
+                              client.free_cores(hostname))
+            self.assertIsNone(client.free_cores('no_such_node'))
+
+    def test_errors(self):
+        with NodeDBClient(self._socket_path) as client:
+            self.assertRaises(QueryError, client.no_such_query)
+            self.assertRaises(QueryError, client.node)
+            self.assertEquals('thinking', client.node('r1i0n1')['partition'])
+            stats = client.stats()
+        self.assertEquals(2, stats['errors'])
+        self.assertEquals(3, stats['requests'])
+        self.assertEquals(2, stats['queries']['node']['count'])
+        self.assertEquals(1, stats['queries']['invalid']['count'])
+
+    def test_reload(self):
+        with NodeDBClient(self._socket_path) as client:
+            self.assertEquals(143, len(client.nodes_by_partition('thinking')))
+            time.sleep(0.01)
+            new_file_name = os.path.join(self._dir, 'new_nodes.db')
+            self._create_db(new_file_name, 10)
+            os.rename(new_file_name, self._file_name)
+            self.assertEquals(10, len(client.nodes_by_partition('thinking')))
+            stats = client.stats()
+        self.assertEquals(2, stats['nr_loads'])
+
+    def test_socket_in_use(self):
+        self.assertRaises(Exception, NodeDBServer, self._socket_path,
+                          node_db.NodeDB(self._file_name))
+
+    def test_socket_mode(self):
+        self.assertTrue(stat.S_ISSOCK(os.stat(self._socket_path).st_mode))
+        self.assertEquals(0600,
+                          stat.S_IMODE(os.stat(self._socket_path).st_mode))
+
+    def test_not_a_socket(self):
+        file_name = os.path.join(self._dir, 'other.sock')
+        with open(file_name, 'w') as other_file:
+            other_file.write('not a socket\n')
+        self.assertRaises(socket.error, NodeDBServer, file_name,
+                          node_db.NodeDB(self._file_name))
+        self.assertTrue(os.path.isfile(file_name))
+
+    def test_unsafe_dir(self):
+        socket_dir = os.path.join(self._dir, 'run')
+        os.mkdir(socket_dir)
+        os.chmod(socket_dir, 0777)
+        self.assertRaises(socket.error, NodeDBServer,
+                          os.path.join(socket_dir, 'nodes.sock'),
+                          node_db.NodeDB(self._file_name))
+
+    def test_long_request(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(5.0)
+        try:
+            client.connect(self._socket_path)
+            client.sendall('x'*(MAX_REQUEST_SIZE + 1))
+            response = json.loads(client.makefile('rb').readline())
+            self.assertIn('exceeds', response['error'])
+            self.assertEquals('', client.recv(1))
+        finally:
+            client.close()
+        with NodeDBClient(self._socket_path) as client:
+            self.assertIn('thinking', client.partitions())
+
+    def test_max_connections(self):
+        socket_path = os.path.join(self._dir, 'limited.sock')
+        server = NodeDBServer(socket_path, node_db.NodeDB(self._file_name),
+                              max_connections=1)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            with NodeDBClient(socket_path) as first_client:
+                self.assertIn('thinking', first_client.partitions())
+                with NodeDBClient(socket_path) as second_client:
+                    with self.assertRaises((QueryError, socket.error)):
+                        second_client.partitions()
+            for _ in xrange(50):
+                try:
+                    with NodeDBClient(socket_path) as client:
+                        self.assertIn('thinking', client.partitions())
+                    break
+                except (QueryError, socket.error):
+                    time.sleep(0.05)
+            else:
+                self.fail('connection slot was not released')
+        finally:
+            server.shutdown()
+            server.server_close()
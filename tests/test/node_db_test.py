@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+'''module to test the in-memory query API for a cluster database'''
+
+import json, os, sqlite3, StringIO, sys, time, unittest
+import create_node_db
+import load_node_db
+import node_db
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class NodeDbTest(unittest.TestCase):
+    '''Tests the in-memory query API for a cluster database'''
+
+    def setUp(self):
+        self._file_name = 'data/nodes.db'
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        stderr_tmp = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        with sqlite3.connect(self._file_name) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC)
+            partitions = load_node_db.insert_partitions(conn,
+                                                        config['partitions'])
+            load_node_db.insert_node_info(conn, nodes, partitions)
+        sys.stderr = stderr_tmp
+
+    def tearDown(self):
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    def test_lookups(self):
+        nr_ivybridge_nodes = 143
+        nr_128gb_nodes = 32
+        db = node_db.NodeDB(self._file_name)
+        self.assertEquals(nr_ivybridge_nodes,
+                          len(db.nodes_by_property('ivybridge')))
+        self.assertEquals(nr_128gb_nodes, len(db.nodes_by_feature('mem128')))
+        self.assertEquals(nr_ivybridge_nodes,
+                          len(db.nodes_by_partition('thinking')))
+        node = db.node('r1i0n1')
+        self.assertEquals('thinking', node.partition)
+        self.assertEquals(20, node.np)
+        self.assertIn('ivybridge', node.properties)
+        self.assertEquals(len(db.nodes_by_resources(24)),
+                          len(db.matching_nodes(ppn=24)))
+
+    def test_feasible(self):
+        db = node_db.NodeDB(self._file_name)
+        self.assertTrue(db.is_feasible('nodes=4:ppn=20:mem128', 'thinking'))
+        self.assertFalse(db.is_feasible('nodes=4:ppn=24:mem128', 'thinking'))
+        self.assertFalse(db.is_feasible('nodes=33:ppn=20:mem128',
+                                        'thinking'))
+        for _ in xrange(10):
+            self.assertTrue(db.is_feasible('nodes=4:ppn=20:mem128',
+                                           'thinking'))
+        self.assertEquals(3, db.cache_stats['misses'])
+        self.assertEquals(10, db.cache_stats['hits'])
+        self.assertEquals(1, db.nr_loads)
+
+    def test_reload(self):
+        db = node_db.NodeDB(self._file_name)
+        self.assertTrue(db.is_feasible('nodes=1:ppn=20', 'thinking'))
+        time.sleep(0.01)
+        with sqlite3.connect(self._file_name) as conn:
+            conn.execute('''DELETE FROM nodes''')
+        self.assertFalse(db.is_feasible('nodes=1:ppn=20', 'thinking'))
+        self.assertEquals(2, db.nr_loads)
+
+    def test_parse_nodes_spec(self):
+        self.assertEquals((4, 20, ['mem128']),
+                          node_db.parse_nodes_spec('nodes=4:ppn=20:mem128'))
+        self.assertEquals((1, 1, ['ivybridge']),
+                          node_db.parse_nodes_spec('ivybridge'))
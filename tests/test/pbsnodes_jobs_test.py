@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''module to test the parsing of the jobs field of pbsnodes output'''
+
+import json, sqlite3, StringIO, sys, unittest
+import create_node_db
+import load_node_db
+import pbsnodes_jobs
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class PbsnodesJobsTest(unittest.TestCase):
+    '''Tests the parsing of the jobs field of pbsnodes output'''
+
+    def setUp(self):
+        self._jobs_str = None
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            for line in pbsnodes_file:
+                if line.strip().startswith('jobs = '):
+                    self._jobs_str = line.strip()[len('jobs = '):]
+                    break
+
+    def test_split(self):
+        jobs = pbsnodes_jobs.split_jobs(self._jobs_str)
+        self.assertEquals(range(20), sorted(jobs))
+        self.assertEquals(set(['20033686.icts-p-svcs-1']), set(jobs.values()))
+
+    def test_ranges(self):
+        self.assertEquals([('20033686', 0, 20)],
+                          pbsnodes_jobs.core_ranges(self._jobs_str))
+        jobs_str = '0/1.m,1/1.m,2-3/2.m,4/1.m,6/1.m,5/3.m'
+        self.assertEquals([('1', 0, 2), ('2', 2, 2), ('1', 4, 1),
+                           ('3', 5, 1), ('1', 6, 1)],
+                          pbsnodes_jobs.core_ranges(jobs_str))
+        self.assertEquals(pbsnodes_jobs.core_ranges(jobs_str),
+                          pbsnodes_jobs.core_ranges(
+                              pbsnodes_jobs.split_jobs(jobs_str)
+                          ))
+        self.assertEquals([], pbsnodes_jobs.core_ranges(''))
+
+    def test_running_jobs(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            nodes = PbsnodesParser().parse_file(pbsnode_file)
+        stderr_tmp = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(conn, create_node_db.DB_DESC,
+                               create_jobs_tables=True)
+        partitions = load_node_db.insert_partitions(conn,
+                                                    config['partitions'])
+        load_node_db.insert_node_info(conn, nodes, partitions, do_jobs=True)
+        sys.stderr = stderr_tmp
+        hostnames = set(row[0] for row in
+                        conn.execute('''SELECT hostname FROM nodes'''))
+        nr_slots = sum(len(node.jobs) for node in nodes
+                       if node.hostname in hostnames)
+        nr_cores, nr_rows, nr_pairs = conn.execute(
+            '''SELECT SUM(nr_cores), COUNT(*),
+                      COUNT(DISTINCT job_id || '/' || node_id)
+                   FROM running_jobs'''
+        ).fetchone()
+        self.assertEquals(nr_slots, nr_cores)
+        self.assertEquals(nr_pairs, nr_rows)
+        self.assertTrue(10*nr_rows < nr_slots)
+        conn.close()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+'''module to test the native parser for pbsnodes output'''
+
+import unittest
+from pbsnodes_parser import (LOADER_FIELDS, PbsnodesRecordParser,
+                             status_value)
+from pbsnodes_status import parse_status
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class PbsnodesParserTest(unittest.TestCase):
+    '''Tests the native pbsnodes parser against PbsnodesParser'''
+
+    def setUp(self):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            self._output = pbsnodes_file.read()
+        self._expected = PbsnodesParser().parse(self._output)
+
+    def test_equivalence(self):
+        nodes = PbsnodesRecordParser().parse(self._output)
+        self.assertEqual(len(self._expected), len(nodes))
+        for expected, node in zip(self._expected, nodes):
+            self.assertEqual(expected.hostname, node.hostname)
+            self.assertEqual(expected.state, node.state)
+            self.assertEqual(expected.np, node.np)
+            self.assertEqual(expected.properties, node.properties)
+            self.assertEqual(expected.memory, node.memory)
+            self.assertEqual(expected.jobs, node.jobs)
+            self.assertEqual(sorted(expected.job_ids), sorted(node.job_ids))
+            self.assertEqual(parse_status(expected.status),
+                             parse_status(node.status))
+
+    def test_file(self):
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            nodes = PbsnodesRecordParser().parse_file(pbsnodes_file)
+        self.assertEqual([node.hostname for node in self._expected],
+                         [node.hostname for node in nodes])
+
+    def test_loader_fields(self):
+        nodes = PbsnodesRecordParser(LOADER_FIELDS).parse(self._output)
+        self.assertEqual(len(self._expected), len(nodes))
+        for node in nodes:
+            self.assertIsNone(node.note)
+            self.assertIsNone(node.ntype)
+            self.assertIsNotNone(node.state)
+
+    def test_lazy_decoding(self):
+        node = PbsnodesRecordParser().parse(self._output)[0]
+        self.assertIsNone(node._jobs)
+        self.assertIsNone(node._status)
+        self.assertIsNotNone(node.memory)
+        self.assertIsNone(node._status)
+        self.assertIsInstance(node.status, dict)
+        self.assertIsInstance(node.jobs, dict)
+        self.assertIsNotNone(node._status)
+        self.assertIsNotNone(node._jobs)
+
+    def test_status_value(self):
+        status_str = 'rectime=1410207632,physmem=132046160kb,np=20'
+        self.assertEqual('1410207632', status_value(status_str, 'rectime'))
+        self.assertEqual('132046160kb', status_value(status_str, 'physmem'))
+        self.assertEqual('20', status_value(status_str, 'np'))
+        self.assertIsNone(status_value(status_str, 'mem'))
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            PbsnodesRecordParser(['state', 'bogus'])
+
+if __name__ == '__main__':
+    unittest.main()
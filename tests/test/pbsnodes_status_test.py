@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+'''module to test the parsing of the status field of pbsnodes output'''
+
+import unittest
+import pbsnodes_status
+
+class PbsnodesStatusTest(unittest.TestCase):
+    '''Tests the parsing of the status field of pbsnodes output'''
+
+    def setUp(self):
+        self._status_str = None
+        with open('data/pbsnodes.txt', 'r') as pbsnodes_file:
+            for line in pbsnodes_file:
+                if line.strip().startswith('status = '):
+                    self._status_str = line.strip()[len('status = '):]
+                    break
+
+    def test_parse(self):
+        status = pbsnodes_status.parse_status(self._status_str)
+        self.assertEquals(1410207630, status['rectime'])
+        self.assertEquals('free', status['state'])
+        self.assertAlmostEquals(20.13, status['loadave'])
+        self.assertEquals(65932076, status['physmem'])
+        self.assertEquals(24891628, status['availmem'])
+        self.assertEquals(68028708, status['totmem'])
+        self.assertEquals(20, status['ncpus'])
+        self.assertEquals(1, status['nusers'])
+        self.assertEquals(2, status['nsessions'])
+        self.assertEquals(1498610, status['idletime'])
+        self.assertEquals(8717948167785, status['netload'])
+
+    def test_dict(self):
+        status_dict = pbsnodes_status.split_status(self._status_str)
+        self.assertEquals(pbsnodes_status.parse_status(self._status_str),
+                          pbsnodes_status.parse_status(status_dict))
+
+    def test_row(self):
+        row = pbsnodes_status.status_row('rectime=1410207630,loadave=,'
+                                         'physmem=bogus,ncpus=20')
+        self.assertEquals(len(pbsnodes_status.STATUS_COLUMNS), len(row))
+        self.assertEquals(set([1410207630, 20, None]), set(row))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+'''module to test the atomic publication of a cluster database'''
+
+import glob, os, sqlite3, unittest
+import create_node_db
+import publish_node_db
+
+class PublishNodeDbTest(unittest.TestCase):
+    '''Tests the atomic publication of a cluster database'''
+
+    def setUp(self):
+        self._file_name = 'data/nodes.db'
+        self.tearDown()
+
+    def tearDown(self):
+        for file_name in glob.glob(self._file_name + '*'):
+            os.remove(file_name)
+        for file_name in glob.glob('data/.nodes.db.*'):
+            os.remove(file_name)
+
+    def _publish(self, partition_name, nr_generations):
+        snapshot_name = publish_node_db.create_snapshot_file(self._file_name)
+        self.assertEquals(os.path.dirname(os.path.abspath(self._file_name)),
+                          os.path.dirname(snapshot_name))
+        with sqlite3.connect(snapshot_name) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC)
+            conn.execute('''INSERT INTO partitions (partition_name)
+                                VALUES (?)''', (partition_name, ))
+        self.assertEquals([], publish_node_db.check_integrity(snapshot_name))
+        publish_node_db.publish_snapshot(snapshot_name, self._file_name,
+                                         nr_generations)
+        self.assertFalse(os.path.exists(snapshot_name))
+
+    def _partition_name(self, file_name):
+        with sqlite3.connect(file_name) as conn:
+            result = conn.execute('''SELECT partition_name FROM partitions''')
+            return result.fetchone()[0]
+
+    def test_publish(self):
+        for partition_name in ['first', 'second', 'third', 'fourth']:
+            self._publish(partition_name, 2)
+        self.assertEquals('fourth', self._partition_name(self._file_name))
+        self.assertEquals('third', self._partition_name(
+            publish_node_db.generation_name(self._file_name, 1)
+        ))
+        self.assertEquals('second', self._partition_name(
+            publish_node_db.generation_name(self._file_name, 2)
+        ))
+        self.assertFalse(os.path.exists(
+            publish_node_db.generation_name(self._file_name, 3)
+        ))
+
+    def test_reader_snapshot(self):
+        self._publish('first', 0)
+        with sqlite3.connect(self._file_name) as conn:
+            self._publish('second', 0)
+            result = conn.execute('''SELECT partition_name FROM partitions''')
+            self.assertEquals('first', result.fetchone()[0])
+        self.assertEquals('second', self._partition_name(self._file_name))
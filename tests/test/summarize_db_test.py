@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+'''module to test the summary tables of a cluster database'''
+
+import json, sqlite3, StringIO, sys, unittest
+import create_node_db
+import load_node_db
+import update_node_db
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class SummarizeNodeDbTest(unittest.TestCase):
+    '''Tests the summary tables of a cluster database'''
+
+    def setUp(self):
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            self._partition_list = json.load(config_file)['partitions']
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            self._nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        self._stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        self._conn = sqlite3.connect(':memory:')
+        create_node_db.init_db(self._conn, create_node_db.DB_DESC)
+
+    def tearDown(self):
+        sys.stderr = self._stderr
+        self._conn.close()
+
+    def _partition_summary(self):
+        cursor = self._conn.execute(
+            '''SELECT partition_name, nr_nodes, nr_cores, mem,
+                      nr_free_cores, nr_free_nodes, nr_busy_nodes,
+                      nr_down_nodes
+                   FROM partition_summary
+                        JOIN partitions USING (partition_id)'''
+        )
+        return dict((row[0], row[1:]) for row in cursor)
+
+    def _expected_partition_summary(self):
+        summary = {}
+        cursor = self._conn.execute(
+            '''SELECT partition_name, np, mem, state, nr_used_cores
+                   FROM nodes JOIN partitions USING (partition_id)'''
+        )
+        for partition, cores, mem, state, used_cores in cursor:
+            is_down = 'down' in state or 'offline' in state
+            counts = summary.setdefault(partition, [0]*7)
+            counts[0] += 1
+            counts[1] += cores
+            counts[2] += mem
+            if is_down:
+                counts[6] += 1
+            else:
+                counts[3] += cores - used_cores
+                if used_cores:
+                    counts[5] += 1
+                else:
+                    counts[4] += 1
+        return dict((partition, tuple(counts))
+                    for partition, counts in summary.items())
+
+    def test_load(self):
+        partitions = load_node_db.insert_partitions(self._conn,
+                                                    self._partition_list)
+        load_node_db.insert_node_info_bulk(self._conn, self._nodes,
+                                           partitions)
+        summary = self._partition_summary()
+        self.assertEquals(self._expected_partition_summary(), summary)
+        self.assertEquals(143, summary['thinking'][0])
+        self.assertTrue(summary['thinking'][4] > 0)
+        self.assertTrue(summary['thinking'][5] > 0)
+        nr_nodes, = self._conn.execute(
+            '''SELECT SUM(nr_nodes) FROM rack_summary'''
+        ).fetchone()
+        self.assertEquals(163, nr_nodes)
+        nr_nodes, = self._conn.execute(
+            '''SELECT SUM(nr_nodes) FROM iru_summary'''
+        ).fetchone()
+        self.assertEquals(163, nr_nodes)
+        nr_nodes, = self._conn.execute(
+            '''SELECT nr_nodes FROM feature_summary
+                   JOIN feature_names USING (feature_id)
+                   WHERE feature = 'mem128' '''
+        ).fetchone()
+        self.assertEquals(32, nr_nodes)
+
+    def test_update(self):
+        partitions = load_node_db.insert_partitions(self._conn,
+                                                    self._partition_list)
+        load_node_db.insert_node_info(self._conn, self._nodes, partitions)
+        removed_node = self._nodes.pop(2)
+        busy_node = [node for node in self._nodes
+                     if node.jobs and node.state == 'job-exclusive'][0]
+        busy_node.jobs = {}
+        busy_node.state = 'free'
+        update_node_db.update_node_info(self._conn, self._nodes, partitions)
+        summary = self._partition_summary()
+        self.assertEquals(self._expected_partition_summary(), summary)
+        self.assertEquals(142, summary['thinking'][0])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+'''module to test the differential update of a cluster database'''
+
+import json, os, sqlite3, StringIO, sys, unittest
+import create_node_db
+import load_node_db
+import update_node_db
+from vsc.pbs.pbsnodes import PbsnodesParser
+
+class UpdateNodeDbTest(unittest.TestCase):
+    '''Tests the differential update of a cluster database'''
+
+    def setUp(self):
+        self._file_name = 'data/nodes.db'
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+        with sqlite3.connect(self._file_name) as conn:
+            create_node_db.init_db(conn, create_node_db.DB_DESC,
+                                   create_jobs_tables=True)
+        config_file_name = '../../../vsc-tools-lib/conf/config.json'
+        with open(config_file_name, 'r') as config_file:
+            self._config = json.load(config_file)
+        with open('data/pbsnodes.txt', 'r') as pbsnode_file:
+            pbsnodes_parser = PbsnodesParser()
+            self._nodes = pbsnodes_parser.parse_file(pbsnode_file)
+        self._stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self._stderr
+        try:
+            os.remove(self._file_name)
+        except OSError:
+            pass
+
+    def _node_ids(self, conn):
+        cursor = conn.cursor()
+        node_ids = {}
+        for node_id, hostname in cursor.execute('''SELECT node_id, hostname
+                                                       FROM nodes'''):
+            node_ids[hostname] = node_id
+        return node_ids
+
+    def test_update_unchanged(self):
+        partition_list = self._config['partitions']
+        with sqlite3.connect(self._file_name) as conn:
+            partitions = load_node_db.insert_partitions(conn, partition_list)
+            load_node_db.insert_node_info(conn, self._nodes, partitions,
+                                          do_jobs=True)
+            node_ids = self._node_ids(conn)
+            partitions = update_node_db.update_partitions(conn,
+                                                          partition_list)
+            stats = update_node_db.update_node_info(conn, self._nodes,
+                                                    partitions, do_jobs=True)
+            self.assertEquals(0, stats['inserted'])
+            self.assertEquals(0, stats['updated'])
+            self.assertEquals(0, stats['deleted'])
+            self.assertEquals(len(node_ids), stats['unchanged'])
+            self.assertEquals(node_ids, self._node_ids(conn))
+
+    def test_update_without_node_checks(self):
+        partition_list = self._config['partitions']
+        with sqlite3.connect(self._file_name) as conn:
+            partitions = load_node_db.insert_partitions(conn, partition_list)
+            load_node_db.insert_node_info(conn, self._nodes, partitions)
+            conn.execute('''DROP TABLE node_checks''')
+            stats = update_node_db.update_node_info(conn, self._nodes[1:],
+                                                    partitions)
+            self.assertEquals(1, stats['deleted'])
+
+    def test_update_changed(self):
+        partition_list = self._config['partitions']
+        with sqlite3.connect(self._file_name) as conn:
+            partitions = load_node_db.insert_partitions(conn, partition_list)
+            load_node_db.insert_node_info(conn, self._nodes[1:], partitions,
+                                          do_jobs=True)
+            node_ids = self._node_ids(conn)
+            removed_node = self._nodes.pop(2)
+            changed_node = self._nodes[1]
+            changed_node.properties = changed_node.properties[:-1]
+            stats = update_node_db.update_node_info(conn, self._nodes,
+                                                    partitions, do_jobs=True)
+            self.assertEquals(1, stats['inserted'])
+            self.assertEquals(1, stats['updated'])
+            self.assertEquals(1, stats['deleted'])
+            new_node_ids = self._node_ids(conn)
+            self.assertNotIn(removed_node.hostname, new_node_ids)
+            self.assertIn(self._nodes[0].hostname, new_node_ids)
+            for hostname, node_id in new_node_ids.items():
+                if hostname in node_ids:
+                    self.assertEquals(node_ids[hostname], node_id)
+            cursor = conn.cursor()
+            result = cursor.execute('''SELECT count(*) FROM properties
+                                           WHERE node_id = ?''',
+                                    (node_ids[changed_node.hostname], ))
+            self.assertEquals(len(changed_node.properties),
+                              result.fetchone()[0])
+            result = cursor.execute('''SELECT count(*) FROM properties
+                                           WHERE node_id NOT IN
+                                               (SELECT node_id FROM nodes)''')
+            self.assertEquals(0, result.fetchone()[0])
+
+    def test_update_skip(self):
+        partition_list = self._config['partitions']
+        pbsnodes_file_name = 'data/pbsnodes.txt'
+        with sqlite3.connect(self._file_name) as conn:
+            partitions = load_node_db.insert_partitions(conn, partition_list)
+            stats_list = []
+            for _ in xrange(2):
+                node_hashes = update_node_db.read_node_hashes(conn)
+                record_hashes = {}
+                records = load_node_db.stream_records(None,
+                                                      pbsnodes_file_name)
+                nodes = update_node_db.iter_refreshed_nodes(records,
+                                                            node_hashes,
+                                                            record_hashes)
+                stats_list.append(update_node_db.update_node_info(
+                    conn, nodes, partitions, record_hashes=record_hashes
+                ))
+            nr_nodes = stats_list[0]['inserted']
+            self.assertEquals(len(self._nodes), stats_list[0]['parsed'])
+            self.assertEquals(0, stats_list[0]['skipped'])
+            self.assertEquals(nr_nodes, stats_list[1]['skipped'])
+            self.assertEquals(len(self._nodes) - nr_nodes,
+                              stats_list[1]['parsed'])
+            self.assertEquals(0, stats_list[1]['deleted'])
+            self.assertEquals(0, stats_list[1]['updated'])